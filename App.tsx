@@ -15,10 +15,13 @@ const SimpleHeader = () => (
 )
 
 // History View
-const SimpleHistoryView = ({ sessions, onNew, onSelectSession }: { 
+const SimpleHistoryView = ({ sessions, onNew, onSelectSession, hasMore, loadingMore, onLoadMore }: { 
   sessions: NoteSession[], 
   onNew: () => void,
-  onSelectSession: (session: NoteSession) => void 
+  onSelectSession: (session: NoteSession) => void,
+  hasMore: boolean,
+  loadingMore: boolean,
+  onLoadMore: () => void
 }) => (
   React.createElement('div', { className: "flex items-center justify-center h-full w-full" },
     React.createElement('div', { className: "w-full max-w-2xl p-8 space-y-6 bg-white border-2 border-black" },
@@ -53,6 +56,13 @@ const SimpleHistoryView = ({ sessions, onNew, onSelectSession }: {
         React.createElement('p', { className: "text-center text-gray-500 py-8" }, "No previous sessions found.")
       ),
       
+      // Older sessions are fetched a page at a time
+      hasMore && React.createElement('button', {
+        onClick: onLoadMore,
+        disabled: loadingMore,
+        className: "w-full py-2 px-4 border-2 border-dashed border-black text-xs font-bold hover:bg-gray-50 disabled:opacity-50"
+      }, loadingMore ? "LOADING..." : "LOAD OLDER SESSIONS"),
+      
       // Separator
       React.createElement('div', { className: "border-b border-dashed border-black" }),
       
@@ -68,15 +78,32 @@ const SimpleHistoryView = ({ sessions, onNew, onSelectSession }: {
 // Main App Component
 export const App: React.FC = () => {
   const [sessions, setSessions] = useState<NoteSession[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [view, setView] = useState<string>("history")
   const [currentSession, setCurrentSession] = useState<NoteSession | null>(null)
 
-  useEffect(() => {
-    const loadSessions = async () => {
-      const loadedSessions = await storageService.getSessions()
-      setSessions(loadedSessions)
+  // Only the newest page is loaded up front; older ones on request
+  const loadFirstPage = async () => {
+    const page = await storageService.getSessionsPage()
+    setSessions(page.sessions)
+    setNextCursor(page.nextCursor)
+  }
+
+  const handleLoadMore = async () => {
+    if (!nextCursor || loadingMore) return
+    setLoadingMore(true)
+    try {
+      const page = await storageService.getSessionsPage(nextCursor)
+      setSessions(previous => [...previous, ...page.sessions])
+      setNextCursor(page.nextCursor)
+    } finally {
+      setLoadingMore(false)
     }
-    loadSessions()
+  }
+
+  useEffect(() => {
+    loadFirstPage()
   }, [])
 
   const handleStartNew = () => {
@@ -87,8 +114,7 @@ export const App: React.FC = () => {
     setView("history")
     setCurrentSession(null)
     // Refresh sessions list
-    const refreshedSessions = await storageService.getSessions()
-    setSessions(refreshedSessions)
+    await loadFirstPage()
   }
 
   const handleContextComplete = async (context: NoteContext) => {
@@ -138,8 +164,7 @@ export const App: React.FC = () => {
   const handleSaveSession = async (session: NoteSession) => {
     await storageService.saveSession(session)
     // Refresh sessions list
-    const refreshedSessions = await storageService.getSessions()
-    setSessions(refreshedSessions)
+    await loadFirstPage()
   }
 
   return React.createElement('div', { className: "h-screen flex flex-col bg-white text-black" },
@@ -147,7 +172,10 @@ export const App: React.FC = () => {
       React.createElement(SimpleHistoryView, { 
         sessions, 
         onNew: handleStartNew,
-        onSelectSession: handleSelectSession
+        onSelectSession: handleSelectSession,
+        hasMore: nextCursor !== null,
+        loadingMore,
+        onLoadMore: handleLoadMore
       })
     ),
     view === "context" && React.createElement(ContextSetup, {
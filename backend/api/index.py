@@ -4,6 +4,11 @@ import os
 # Add the parent directory to the path to import from server.py
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Serverless functions freeze between invocations, so pooled connections go
+# stale; open one per request unless configured otherwise (see db_pool.py).
+# The schema is migrated at deploy time (alembic upgrade head), not on import.
+os.environ.setdefault("DB_POOL_MODE", "null")
+
 # Import the FastAPI app from server.py
 try:
     from server import app
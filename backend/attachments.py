@@ -0,0 +1,108 @@
+"""
+Content-addressed storage helpers for chat image attachments.
+
+Images arrive inline as ``ImageFile.base64``. Before a chat entry is stored the
+bytes are decoded, hashed with SHA-256 and written once to the ``attachments``
+table; the entry keeps only ``{name, type, size, hash}``. The bytes are then
+served from ``GET /api/attachments/{hash}``, from the API's own origin, so only
+raster image types are accepted and responses carry headers that stop a
+browser from treating them as anything else.
+"""
+
+import base64
+import binascii
+import hashlib
+from typing import Iterable, Iterator, Optional, Tuple
+
+import version_store
+
+# Attachments never change for a given hash, so clients may cache them forever
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Types a browser renders as an image and never as a document (SVG can carry scripts)
+IMAGE_TYPES = frozenset({"image/png", "image/jpeg", "image/gif", "image/webp", "image/avif"})
+# Served with every attachment, in case a stored type or the bytes claim otherwise
+SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "Content-Security-Policy": "default-src 'none'; style-src 'unsafe-inline'; sandbox",
+}
+
+
+def decode_image(image: dict) -> bytes:
+    """Decode an inline ``ImageFile`` payload, raising ValueError on bad base64."""
+    payload = image.get("base64") or ""
+    if payload.startswith("data:") and "," in payload:
+        payload = payload.split(",", 1)[1]
+    try:
+        return base64.b64decode(payload, validate=True)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 image data: {e}")
+
+
+def content_type(image: dict) -> str:
+    """The image's MIME type, raising ValueError unless it is one of ``IMAGE_TYPES``."""
+    declared = (image.get("type") or "").split(";")[0].strip().lower()
+    if declared not in IMAGE_TYPES:
+        raise ValueError(f"Unsupported image type: {image.get('type')!r}")
+    return declared
+
+
+def response_headers(stored_type: str) -> dict:
+    """``Content-Type`` and ``Content-Disposition`` for serving bytes stored as ``stored_type``."""
+    if stored_type in IMAGE_TYPES:
+        return {"Content-Type": stored_type, "Content-Disposition": "inline", **SECURITY_HEADERS}
+    # Stored before types were checked: never let the browser render it
+    return {"Content-Type": "application/octet-stream", "Content-Disposition": "attachment", **SECURITY_HEADERS}
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_reference(image: dict, digest: str, size: int) -> dict:
+    return {"name": image.get("name"), "type": image.get("type"), "size": size, "hash": digest}
+
+
+def iter_hashes(entries: Iterable[dict]) -> Iterator[str]:
+    for entry in entries:
+        image = entry.get("image")
+        if image and image.get("hash"):
+            yield image["hash"]
+
+
+def version_hashes(records: list) -> Iterator[str]:
+    """Hashes referenced by every chat entry stored in a version chain."""
+    return iter_hashes(version_store.iter_stored_entries(records))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into an inclusive ``(start, end)`` pair.
+
+    Returns None when the header is absent, malformed or not a single byte
+    range (serve the whole body, as RFC 9110 asks) and raises ValueError when
+    the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+            if start < 0 or (end_text and end < start):
+                return None
+        else:
+            # Suffix range: the last N bytes
+            suffix = int(end_text)
+            if suffix < 0:
+                return None
+            start = max(0, size - suffix)
+            end = size - 1
+    except ValueError:
+        return None
+
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
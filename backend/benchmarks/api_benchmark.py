@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latency, throughput and memory of the API endpoints, in process.
+
+Drives ``server.app`` through httpx's ASGI transport, so the full middleware
+stack runs (compression, timing, metrics) but no network or remote database
+is involved. By default the database is a fresh SQLite file in a temporary
+directory; pass ``--database-url`` for anything else (use a scratch database,
+the benchmark writes to it).
+
+Each profile is one combination of ``--messages``, ``--document-kb``,
+``--versions`` and ``--images``; ``--sessions`` synthetic sessions of that
+shape are created through the API, then every session, version and
+attachment endpoint is called ``--requests`` times with up to
+``--concurrency`` requests in flight, round-robin over the sessions. The
+streaming chat endpoint is left out: it would time the upstream model.
+Endpoints that consume what they act on prepare it in an untimed setup step
+before each pass (fresh sessions to delete, versions to delete, orphaned
+attachments to collect), and session creation deletes what it made
+afterwards. Writes that reshape sessions (switch-model, restore) run after
+the other endpoints. Reported per endpoint and profile:
+
+- p50/p95/p99 and mean latency, from sending the request to the end of the
+  response body;
+- throughput, requests per second of wall time;
+- peak memory, the most Python memory allocated while serving ``--memory-requests``
+  of the same requests under tracemalloc (a separate pass, tracing is slow);
+- status codes, so errors do not pass for fast responses. Concurrent writes
+  to one session can be refused with 409, as they would be in production.
+
+Repeat reads of a session are served from the read cache (session_cache.py)
+as in production; ``--no-read-cache`` measures the uncached path.
+
+Results are written as JSON (``--output``); ``--baseline`` compares the run
+with an earlier file and prints the p95 change per endpoint.
+
+Usage:
+    python benchmarks/api_benchmark.py [--messages 10 200] [--document-kb 8] [--versions 10]
+        [--images 0 4] [--sessions 10] [--requests 200] [--concurrency 8]
+        [--output results.json] [--baseline previous.json]
+"""
+
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROFILE_FIELDS = ("messages", "document_kb", "versions", "images")
+
+
+class Endpoint(NamedTuple):
+    name: str
+    # (client, target, i) -> awaitable response; a target is one of the profile's sessions
+    # unless ``setup`` prepares them
+    call: Callable
+    # (client, sessions, count) -> awaitable list of targets, built before each pass and not timed
+    setup: Optional[Callable] = None
+    # (client, sessions) -> awaitable, run after each pass to undo what it left behind
+    teardown: Optional[Callable] = None
+
+
+def make_document(kb: int, revision: int = 0) -> str:
+    lines = []
+    line = 0
+    while sum(len(text) + 1 for text in lines) < kb * 1024:
+        changed = revision if line % 16 == revision % 16 else 0
+        lines.append(f"- Point {line}, revision {changed}: " + "lorem ipsum " * 5)
+        line += 1
+    return "# Notes\n" + "\n".join(lines) + "\n"
+
+
+def make_entry(turn: int, image_kb: int = 0) -> dict:
+    role = "user" if turn % 2 == 0 else "model"
+    words = "context " * 20 if role == "user" else "detail " * 40
+    entry = {"id": str(uuid.uuid4()), "role": role, "text": f"{role} {turn}: {words}"}
+    if image_kb:
+        # Random bytes, so attachments are not deduplicated across sessions
+        data = os.urandom(image_kb * 1024)
+        entry["image"] = {"name": f"{turn}.png", "type": "image/png", "size": len(data), "base64": base64.b64encode(data).decode()}
+    return entry
+
+
+def session_body(profile: Dict[str, int], image_kb: int) -> dict:
+    messages, images = profile["messages"], min(profile["images"], profile["messages"])
+    # Spread the images evenly over the conversation
+    with_image = {round(i * messages / images) for i in range(images)} if images else set()
+    return {
+        "context": {"title": "Benchmark", "goal": "Measure", "keywords": "bench", "selectedModel": "model-a"},
+        "chatHistory": [make_entry(turn, image_kb if turn in with_image else 0) for turn in range(messages)],
+        "livingDocument": make_document(profile["document_kb"]),
+    }
+
+
+async def create_session(client, profile: Dict[str, int], image_kb: int) -> dict:
+    response = await client.post("/api/sessions", json=session_body(profile, image_kb))
+    response.raise_for_status()
+    session = response.json()
+    url = f"/api/sessions/{session['id']}"
+    for revision in range(1, profile["versions"]):
+        (await client.put(url, json={"living_document": make_document(profile["document_kb"], revision)})).raise_for_status()
+        (await client.post(f"{url}/versions", json={"session_id": session["id"]})).raise_for_status()
+    response = await client.get(url)
+    versions = (await client.get(f"{url}/versions")).json()
+    return {
+        "id": session["id"],
+        "etag": response.headers["ETag"],
+        "attachments": [e["image"]["hash"] for e in response.json()["chatHistory"] if e.get("image")],
+        "versions": [version["id"] for version in versions],
+    }
+
+
+async def delete_other_sessions(client, sessions: List[dict]):
+    """Delete every session but the profile's own, e.g. the ones a create pass made"""
+    keep = {session["id"] for session in sessions}
+    extra, cursor = [], None
+    while True:
+        page = (await client.get("/api/sessions", params={"limit": 200, **({"cursor": cursor} if cursor else {})})).json()
+        extra += [listed["id"] for listed in page["sessions"] if listed["id"] not in keep]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    for session_id in extra:
+        (await client.delete(f"/api/sessions/{session_id}")).raise_for_status()
+
+
+def endpoints(profile: Dict[str, int], image_kb: int) -> List[Endpoint]:
+    def document(i):
+        return make_document(profile["document_kb"], profile["versions"] + i)
+
+    def url(session):
+        return f"/api/sessions/{session['id']}"
+
+    async def new_bodies(client, sessions, count):
+        # As many distinct bodies as there are sessions, so images are not all deduplicated
+        return [{"body": session_body(profile, image_kb)} for _ in range(min(count, len(sessions)))]
+
+    async def new_versions(client, sessions, count):
+        targets = []
+        for i in range(count):
+            session = sessions[i % len(sessions)]
+            response = await client.post(f"{url(session)}/versions", json={"session_id": session["id"]})
+            response.raise_for_status()
+            targets.append({"id": session["id"], "version": response.json()["id"]})
+        return targets
+
+    async def new_sessions(client, sessions, count):
+        return [await create_session(client, profile, image_kb) for _ in range(count)]
+
+    async def orphan_attachments(client, sessions, count):
+        # Sessions whose images nothing references once they are deleted
+        for _ in range(min(count, len(sessions))):
+            body = session_body({**profile, "messages": 1, "images": 1}, image_kb or 1)
+            created = (await client.post("/api/sessions", json=body)).json()
+            (await client.delete(f"/api/sessions/{created['id']}")).raise_for_status()
+        return sessions
+
+    listed = [
+        Endpoint("GET /api/sessions", lambda c, s, i: c.get("/api/sessions")),
+        Endpoint("GET /api/sessions/{id}", lambda c, s, i: c.get(url(s))),
+        Endpoint(
+            "GET /api/sessions/{id} (If-None-Match)",
+            lambda c, s, i: c.get(url(s), headers={"If-None-Match": s["etag"]}),
+        ),
+        Endpoint("GET /api/sessions/{id}/versions", lambda c, s, i: c.get(f"{url(s)}/versions")),
+        Endpoint("GET /api/sessions/{id}/document/revisions", lambda c, s, i: c.get(f"{url(s)}/document/revisions")),
+        Endpoint("GET /api/sessions/export", lambda c, s, i: c.get("/api/sessions/export")),
+        Endpoint(
+            "POST /api/sessions/{id}/messages",
+            lambda c, s, i: c.post(f"{url(s)}/messages", json=make_entry(i)),
+        ),
+        Endpoint(
+            "PATCH /api/sessions/{id}",
+            lambda c, s, i: c.patch(url(s), json=[
+                {"op": "add", "path": "/chatHistory/-", "value": make_entry(i)},
+                {"op": "replace", "path": "/livingDocument", "value": document(i)},
+            ]),
+        ),
+        Endpoint("PUT /api/sessions/{id}", lambda c, s, i: c.put(url(s), json={"living_document": document(i)})),
+        Endpoint(
+            "POST /api/sessions/{id}/versions",
+            lambda c, s, i: c.post(f"{url(s)}/versions", json={"session_id": s["id"]}),
+        ),
+    ]
+    if profile["images"]:
+        listed.append(Endpoint(
+            "GET /api/attachments/{hash}",
+            lambda c, s, i: c.get(f"/api/attachments/{s['attachments'][i % len(s['attachments'])]}"),
+        ))
+    # Writes that reshape sessions run last, so the endpoints above see the profile as created
+    listed += [
+        Endpoint(
+            "POST /api/sessions",
+            lambda c, s, i: c.post("/api/sessions", json=s["body"]),
+            setup=new_bodies,
+            teardown=delete_other_sessions,
+        ),
+        Endpoint(
+            "POST /api/sessions/{id}/switch-model",
+            lambda c, s, i: c.post(f"{url(s)}/switch-model", json={"session_id": s["id"], "new_model": f"model-{i % 2}"}),
+        ),
+        Endpoint(
+            "POST /api/sessions/{id}/restore",
+            lambda c, s, i: c.post(f"{url(s)}/restore", json={
+                "session_id": s["id"], "version_id": s["versions"][i % len(s["versions"])],
+            }),
+        ),
+        Endpoint(
+            "DELETE /api/sessions/{id}/versions/{version_id}",
+            lambda c, s, i: c.delete(f"{url(s)}/versions/{s['version']}"),
+            setup=new_versions,
+        ),
+        Endpoint(
+            "DELETE /api/sessions/{id}",
+            lambda c, s, i: c.delete(url(s)),
+            setup=new_sessions,
+        ),
+        Endpoint(
+            "POST /api/attachments/gc",
+            lambda c, s, i: c.post("/api/attachments/gc", params={"min_age_seconds": 0}),
+            setup=orphan_attachments,
+        ),
+    ]
+    return listed
+
+
+async def drive(client, endpoint: Endpoint, sessions: List[dict], requests: int, concurrency: int, trace: bool = False):
+    """Latencies in ms, status counts, wall time and peak traced memory of ``requests`` calls.
+
+    The endpoint's setup and teardown run around the calls, outside the
+    timings and the memory trace.
+    """
+    targets = sessions if endpoint.setup is None else await endpoint.setup(client, sessions, requests)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await endpoint.call(client, targets[i % len(targets)], i)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] += 1
+
+    peak = 0
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - started
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    if endpoint.teardown is not None:
+        await endpoint.teardown(client, sessions)
+    return latencies, statuses, wall, peak
+
+
+def percentile(samples: List[float], p: int) -> float:
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[p - 1]
+
+
+async def run_profile(client, profile: Dict[str, int], args) -> List[dict]:
+    sessions = [await create_session(client, profile, args.image_kb) for _ in range(args.sessions)]
+    results = []
+    for endpoint in endpoints(profile, args.image_kb):
+        if args.warmup:
+            await drive(client, endpoint, sessions, min(args.warmup, args.requests), 1)
+        latencies, statuses, wall, _ = await drive(client, endpoint, sessions, args.requests, args.concurrency)
+        *_, peak = await drive(client, endpoint, sessions, args.memory_requests, args.concurrency, trace=True)
+
+        results.append({
+            "endpoint": endpoint.name,
+            "profile": profile,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(statistics.fmean(latencies), 3),
+            "throughput_rps": round(args.requests / wall, 1),
+            "peak_memory_kb": round(peak / 1024, 1),
+            "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        })
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def profile_key(result: dict) -> tuple:
+    return (result["endpoint"],) + tuple(result["profile"][field] for field in PROFILE_FIELDS)
+
+
+def print_results(results: List[dict], baseline: Optional[Dict[tuple, dict]]):
+    header = f"{'endpoint':<48} {'msgs':>5} {'doc KB':>6} {'vers':>5} {'imgs':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'peak KB':>9}  status"
+    if baseline is not None:
+        header += "  p95 vs baseline"
+    print(header)
+    for result in results:
+        profile = result["profile"]
+        line = (
+            f"{result['endpoint']:<48} {profile['messages']:>5} {profile['document_kb']:>6} {profile['versions']:>5} "
+            f"{profile['images']:>5} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+            f"{result['throughput_rps']:>8.1f} {result['peak_memory_kb']:>9.1f}  "
+            + ",".join(f"{code}x{count}" for code, count in result["status_codes"].items())
+        )
+        if baseline is not None:
+            previous = baseline.get(profile_key(result))
+            if previous is not None and previous["p95_ms"]:
+                line += f"  {(result['p95_ms'] / previous['p95_ms'] - 1) * 100:+.1f}%"
+            else:
+                line += "  n/a"
+        print(line)
+
+
+async def benchmark(args) -> List[dict]:
+    import httpx
+
+    import server
+    import session_cache
+
+    if args.no_read_cache:
+        server.read_cache = session_cache.SessionCache(max_bytes=0)
+    await server.init_db()
+    results = []
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        for values in itertools.product(args.messages, args.document_kb, args.versions, args.images):
+            profile = dict(zip(PROFILE_FIELDS, values))
+            print(f"Profile {profile} ...", file=sys.stderr)
+            results.extend(await run_profile(client, profile, args))
+    await server.engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 200])
+    parser.add_argument("--document-kb", type=int, nargs="+", default=[8])
+    parser.add_argument("--versions", type=int, nargs="+", default=[10])
+    parser.add_argument("--images", type=int, nargs="+", default=[0, 4])
+    parser.add_argument("--image-kb", type=int, default=64)
+    parser.add_argument("--sessions", type=int, default=10, help="synthetic sessions per profile")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per endpoint and profile")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--memory-requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--database-url", help="default: a new SQLite file in a temporary directory")
+    parser.add_argument("--no-read-cache", action="store_true")
+    parser.add_argument("--output", default="api_benchmark.json")
+    parser.add_argument("--baseline", help="an earlier --output file to compare with")
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    # Read by server at import; benchmark runs must not pick up .env
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("SLOW_QUERY_MS", "1000")
+
+    results = asyncio.run(benchmark(args))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {profile_key(result): result for result in json.load(f)["results"]}
+    print_results(results, baseline)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": database_url.split("://", 1)[0],
+            "read_cache": not args.no_read_cache,
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "arguments": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "database_url")},
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
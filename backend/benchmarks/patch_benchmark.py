@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark: request bytes per chat turn, full-session PUT vs. JSON Patch.
+
+Before: after every turn the frontend PUTs the whole ``NoteSession`` (chat
+history, living document and every version, one auto-checkpoint per turn).
+After: it PATCHes the two new chat entries and the rewritten document.
+
+Usage:
+    python benchmarks/patch_benchmark.py [--turns 200] [--report-every 25]
+"""
+
+import argparse
+import json
+import uuid
+from datetime import datetime
+
+SECTIONS = 12
+LINES_PER_SECTION = 8
+
+
+def make_document(turn: int) -> str:
+    lines = []
+    for section in range(SECTIONS):
+        revision = turn if section in (turn % SECTIONS, (turn * 7) % SECTIONS) else section
+        lines.append(f"## Section {section}")
+        for line in range(LINES_PER_SECTION):
+            lines.append(f"- Point {line} of section {section}, revision {revision}: " + "lorem ipsum " * 6)
+    return "\n".join(lines)
+
+
+def make_entry(role: str, turn: int) -> dict:
+    words = "context " * 20 if role == "user" else "detail " * 40
+    return {"id": str(uuid.uuid4()), "role": role, "text": f"{role} turn {turn}: {words}", "image": None}
+
+
+def body_size(payload) -> int:
+    return len(json.dumps(payload, separators=(",", ":")).encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--report-every", type=int, default=25)
+    args = parser.parse_args()
+
+    session = {
+        "id": str(uuid.uuid4()),
+        "lastModified": 0,
+        "context": {"title": "Interview", "goal": "Notes", "keywords": "benchmark", "selectedModel": "anthropic/claude-3.5-sonnet"},
+        "chatHistory": [],
+        "livingDocument": "",
+        "current_version": 1,
+        "versions": [],
+    }
+
+    put_total = patch_total = 0
+    print(f"{'turn':>6} {'PUT bytes':>12} {'PATCH bytes':>12} {'ratio':>8}")
+    for turn in range(1, args.turns + 1):
+        # Auto-checkpoint before the model reply, as NoteTaking does
+        session["versions"].append({
+            "id": str(uuid.uuid4()),
+            "version_number": len(session["versions"]) + 1,
+            "timestamp": datetime.utcnow().isoformat(),
+            "chatHistory": list(session["chatHistory"]),
+            "livingDocument": session["livingDocument"],
+            "modelUsed": session["context"]["selectedModel"],
+            "checkpoint_name": "Auto-checkpoint before AI response",
+            "auto_checkpoint": True,
+        })
+        user, model = make_entry("user", turn), make_entry("model", turn)
+        document = make_document(turn)
+        session["chatHistory"] += [user, model]
+        session["livingDocument"] = document
+
+        put_bytes = body_size(session)
+        patch_bytes = body_size([
+            {"op": "add", "path": "/chatHistory/-", "value": user},
+            {"op": "add", "path": "/chatHistory/-", "value": model},
+            {"op": "replace", "path": "/livingDocument", "value": document},
+        ])
+        put_total += put_bytes
+        patch_total += patch_bytes
+        if turn % args.report_every == 0 or turn == args.turns:
+            print(f"{turn:>6} {put_bytes:>12,} {patch_bytes:>12,} {put_bytes / patch_bytes:>7.0f}x")
+
+    print(f"\nTotal uploaded over {args.turns} turns: PUT {put_total / 1024 / 1024:,.1f} MB, PATCH {patch_total / 1024 / 1024:,.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
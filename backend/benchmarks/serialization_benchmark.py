@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark: encoding a ``NoteSession`` response, pydantic models vs. trusted dicts.
+
+Before: read endpoints built ``NoteSession``/``ChatVersion`` models from the
+stored rows, and FastAPI then re-validated them against ``response_model``,
+dumped them to Python objects and ran ``json.dumps`` over the result.
+After: they build plain dicts from the already-validated rows (see
+``serialization.py``) and encode them in one pass with orjson, or with
+pydantic-core when orjson is not installed.
+
+Each session size is a chat of ``--messages`` entries with an auto-checkpoint
+every other message, stored as the delta-encoded version chain the database
+holds. Both paths include materializing the chain, so the numbers are the
+per-request cost of ``GET /api/sessions/{id}``. The two bodies are checked to
+decode to the same JSON before timing.
+
+Usage:
+    python benchmarks/serialization_benchmark.py [--messages 10 100 1000] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Nothing connects; server only needs a URL to build its engine
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+import serialization  # noqa: E402
+import server  # noqa: E402
+import version_store  # noqa: E402
+
+RESPONSE_FIELD = create_response_field(name="Response_get_session", type_=server.NoteSession, mode="serialization")
+
+
+def make_session(messages: int):
+    chat_history: list = []
+    records: list = []
+    document = ""
+    for turn in range(messages):
+        role = "user" if turn % 2 == 0 else "model"
+        words = "context " * 20 if role == "user" else "detail " * 40
+        chat_history.append({"id": str(uuid.uuid4()), "role": role, "text": f"{role} {turn}: {words}", "image": None})
+        if role == "model":
+            document += f"## Answer {turn}\n" + "- point lorem ipsum\n" * 4
+            records = version_store.append_version(records, {
+                "id": str(uuid.uuid4()),
+                "version_number": len(records) + 1,
+                "timestamp": datetime.utcnow().isoformat(),
+                "chatHistory": list(chat_history),
+                "livingDocument": document,
+                "modelUsed": "anthropic/claude-3.5-sonnet",
+                "checkpoint_name": None,
+                "auto_checkpoint": True,
+            })
+    session = SimpleNamespace(
+        id=str(uuid.uuid4()),
+        last_modified=datetime.utcnow(),
+        context={"title": "Interview", "goal": "Notes", "keywords": "benchmark", "selectedModel": "anthropic/claude-3.5-sonnet"},
+        living_document=document,
+        current_version=len(records),
+        versions=records,
+    )
+    return session, chat_history
+
+
+def model_body(session, chat_history) -> bytes:
+    model = server.NoteSession(
+        id=session.id,
+        lastModified=session.last_modified,
+        context=server.NoteContext(**session.context),
+        chatHistory=[server.ChatEntry(**entry) for entry in chat_history],
+        livingDocument=session.living_document,
+        current_version=session.current_version,
+        versions=[server.ChatVersion(**version) for version in version_store.iter_materialized(session.versions)]
+    )
+    content = asyncio.run(serialize_response(field=RESPONSE_FIELD, response_content=model))
+    return JSONResponse(content).body
+
+
+def trusted_body(session, chat_history) -> bytes:
+    return serialization.TrustedJSONResponse(server.session_payload(session, chat_history)).body
+
+
+def timed(render, session, chat_history, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render(session, chat_history)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    encoder = "orjson" if serialization.orjson is not None else "pydantic-core"
+    print(f"Trusted path encoder: {encoder}\n")
+    print(f"{'messages':>9} {'versions':>9} {'body KB':>9} {'models ms':>10} {'trusted ms':>11} {'speed-up':>9}")
+    for messages in args.messages:
+        session, chat_history = make_session(messages)
+        before, after = model_body(session, chat_history), trusted_body(session, chat_history)
+        assert json.loads(before) == json.loads(after), "response bodies differ"
+
+        model_ms = timed(model_body, session, chat_history, args.repeat)
+        trusted_ms = timed(trusted_body, session, chat_history, args.repeat)
+        print(
+            f"{messages:>9} {len(session.versions):>9} {len(after) / 1024:>9,.0f} "
+            f"{model_ms:>10.2f} {trusted_ms:>11.2f} {model_ms / trusted_ms:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
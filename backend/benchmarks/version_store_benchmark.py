@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full-snapshot versions vs. the delta-encoded version store.
+
+Simulates a long interview session where every turn appends a user and a
+model message, rewrites a couple of sections of the living document and then
+checkpoints. For each strategy it reports the final size of the ``versions``
+column and the latency of writing that column back to a SQLite row after a
+checkpoint (encoding + serialisation + UPDATE), which is the work the
+``create_version`` endpoint does per call. Full-snapshot writes grow with the
+whole history, so write latency is sampled every ``--sample-every`` versions
+rather than on every checkpoint.
+
+Usage:
+    python benchmarks/version_store_benchmark.py [--versions 500 1000] [--sample-every 100]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import version_store  # noqa: E402
+
+SECTIONS = 12
+LINES_PER_SECTION = 8
+
+
+def make_document(turn: int) -> str:
+    lines = []
+    for section in range(SECTIONS):
+        # Two sections change per turn, the rest stay as they were
+        revision = turn if section in (turn % SECTIONS, (turn * 7) % SECTIONS) else section
+        lines.append(f"## Section {section}")
+        for line in range(LINES_PER_SECTION):
+            lines.append(f"- Point {line} of section {section}, revision {revision}: " + "lorem ipsum " * 6)
+    return "\n".join(lines)
+
+
+def make_version(turn: int, chat_history: list) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "version_number": turn + 1,
+        "timestamp": datetime.utcnow().isoformat(),
+        "chatHistory": list(chat_history),
+        "livingDocument": make_document(turn),
+        "modelUsed": "anthropic/claude-3.5-sonnet",
+        "checkpoint_name": None,
+        "auto_checkpoint": True,
+    }
+
+
+def run(strategy: str, total_versions: int, sample_every: int) -> dict:
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE note_sessions (id TEXT PRIMARY KEY, versions TEXT)")
+    db.execute("INSERT INTO note_sessions VALUES ('s', '[]')")
+
+    chat_history: list = []
+    records: list = []
+    samples = {}
+    for turn in range(total_versions):
+        chat_history.append({"id": str(uuid.uuid4()), "role": "user", "text": f"Question {turn}? " + "context " * 20, "image": None})
+        chat_history.append({"id": str(uuid.uuid4()), "role": "model", "text": f"Answer {turn}. " + "detail " * 40, "image": None})
+        version = make_version(turn, chat_history)
+
+        started = time.perf_counter()
+        if strategy == "snapshot":
+            records.append(version)
+        else:
+            records = version_store.append_version(records, version)
+        encode_ms = (time.perf_counter() - started) * 1000
+
+        if (turn + 1) % sample_every and turn + 1 != total_versions:
+            continue
+        started = time.perf_counter()
+        db.execute("UPDATE note_sessions SET versions = ? WHERE id = 's'", (json.dumps(records),))
+        db.commit()
+        samples[turn + 1] = encode_ms + (time.perf_counter() - started) * 1000
+
+    row_bytes = db.execute("SELECT length(versions) FROM note_sessions").fetchone()[0]
+
+    started = time.perf_counter()
+    rebuilt = version_store.materialize_all(records)
+    rebuild_ms = (time.perf_counter() - started) * 1000
+    assert rebuilt[-1]["livingDocument"] == make_document(total_versions - 1)
+    assert len(rebuilt[-1]["chatHistory"]) == len(chat_history)
+
+    return {
+        "row_mb": row_bytes / 1024 / 1024,
+        "write_ms": samples,
+        "rebuild_all_ms": rebuild_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--versions", type=int, nargs="+", default=[500, 1000])
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--keyframe-interval", type=int, default=version_store.KEYFRAME_INTERVAL)
+    args = parser.parse_args()
+    version_store.KEYFRAME_INTERVAL = args.keyframe_interval
+
+    for total in args.versions:
+        print(f"\n{total} versions (keyframe interval {version_store.KEYFRAME_INTERVAL})")
+        for strategy in ("snapshot", "delta"):
+            r = run(strategy, total, args.sample_every)
+            curve = ", ".join(f"v{n}: {ms:.1f}ms" for n, ms in r["write_ms"].items())
+            print(f"  {strategy:<8} row {r['row_mb']:8.2f} MB | rebuild all {r['rebuild_all_ms']:7.1f}ms | write latency {curve}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Opt-in cache of upstream chat completions, in a local SQLite file.
+
+Retried turns, page reloads and replayed test sessions send prompts that were
+already answered. With ``LLM_CACHE_PATH`` set, ``POST /api/sessions/{id}/chat``
+looks the request up here first and replays a stored answer instead of paying
+for it again.
+
+- The key is a SHA-256 of the model, the canonical messages and the sampling
+  parameters: keys are sorted, provider cache hints are dropped and a content
+  list holding one text part counts as that text, so requests that differ only
+  in how they are encoded share an entry. Streaming flags are not part of it.
+- Entries expire ``LLM_CACHE_TTL`` seconds after they were stored, and the
+  least recently used ones are evicted to keep the file's entries within
+  ``LLM_CACHE_MAX_BYTES`` (answers are stored zlib-compressed).
+- Only complete answers are stored; a request with ``X-LLM-Cache: bypass``
+  neither reads nor writes the cache.
+
+The file is shared by every worker on the host. Calls block on disk, so the
+server runs them in a thread.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Optional
+
+PATH = os.getenv("LLM_CACHE_PATH") or None
+MAX_BYTES = max(0, int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024))))
+TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+BYPASS = "bypass"
+# Payload fields that change how the answer is delivered, not what it is
+TRANSPORT_FIELDS = ("stream", "stream_options")
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS completions (
+        key TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        body BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        created REAL NOT NULL,
+        accessed REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed)",
+)
+
+
+def canonical_content(content):
+    if isinstance(content, str):
+        return content
+    parts = [{k: v for k, v in part.items() if k != "cache_control"} for part in content]
+    if len(parts) == 1 and parts[0].get("type") == "text":
+        return parts[0]["text"]
+    return parts
+
+
+def key(payload: Dict) -> str:
+    request = {k: v for k, v in payload.items() if k not in TRANSPORT_FIELDS}
+    request["messages"] = [
+        {**message, "content": canonical_content(message["content"])} for message in payload["messages"]
+    ]
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class CompletionCache:
+    """Size-bounded LRU of completion texts in a SQLite file."""
+
+    def __init__(self, path: str, max_bytes: int = MAX_BYTES, ttl: float = TTL, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.hit_bytes = 0
+        self.stored_bytes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened on first use, so startup does not touch the disk
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    def get(self, cache_key: str) -> Optional[str]:
+        now = self.clock()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT body, created FROM completions WHERE key = ?", (cache_key,)).fetchone()
+            if row is not None and row[1] + self.ttl <= now:
+                conn.execute("DELETE FROM completions WHERE key = ?", (cache_key,))
+                self.expirations += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE completions SET accessed = ? WHERE key = ?", (now, cache_key))
+            self.hits += 1
+            self.hit_bytes += len(row[0])
+        return zlib.decompress(row[0]).decode()
+
+    def put(self, cache_key: str, model: str, text: str):
+        body = zlib.compress(text.encode())
+        if len(body) > self.max_bytes:
+            return
+        now = self.clock()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO completions (key, model, body, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                    (cache_key, model, body, len(body), now, now),
+                )
+                self.expirations += conn.execute("DELETE FROM completions WHERE created <= ?", (now - self.ttl,)).rowcount
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.stores += 1
+            self.stored_bytes += len(body)
+
+    def _evict(self, conn: sqlite3.Connection):
+        excess = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        stale = []
+        for cache_key, size in conn.execute("SELECT key, size FROM completions ORDER BY accessed"):
+            stale.append((cache_key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM completions WHERE key = ?", stale)
+        self.evictions += len(stale)
+
+    def bypassed(self):
+        self.bypasses += 1
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM completions")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            entries, size = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "hit_bytes": self.hit_bytes,
+            "stores": self.stores,
+            "stored_bytes": self.stored_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+        }
+
+
+def from_env() -> Optional[CompletionCache]:
+    return CompletionCache(PATH) if PATH else None
@@ -0,0 +1,297 @@
+"""
+Content-Encoding for request and response bodies.
+
+``CompressionMiddleware`` compresses responses of ``COMPRESSIBLE_TYPES`` at or
+above ``MINIMUM_SIZE`` bytes with the best coding the client accepts: zstd and
+brotli when the optional ``zstandard``/``brotli`` packages are installed,
+gzip always. Bodies are compressed as they stream, so a large response is never
+buffered whole. Small responses, already-encoded ones, partial content and
+event streams pass through untouched. A compressed response's ``ETag`` is
+made weak, since its bytes depend on the coding; ``If-None-Match`` and
+``If-Match`` compare weakly here, so clients can send it back unchanged.
+
+It also decodes request bodies sent with ``Content-Encoding: gzip`` (or
+``zstd``), so autosave uploads can be compressed by the client. Decoded bodies
+are capped at ``MAX_REQUEST_BYTES`` to defuse decompression bombs.
+"""
+
+import importlib.util
+import os
+import zlib
+from typing import Callable, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Optional; looked up here, imported by the first coder that uses them
+HAS_BROTLI = importlib.util.find_spec("brotli") is not None
+HAS_ZSTANDARD = importlib.util.find_spec("zstandard") is not None
+
+MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+MAX_REQUEST_BYTES = int(os.getenv("COMPRESSION_MAX_REQUEST_BYTES", str(64 * 1024 * 1024)))
+
+# Levels tuned for speed; session JSON compresses well even at low levels
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/", "application/javascript", "image/svg+xml")
+# Flushing per message keeps streaming working, but event streams are left to the client
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+
+class GzipEncoder:
+    def __init__(self):
+        self._z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class BrotliEncoder:
+    def __init__(self):
+        import brotli
+
+        self._c = brotli.Compressor(mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data) + self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+class ZstdEncoder:
+    def __init__(self):
+        import zstandard
+
+        self._c = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data) + self._c.flush(self._flush_block)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+# In order of preference when the client weighs several codings equally
+ENCODERS: Dict[str, Callable] = {}
+if HAS_ZSTANDARD:
+    ENCODERS["zstd"] = ZstdEncoder
+if HAS_BROTLI:
+    ENCODERS["br"] = BrotliEncoder
+ENCODERS["gzip"] = GzipEncoder
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """The available coding with the highest q-value in an Accept-Encoding header."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, *params = [piece.strip() for piece in part.split(";")]
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.lower()] = weight
+
+    best, best_weight = None, 0.0
+    for coding in ENCODERS:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+class GzipDecoder:
+    def __init__(self):
+        # Accepts both gzip and zlib framing
+        self._d = zlib.decompressobj(32 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes, limit: int) -> bytes:
+        # max_length keeps a bomb from inflating past the limit in memory
+        out = self._d.decompress(data, limit + 1)
+        if self._d.unconsumed_tail:
+            raise OverflowError
+        return out
+
+
+class BoundedSink:
+    """Collects decoded output, raising OverflowError as soon as it passes ``limit`` bytes."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self.limit = 0
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > self.limit:
+            raise OverflowError
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        out = b"".join(self.chunks)
+        self.chunks, self.size = [], 0
+        return out
+
+
+class ZstdDecoder:
+    def __init__(self):
+        # The writer hands output to the sink a block at a time, so a bomb stops one block past the limit
+        import zstandard
+
+        self._sink = BoundedSink()
+        self._w = zstandard.ZstdDecompressor().stream_writer(self._sink, write_return_read=True)
+
+    def decompress(self, data: bytes, limit: int) -> bytes:
+        self._sink.limit = limit
+        self._w.write(data)
+        return self._sink.take()
+
+
+DECODERS: Dict[str, Callable] = {"gzip": GzipDecoder, "x-gzip": GzipDecoder}
+if HAS_ZSTANDARD:
+    DECODERS["zstd"] = ZstdDecoder
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = MINIMUM_SIZE, max_request_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.max_request_bytes = max_request_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("content-encoding", "").strip().lower()
+        if content_encoding and content_encoding != "identity":
+            if content_encoding not in DECODERS:
+                response = JSONResponse({"detail": f"Unsupported Content-Encoding: {content_encoding}"}, status_code=415)
+                await response(scope, receive, send)
+                return
+            scope, receive = self.decoded_request(scope, receive, DECODERS[content_encoding]())
+
+        encoding = None
+        if scope["method"] != "HEAD":
+            encoding = choose_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+        else:
+            await CompressedResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+    def decoded_request(self, scope: Scope, receive: Receive, decoder):
+        """The scope and receive channel of the request with its body decoded on the fly.
+
+        Errors are raised as HTTPException from ``receive``, which FastAPI lets
+        through while reading the body, so they reach the client as 400/413.
+        """
+        scope = dict(scope)
+        scope["headers"] = [
+            (name, value) for name, value in scope["headers"]
+            if name not in (b"content-encoding", b"content-length")
+        ]
+        total = 0
+
+        async def receive_decoded() -> Message:
+            nonlocal total
+            message = await receive()
+            if message["type"] != "http.request":
+                return message
+            try:
+                body = decoder.decompress(message.get("body", b""), self.max_request_bytes - total)
+            except OverflowError:
+                body = None
+            except Exception:
+                raise HTTPException(status_code=400, detail="Malformed compressed request body")
+            if body is None or total + len(body) > self.max_request_bytes:
+                raise HTTPException(status_code=413, detail="Decoded request body too large")
+            total += len(body)
+            return {**message, "body": body}
+
+        return scope, receive_decoded
+
+
+class CompressedResponder:
+    """Wraps ``send`` to compress one response with ``encoding`` once it proves worth it."""
+
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.start: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def compressible(self, headers: Headers) -> bool:
+        content_type = headers.get("content-type", "")
+        return (
+            self.start["status"] not in (204, 206, 304)
+            and "content-encoding" not in headers
+            and content_type.startswith(COMPRESSIBLE_TYPES)
+            and not content_type.startswith(UNCOMPRESSED_TYPES)
+        )
+
+    async def send_compressed(self, message: Message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk shows whether to compress
+            self.start = message
+            self.passthrough = not self.compressible(Headers(raw=message["headers"]))
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            if self.start is not None:
+                await self.send(self.start)
+                self.start = None
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            self.encoder = ENCODERS[self.encoding]()
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            # The encoded bytes differ per coding, so a strong validator would claim they are identical
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            if more_body:
+                del headers["Content-Length"]
+                await self.send(start)
+            else:
+                compressed = self.encoder.compress(body) + self.encoder.finish()
+                headers["Content-Length"] = str(len(compressed))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+
+        chunk = self.encoder.compress(body) if body else b""
+        if not more_body:
+            chunk += self.encoder.finish()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -0,0 +1,125 @@
+"""
+Keeps the chat prompt (``POST /api/sessions/{id}/chat``) within a token budget.
+
+Tokens are counted locally, without a round trip: ``tiktoken`` for OpenAI
+models when it is installed, otherwise characters per token measured for each
+model family. Estimates err on the high side, so a prompt that fits here fits
+the provider's count too.
+
+A prompt is the system prompt, the rolling summary of older turns, the recent
+turns verbatim, the living document and the new message. Only the turns are
+trimmed: the newest ones that fit in ``TOKEN_BUDGET`` are sent, the rest are
+left to the summary. The summary is rolled forward in the background (see
+``summarise_history`` in server.py) once ``SUMMARY_BATCH`` turns beyond the
+``RECENT_ENTRIES`` newest ones have piled up, or as soon as turns had to be
+dropped.
+
+- ``CHAT_CONTEXT_TOKENS``: prompt budget; the document and the new message are
+  always sent, even when they alone exceed it.
+- ``CHAT_RECENT_ENTRIES``: entries the summary never covers.
+- ``CHAT_SUMMARY_BATCH``: entries to collect before summarising again.
+- ``CHAT_SUMMARY_MODEL`` / ``CHAT_SUMMARY_TOKENS``: model (default: the
+  session's) and length limit for summaries.
+"""
+
+import importlib.util
+import math
+import os
+from typing import List, Optional
+
+# Optional, and slow to import: looked up here, imported on the first count that needs it
+HAS_TIKTOKEN = importlib.util.find_spec("tiktoken") is not None
+
+TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKENS", "16000"))
+RECENT_ENTRIES = int(os.getenv("CHAT_RECENT_ENTRIES", "8"))
+SUMMARY_BATCH = max(1, int(os.getenv("CHAT_SUMMARY_BATCH", "8")))
+SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL") or None
+SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "1024"))
+
+# ASCII characters per token of English prose on each family's tokenizer,
+# rounded down; other characters count as a token each
+CHARS_PER_TOKEN = {
+    "openai": 4.0,
+    "anthropic": 3.5,
+    "google": 4.0,
+    "meta-llama": 3.8,
+    "mistralai": 3.4,
+    "deepseek": 3.6,
+    "qwen": 3.6,
+    "microsoft": 3.0,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.0
+# Bare model names without an OpenRouter "vendor/" prefix
+NAME_HINTS = {"gpt": "openai", "o1": "openai", "claude": "anthropic", "gemini": "google", "llama": "meta-llama",
+              "mistral": "mistralai", "mixtral": "mistralai", "deepseek": "deepseek", "qwen": "qwen", "phi": "microsoft"}
+
+# Chat-format framing around each message, and priming of the reply
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+# A high-detail image on the providers that publish their rates
+IMAGE_TOKENS = 800
+
+_encodings = {}
+
+
+def family(model: Optional[str]) -> str:
+    name = (model or "").lower()
+    if "/" in name:
+        return name.split("/", 1)[0]
+    for hint, vendor in NAME_HINTS.items():
+        if name.startswith(hint):
+            return vendor
+    return ""
+
+
+def _encoding(model: str):
+    name = model.split("/", 1)[-1].split(":", 1)[0]
+    if name not in _encodings:
+        import tiktoken
+
+        try:
+            _encodings[name] = tiktoken.encoding_for_model(name)
+        except KeyError:
+            _encodings[name] = tiktoken.get_encoding("o200k_base")
+    return _encodings[name]
+
+
+def count_text(model: Optional[str], text: str) -> int:
+    if not text:
+        return 0
+    vendor = family(model)
+    if HAS_TIKTOKEN and vendor == "openai":
+        return len(_encoding(model).encode(text, disallowed_special=()))
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / CHARS_PER_TOKEN.get(vendor, DEFAULT_CHARS_PER_TOKEN)) + len(text) - ascii_chars
+
+
+def count_message(model: Optional[str], message: dict) -> int:
+    content = message["content"]
+    if isinstance(content, str):
+        return MESSAGE_OVERHEAD + count_text(model, content)
+    tokens = MESSAGE_OVERHEAD
+    for part in content:
+        tokens += IMAGE_TOKENS if part.get("type") == "image_url" else count_text(model, part.get("text", ""))
+    return tokens
+
+
+def count_messages(model: Optional[str], messages: List[dict]) -> int:
+    return REPLY_OVERHEAD + sum(count_message(model, message) for message in messages)
+
+
+def recent_entries(model: Optional[str], entries: List[dict], budget: int) -> List[dict]:
+    """The newest ``entries`` whose messages fit in ``budget`` tokens, oldest first."""
+    kept = 0
+    for entry in reversed(entries):
+        tokens = MESSAGE_OVERHEAD + count_text(model, entry["text"])
+        if tokens > budget:
+            break
+        budget -= tokens
+        kept += 1
+    return entries[len(entries) - kept:]
+
+
+def needs_summary(unsummarised: int, sent: int) -> bool:
+    """Whether to roll the summary forward, given how many entries it does not cover and how many of those were sent."""
+    return sent < unsummarised or unsummarised - RECENT_ENTRIES >= SUMMARY_BATCH
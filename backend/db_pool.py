@@ -0,0 +1,133 @@
+"""
+Connection pool profile for the async engine, configured from the environment.
+
+- ``DB_POOL_MODE``: ``queue`` (default) keeps up to ``DB_POOL_SIZE`` idle
+  connections plus ``DB_MAX_OVERFLOW`` extra under load; ``null`` opens a
+  connection per checkout, for serverless runtimes that freeze between
+  requests or when an external pooler does the pooling.
+- ``DB_POOL_TIMEOUT``: seconds a checkout waits for a free connection.
+- ``DB_POOL_RECYCLE``: replace connections older than this many seconds
+  (default 240, -1 keeps them). Neon drops connections when its compute
+  suspends after 5 idle minutes; a connection younger than that cannot have
+  been idle that long, so recycling early replaces a pre-ping.
+- ``DB_POOL_PRE_PING``: test connections on checkout (default false; costs a
+  round trip per checkout).
+- ``DB_STATEMENT_CACHE``: ``on``, ``off`` or ``auto`` (default). Transaction
+  poolers such as Neon's pgbouncer endpoint (``-pooler`` hosts) hand each
+  transaction a different server connection, so asyncpg's prepared statement
+  caches must be off; ``auto`` turns them off for ``-pooler`` hosts.
+
+Checkouts are timed by the pool classes below; ``pool_stats`` reports them.
+"""
+
+import os
+import time
+import uuid
+from typing import Any, Dict
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+POOL_MODE = os.getenv("DB_POOL_MODE", "queue").lower()
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "240"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+STATEMENT_CACHE = os.getenv("DB_STATEMENT_CACHE", "auto").lower()
+
+
+class TimedCheckout:
+    """Pool mixin counting checkouts and the time spent waiting for (or opening) a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checked_out = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        waited = time.perf_counter() - started
+        self.checkouts += 1
+        self.checked_out += 1
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return record
+
+    def _do_return_conn(self, record):
+        self.checked_out -= 1
+        super()._do_return_conn(record)
+
+
+class TimedQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+class TimedNullPool(TimedCheckout, NullPool):
+    pass
+
+
+def behind_pooler(url: str) -> bool:
+    """Whether connections go through a transaction pooler (no prepared statements, no LISTEN)."""
+    if STATEMENT_CACHE != "auto":
+        return STATEMENT_CACHE == "off"
+    return "-pooler" in (make_url(url).host or "")
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """Keyword arguments for create_async_engine."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        if parsed.database in (None, "", ":memory:"):
+            # In-memory SQLite lives in a single connection; keep SQLAlchemy's StaticPool
+            return {}
+        # aiosqlite's default: opening a file is cheap, and idle connections pin threads
+        return {"poolclass": TimedNullPool}
+    if POOL_MODE == "null":
+        options: Dict[str, Any] = {"poolclass": TimedNullPool}
+    else:
+        options = {
+            "poolclass": TimedQueuePool,
+            "pool_size": POOL_SIZE,
+            "max_overflow": MAX_OVERFLOW,
+            "pool_timeout": POOL_TIMEOUT,
+        }
+    options.update(pool_recycle=POOL_RECYCLE, pool_pre_ping=POOL_PRE_PING)
+    if parsed.get_backend_name() == "postgresql" and behind_pooler(url):
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            # Names must not collide across the server connections the pooler multiplexes
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return options
+
+
+def pool_stats(engine) -> Dict[str, Any]:
+    pool = engine.sync_engine.pool
+    stats: Dict[str, Any] = {"pool": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, TimedCheckout):
+        stats.update(
+            checked_out=pool.checked_out,
+            checkouts=pool.checkouts,
+            timeouts=pool.timeouts,
+            wait_seconds=pool.wait_seconds,
+            avg_wait_ms=pool.wait_seconds * 1000 / pool.checkouts if pool.checkouts else 0.0,
+            max_wait_ms=pool.max_wait_seconds * 1000,
+        )
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update(
+            size=pool.size(),
+            idle=pool.checkedin(),
+            overflow=pool.overflow(),
+        )
+    return stats
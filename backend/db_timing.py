@@ -0,0 +1,127 @@
+"""
+Per-request database timings.
+
+``attach`` times every statement the engine sends. ``ServerTimingMiddleware``
+gives each HTTP request a collector in a context variable and reports it in a
+``Server-Timing`` header, e.g.::
+
+    Server-Timing: db;dur=12.4;desc="3 queries", db-slowest;dur=8.1, app;dur=15.0
+
+``db`` is the number of statements and their total time, ``db-slowest`` the
+slowest of them and ``app`` the time until the response started. Statements
+taking at least ``SLOW_QUERY_MS`` are logged as one JSON object per line on the
+``db.slow_query`` logger; parameters are left out since they hold user content.
+"""
+
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Longer statements are cut in the slow-query log
+STATEMENT_LOG_LIMIT = 2000
+
+slow_query_log = logging.getLogger("db.slow_query")
+
+
+class RequestTimings:
+    def __init__(self, method: str = "", path: str = ""):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement: Optional[str] = None
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.db_seconds += seconds
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+    def header(self) -> str:
+        app_ms = (time.perf_counter() - self.started) * 1000
+        metrics = [f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries"']
+        if self.queries:
+            metrics.append(f"db-slowest;dur={self.slowest_seconds * 1000:.1f}")
+        metrics.append(f"app;dur={app_ms:.1f}")
+        return ", ".join(metrics)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("db_timings", default=None)
+
+
+def current() -> Optional[RequestTimings]:
+    """The collector of the request being handled, if any."""
+    return _current.get()
+
+
+def log_slow_query(statement: str, seconds: float, executemany: bool, timings: Optional[RequestTimings]):
+    record = {
+        "event": "slow_query",
+        "duration_ms": round(seconds * 1000, 1),
+        "threshold_ms": SLOW_QUERY_MS,
+        "statement": " ".join(statement.split())[:STATEMENT_LOG_LIMIT],
+        "executemany": executemany,
+    }
+    if timings is not None:
+        record.update(method=timings.method, path=timings.path, query_index=timings.queries)
+    slow_query_log.warning(json.dumps(record))
+
+
+def attach(engine):
+    """Time every cursor execution of ``engine`` (an AsyncEngine)."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["query_started"].pop()
+        timings = _current.get()
+        if timings is not None:
+            timings.record(statement, seconds)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            log_slow_query(statement, seconds, executemany, timings)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def failed(exception_context):
+        # after_cursor_execute does not run for a failed statement
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+class ServerTimingMiddleware:
+    """Collects the DB timings of each HTTP request and adds the ``Server-Timing`` header."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings(scope["method"], scope["path"])
+        token = _current.set(timings)
+
+        async def send_with_timings(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", timings.header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            _current.reset(token)
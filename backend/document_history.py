@@ -0,0 +1,123 @@
+"""
+Revision history for a session's living document.
+
+Every rewrite of ``living_document`` is appended to ``document_revisions`` as a
+line-level edit script against the previous revision (see
+``version_store.diff_lines``). Every ``CHECKPOINT_INTERVAL``-th revision stores
+the full text instead, so rebuilding any revision replays at most that many
+scripts.
+
+On Postgres the write endpoints append revisions inside their single UPDATE
+statement, so the script is computed by the database: ``line_edit_script``
+(``EDIT_SCRIPT_DDL``) keeps the common leading and trailing lines and replaces
+what lies between. Its scripts are coarser than difflib's but use the same
+format, and it returns NULL where ``encode_revision`` would store a checkpoint
+because nothing survived. SQLite connections get a ``line_edit_script`` that
+calls ``edit_script_json``, so SQL that diffs documents (version checkpoints,
+see ``server.checkpoint_values``) runs on both backends.
+"""
+
+import json
+import os
+from typing import Any, Iterable, Optional, Tuple
+
+from sqlalchemy import text as sql_text
+
+from version_store import apply_line_diff, diff_lines
+
+CHECKPOINT_INTERVAL = max(1, int(os.getenv("DOCUMENT_CHECKPOINT_INTERVAL", "50")))
+
+CHECKPOINT = "checkpoint"
+DELTA = "delta"
+
+# Lines as str.splitlines(keepends=True) splits them
+LINE_PATTERN = (
+    r"([^\n\r\v\f\x1c-\x1e\x85\u2028\u2029]*(?:\r\n|[\n\r\v\f\x1c-\x1e\x85\u2028\u2029])"
+    r"|[^\n\r\v\f\x1c-\x1e\x85\u2028\u2029]+)"
+)
+
+EDIT_SCRIPT_DDL = rf"""
+CREATE OR REPLACE FUNCTION line_edit_script(old_text text, new_text text) RETURNS jsonb AS $$
+DECLARE
+    old_lines text[] := ARRAY(
+        SELECT m[1] FROM regexp_matches(old_text, '{LINE_PATTERN}', 'g') WITH ORDINALITY AS t(m, n) ORDER BY n
+    );
+    new_lines text[] := ARRAY(
+        SELECT m[1] FROM regexp_matches(new_text, '{LINE_PATTERN}', 'g') WITH ORDINALITY AS t(m, n) ORDER BY n
+    );
+    old_count int := coalesce(array_length(old_lines, 1), 0);
+    new_count int := coalesce(array_length(new_lines, 1), 0);
+    prefix int := 0;
+    suffix int := 0;
+    script jsonb := '[]';
+BEGIN
+    WHILE prefix < least(old_count, new_count) AND old_lines[prefix + 1] = new_lines[prefix + 1] LOOP
+        prefix := prefix + 1;
+    END LOOP;
+    WHILE suffix < least(old_count, new_count) - prefix
+            AND old_lines[old_count - suffix] = new_lines[new_count - suffix] LOOP
+        suffix := suffix + 1;
+    END LOOP;
+    IF length(array_to_string(new_lines[prefix + 1:new_count - suffix], '')) >= length(new_text) THEN
+        RETURN NULL;
+    END IF;
+    IF prefix > 0 THEN
+        script := script || to_jsonb(prefix);
+    END IF;
+    IF old_count - prefix - suffix > 0 THEN
+        script := script || to_jsonb(prefix + suffix - old_count);
+    END IF;
+    IF new_count - prefix - suffix > 0 THEN
+        script := script || jsonb_build_array(to_jsonb(new_lines[prefix + 1:new_count - suffix]));
+    END IF;
+    IF suffix > 0 THEN
+        script := script || to_jsonb(suffix);
+    END IF;
+    RETURN script;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE
+"""
+
+
+def encode_revision(previous: Optional[str], text: str, previous_depth: Optional[int]) -> Tuple[str, int, Any]:
+    """Return ``(kind, depth, data)`` for storing ``text`` after ``previous``.
+
+    ``depth`` counts revisions since the last checkpoint.
+    """
+    if previous is None or previous_depth is None or previous_depth + 1 >= CHECKPOINT_INTERVAL:
+        return CHECKPOINT, 0, text
+
+    ops = edit_script(previous, text)
+    if ops is None:
+        return CHECKPOINT, 0, text
+    return DELTA, previous_depth + 1, ops
+
+
+def edit_script(previous: str, text: str) -> Optional[list]:
+    """``diff_lines(previous, text)``, or None when nothing survived and the script would not be smaller than ``text``."""
+    ops = diff_lines(previous, text)
+    inserted = sum(len(line) for op in ops if isinstance(op, list) for line in op)
+    if inserted >= len(text):
+        return None
+    return ops
+
+
+def edit_script_json(previous: Optional[str], text: Optional[str]) -> Optional[str]:
+    """``line_edit_script`` for SQLite, which calls back into Python for it (see sqlite_backend.attach)."""
+    if previous is None or text is None:
+        return None
+    ops = edit_script(previous, text)
+    return None if ops is None else json.dumps(ops)
+
+
+def rebuild(rows: Iterable[Tuple[str, Any]]) -> Optional[str]:
+    """Replay ``(kind, data)`` rows, oldest first, starting at a checkpoint."""
+    text = None
+    for kind, data in rows:
+        text = data if kind == CHECKPOINT else apply_line_diff(text, data)
+    return text
+
+
+def install_function(sync_conn):
+    """Create or replace ``line_edit_script`` (Postgres only)."""
+    sync_conn.execute(sql_text(EDIT_SCRIPT_DDL))
@@ -0,0 +1,132 @@
+"""
+Minimal RFC 6902 JSON Patch implementation used by ``PATCH /api/sessions/{id}``.
+
+Operations are applied in place to plain ``dict``/``list`` documents; callers
+are expected to pass freshly loaded data and discard it if a ``JsonPatchError``
+is raised part-way through.
+"""
+
+import copy
+from typing import Any, List, Tuple
+
+
+class JsonPatchError(ValueError):
+    """The patch is malformed or does not apply to the document."""
+
+
+class JsonPatchTestFailed(JsonPatchError):
+    """A ``test`` operation did not match."""
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """Split an RFC 6901 JSON pointer into unescaped reference tokens."""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def _list_index(container: list, token: str, allow_end: bool) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise JsonPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _resolve(document: Any, tokens: List[str]) -> Tuple[Any, str]:
+    """Return the parent container of the target and the final token."""
+    if not tokens:
+        raise JsonPatchError("Operations on the document root are not supported")
+    parent = document
+    for token in tokens[:-1]:
+        if isinstance(parent, dict):
+            if token not in parent:
+                raise JsonPatchError(f"Path not found: {token!r}")
+            parent = parent[token]
+        elif isinstance(parent, list):
+            parent = parent[_list_index(parent, token, allow_end=False)]
+        else:
+            raise JsonPatchError(f"Cannot traverse into {type(parent).__name__}")
+    return parent, tokens[-1]
+
+
+def _get(document: Any, tokens: List[str]) -> Any:
+    parent, token = _resolve(document, tokens)
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JsonPatchError(f"Path not found: {token!r}")
+        return parent[token]
+    if isinstance(parent, list):
+        return parent[_list_index(parent, token, allow_end=False)]
+    raise JsonPatchError(f"Cannot index into {type(parent).__name__}")
+
+
+def _add(document: Any, tokens: List[str], value: Any):
+    parent, token = _resolve(document, tokens)
+    if isinstance(parent, dict):
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent.insert(_list_index(parent, token, allow_end=True), value)
+    else:
+        raise JsonPatchError(f"Cannot add into {type(parent).__name__}")
+
+
+def _remove(document: Any, tokens: List[str]) -> Any:
+    parent, token = _resolve(document, tokens)
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JsonPatchError(f"Path not found: {token!r}")
+        return parent.pop(token)
+    if isinstance(parent, list):
+        return parent.pop(_list_index(parent, token, allow_end=False))
+    raise JsonPatchError(f"Cannot remove from {type(parent).__name__}")
+
+
+def validate_operation(operation: dict):
+    """Check an operation is well formed without applying it to anything."""
+    op = operation.get("op")
+    if op not in ("add", "remove", "replace", "move", "copy", "test"):
+        raise JsonPatchError(f"Unknown operation: {op!r}")
+    parse_pointer(operation.get("path", ""))
+    if op in ("add", "replace", "test") and "value" not in operation:
+        raise JsonPatchError(f"'{op}' operation requires a value")
+    if op in ("move", "copy"):
+        if "from" not in operation:
+            raise JsonPatchError(f"'{op}' operation requires 'from'")
+        parse_pointer(operation["from"])
+
+
+def apply_operation(document: Any, operation: dict):
+    validate_operation(operation)
+    op = operation["op"]
+    tokens = parse_pointer(operation.get("path", ""))
+    value = operation.get("value")
+
+    if op == "add":
+        _add(document, tokens, value)
+    elif op == "remove":
+        _remove(document, tokens)
+    elif op == "replace":
+        _remove(document, tokens)
+        _add(document, tokens, value)
+    elif op == "move":
+        source = parse_pointer(operation.get("from", ""))
+        if tokens[:len(source)] == source and tokens != source:
+            raise JsonPatchError("Cannot move a value into one of its children")
+        _add(document, tokens, _remove(document, source))
+    elif op == "copy":
+        _add(document, tokens, copy.deepcopy(_get(document, parse_pointer(operation.get("from", "")))))
+    elif op == "test":
+        if _get(document, tokens) != value:
+            raise JsonPatchTestFailed(f"Test failed at {operation['path']}")
+
+
+def apply_patch(document: Any, operations: List[dict]) -> Any:
+    for operation in operations:
+        apply_operation(document, operation)
+    return document
@@ -0,0 +1,158 @@
+"""
+Streaming client for the upstream chat-completions API (OpenRouter by default).
+
+- ``LLM_BASE_URL``: any OpenAI-compatible ``/chat/completions`` endpoint;
+  tests and local runs point it at a stub server.
+- ``LLM_API_KEY``: server-side key; a request may bring its own instead.
+- ``LLM_CONNECT_TIMEOUT`` / ``LLM_READ_TIMEOUT``: seconds to connect, and to
+  wait for the next streamed chunk (not for the whole completion).
+
+One ``httpx.AsyncClient`` is shared, so turns reuse warm TLS connections to
+the upstream. ``stream_completion`` yields content deltas as the upstream
+sends them, and fills in a ``Usage`` from the final chunk: how many prompt
+tokens the provider served from its prompt cache, and what the request cost.
+httpx is imported with the client, on the first turn, so cold starts that
+serve no chat do not pay for it.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+API_KEY = os.getenv("LLM_API_KEY") or os.getenv("OPENROUTER_API_KEY")
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+
+# Sampling parameters the frontend has always used
+TEMPERATURE = 0.7
+MAX_TOKENS = 2048
+APP_TITLE = "aiMMar - Note Taking Assistant"
+
+_client: Optional["httpx.AsyncClient"] = None
+
+
+class UpstreamError(Exception):
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+@dataclass
+class Usage:
+    prompt_tokens: int = 0
+    # Prompt tokens read from, and written to, the provider's prompt cache
+    cached_tokens: int = 0
+    cache_write_tokens: int = 0
+    completion_tokens: int = 0
+    # In the provider's unit (credits on OpenRouter), when it reports one
+    cost: Optional[float] = None
+    reported: bool = False
+
+    def update(self, usage: Dict):
+        """From the OpenAI-style ``usage`` object; Anthropic's own field names are accepted too."""
+        details = usage.get("prompt_tokens_details") or {}
+        self.prompt_tokens = usage.get("prompt_tokens") or 0
+        self.cached_tokens = details.get("cached_tokens") or usage.get("cache_read_input_tokens") or 0
+        self.cache_write_tokens = details.get("cache_write_tokens") or usage.get("cache_creation_input_tokens") or 0
+        self.completion_tokens = usage.get("completion_tokens") or 0
+        self.cost = usage.get("cost")
+        self.reported = True
+
+    def payload(self) -> Optional[Dict]:
+        if not self.reported:
+            return None
+        return {
+            "promptTokens": self.prompt_tokens,
+            "cachedPromptTokens": self.cached_tokens,
+            "completionTokens": self.completion_tokens,
+            "cost": self.cost,
+        }
+
+
+def get_client() -> "httpx.AsyncClient":
+    global _client
+    if _client is None:
+        import httpx
+
+        _client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def completion_request(model: str, messages: List[dict], max_tokens: int = MAX_TOKENS, json_reply: bool = True) -> Dict:
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": TEMPERATURE,
+        "max_tokens": max_tokens,
+        "stream": True,
+        # A final chunk with token counts, including cached prompt tokens
+        "stream_options": {"include_usage": True},
+    }
+    if json_reply:
+        payload["response_format"] = {"type": "json_object"}
+    return payload
+
+
+def upstream_detail(status: int, body: bytes) -> str:
+    try:
+        message = json.loads(body)["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        message = body.decode(errors="replace")[:500]
+    return f"Upstream error {status}: {message}"
+
+
+async def stream_completion(
+    payload: Dict, api_key: Optional[str] = None, referer: Optional[str] = None, usage: Optional[Usage] = None
+) -> AsyncIterator[str]:
+    """Content deltas of a streamed completion; raises UpstreamError on failure."""
+    key = api_key or API_KEY
+    if not key:
+        raise UpstreamError(401, "No API key configured for the chat upstream")
+    headers = {"Authorization": f"Bearer {key}", "X-Title": APP_TITLE}
+    if referer:
+        headers["HTTP-Referer"] = referer
+
+    import httpx
+
+    try:
+        async with get_client().stream("POST", "/chat/completions", json=payload, headers=headers) as response:
+            if response.status_code != 200:
+                raise UpstreamError(response.status_code, upstream_detail(response.status_code, await response.aread()))
+            async for line in response.aiter_lines():
+                # Server-sent events: "data: {...}" lines, ": comments" as keep-alives
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    raise UpstreamError(502, upstream_detail(502, data.encode()))
+                if usage is not None and chunk.get("usage"):
+                    usage.update(chunk["usage"])
+                for choice in chunk.get("choices") or ():
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
+    except httpx.TimeoutException:
+        raise UpstreamError(504, "Upstream timed out")
+    except httpx.HTTPError as e:
+        raise UpstreamError(502, f"Upstream request failed: {e}")
+    except ValueError:
+        raise UpstreamError(502, "Upstream sent a malformed stream chunk")
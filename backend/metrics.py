@@ -0,0 +1,298 @@
+"""
+Prometheus metrics for ``GET /api/metrics``.
+
+``MetricsMiddleware`` records per request, labelled by method, route template
+(``/api/sessions/{session_id}``, not the concrete path) and status:
+
+- ``http_request_duration_seconds``: until the handler finished sending.
+- ``http_request_size_bytes`` / ``http_response_size_bytes``: body bytes as sent
+  on the wire, i.e. before request decoding and after response compression.
+- ``http_requests_in_flight`` and its high-water mark since startup, to size
+  ``containerConcurrency``.
+
+Chat completions record their token usage (``llm_prompt_tokens_total`` split
+by whether the provider's prompt cache served them, completion tokens and
+cost) and the time to their first token, labelled by whether any of the prompt
+was cached, so the effect of prompt caching shows in both cost and latency.
+
+Pool and cache figures are read from their own counters at scrape time. The
+text exposition format is written here directly, without prometheus_client.
+"""
+
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 256 B to 64 MiB in powers of four
+SIZE_BUCKETS = tuple(float(256 * 4 ** i) for i in range(10))
+
+# Requests no route matched share one label, so scanners cannot grow the series count
+UNMATCHED = "unmatched"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, label_values: Tuple[str, ...], value: float):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        bucket_labels = self.labels + ("le",)
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket{format_labels(bucket_labels, label_values + (format_value(bound),))} {bucket_count}"
+            yield f"{self.name}_bucket{format_labels(bucket_labels, label_values + ('+Inf',))} {count}"
+            yield f"{self.name}_sum{format_labels(self.labels, label_values)} {format_value(total)}"
+            yield f"{self.name}_count{format_labels(self.labels, label_values)} {count}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, label_values: Tuple[str, ...], value: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in sorted(self._values.items()):
+            yield f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}"
+
+
+def sample(name: str, help: str, kind: str, value: float) -> Iterable[str]:
+    """A single unlabelled gauge or counter."""
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} {kind}"
+    yield f"{name} {format_value(value)}"
+
+
+REQUEST_LABELS = ("method", "route", "status")
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time from receiving a request to the end of its response.",
+    REQUEST_LABELS, LATENCY_BUCKETS,
+)
+request_size = Histogram(
+    "http_request_size_bytes", "Request body bytes as received.", REQUEST_LABELS, SIZE_BUCKETS,
+)
+response_size = Histogram(
+    "http_response_size_bytes", "Response body bytes as sent, after compression.", REQUEST_LABELS, SIZE_BUCKETS,
+)
+
+
+# kind: "chat" for turns, "summary" for background summaries
+LLM_LABELS = ("model", "kind")
+
+llm_prompt_tokens = Counter(
+    "llm_prompt_tokens_total", "Prompt tokens sent upstream; cache is hit when the provider's prompt cache served them.",
+    LLM_LABELS + ("cache",),
+)
+llm_cache_write_tokens = Counter(
+    "llm_cache_write_tokens_total", "Prompt tokens written to the provider's prompt cache.", LLM_LABELS,
+)
+llm_completion_tokens = Counter("llm_completion_tokens_total", "Completion tokens received.", LLM_LABELS)
+llm_cost = Counter("llm_cost_total", "Cost reported by the upstream, in its unit (OpenRouter credits).", LLM_LABELS)
+llm_first_token = Histogram(
+    "llm_time_to_first_token_seconds", "Time from sending a chat completion to its first token.",
+    ("model", "prompt_cache"), LATENCY_BUCKETS,
+)
+
+
+def record_completion(model: str, kind: str, usage, first_token: Optional[float] = None):
+    """Account one completion from its llm_client.Usage; ``first_token`` in seconds."""
+    if not usage.reported:
+        return
+    labels = (model, kind)
+    llm_prompt_tokens.inc(labels + ("hit",), usage.cached_tokens)
+    llm_prompt_tokens.inc(labels + ("miss",), usage.prompt_tokens - usage.cached_tokens)
+    llm_cache_write_tokens.inc(labels, usage.cache_write_tokens)
+    llm_completion_tokens.inc(labels, usage.completion_tokens)
+    if usage.cost is not None:
+        llm_cost.inc(labels, usage.cost)
+    if first_token is not None:
+        llm_first_token.observe((model, "hit" if usage.cached_tokens else "miss"), first_token)
+
+
+class InFlight:
+    def __init__(self):
+        self.current = 0
+        self.max = 0
+
+    def __enter__(self):
+        self.current += 1
+        self.max = max(self.max, self.current)
+
+    def __exit__(self, *exc_info):
+        self.current -= 1
+
+
+in_flight = InFlight()
+
+
+def route_template(router, scope: Scope) -> str:
+    """The path template of the route that handled the request."""
+    route = scope.get("route")
+    if route is None and router is not None:
+        # Middleware that rewrites the scope (request decoding) hides the match; find it again
+        for candidate in router.routes:
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", UNMATCHED)
+
+
+class MetricsMiddleware:
+    """Records latency, body sizes and concurrency of every HTTP request."""
+
+    def __init__(self, app: ASGIApp, router=None):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        received = 0
+        sent = 0
+        status = 500
+
+        async def receive_counted() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message: Message):
+            nonlocal sent, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        with in_flight:
+            try:
+                await self.app(scope, receive_counted, send_counted)
+            finally:
+                labels = (scope["method"], route_template(self.router, scope), str(status))
+                request_duration.observe(labels, time.perf_counter() - started)
+                request_size.observe(labels, received)
+                response_size.observe(labels, sent)
+
+
+def pool_metrics(stats: Dict) -> Iterable[str]:
+    """From db_pool.pool_stats."""
+    yield from sample("db_pool_checked_out", "Connections currently checked out.", "gauge", stats.get("checked_out", 0))
+    if "size" in stats:
+        yield from sample("db_pool_size", "Configured number of pooled connections.", "gauge", stats["size"])
+        yield from sample("db_pool_idle", "Idle connections in the pool.", "gauge", stats["idle"])
+        yield from sample("db_pool_overflow", "Connections open beyond the pool size.", "gauge", stats["overflow"])
+    yield from sample("db_pool_checkouts_total", "Connection checkouts.", "counter", stats.get("checkouts", 0))
+    yield from sample("db_pool_timeouts_total", "Checkouts that timed out waiting for a connection.", "counter", stats.get("timeouts", 0))
+    yield from sample(
+        "db_pool_wait_seconds_total", "Time spent waiting for or opening connections.", "counter",
+        stats.get("wait_seconds", 0.0),
+    )
+
+
+def cache_metrics(stats: Dict) -> Iterable[str]:
+    """From session_cache.SessionCache.stats."""
+    for key, help in (
+        ("hits", "Session read cache hits."),
+        ("misses", "Session read cache misses."),
+        ("evictions", "Bodies evicted to stay within the size limit."),
+        ("invalidations", "Bodies dropped because their session changed."),
+        ("remote_invalidations", "Bodies dropped on a notification from another instance."),
+    ):
+        yield from sample(f"session_cache_{key}_total", help, "counter", stats[key])
+    yield from sample("session_cache_hit_ratio", "Hits over lookups since startup.", "gauge", stats["hit_ratio"])
+    yield from sample("session_cache_entries", "Cached bodies.", "gauge", stats["entries"])
+    yield from sample("session_cache_bytes", "Size of the cached bodies.", "gauge", stats["bytes"])
+    yield from sample("session_cache_listening", "Whether cross-instance invalidation is connected.", "gauge", int(stats["listening"]))
+
+
+def system_prompt_metrics(stats: Dict) -> Iterable[str]:
+    """From prompts.system_prompt_stats."""
+    yield from sample("system_prompt_cache_hits_total", "Chat prompts built from an already rendered system prompt.", "counter", stats["hits"])
+    yield from sample("system_prompt_cache_misses_total", "System prompts rendered for a new session context.", "counter", stats["misses"])
+
+
+def completion_cache_metrics(stats: Dict) -> Iterable[str]:
+    """From completion_cache.CompletionCache.stats."""
+    for key, help in (
+        ("hits", "Chat requests answered from the completion cache."),
+        ("misses", "Chat requests the completion cache had no answer for."),
+        ("bypasses", "Chat requests that asked not to use the completion cache."),
+        ("stores", "Answers stored in the completion cache."),
+        ("evictions", "Answers evicted to stay within the size limit."),
+        ("expirations", "Answers dropped after their TTL."),
+        ("hit_bytes", "Compressed bytes of the answers served from the cache."),
+        ("stored_bytes", "Compressed bytes of the answers stored."),
+    ):
+        yield from sample(f"llm_completion_cache_{key}_total", help, "counter", stats[key])
+    yield from sample("llm_completion_cache_entries", "Stored answers.", "gauge", stats["entries"])
+    yield from sample("llm_completion_cache_bytes", "Compressed size of the stored answers.", "gauge", stats["bytes"])
+
+
+def render(
+    pool: Optional[Dict], cache: Dict, system_prompts: Optional[Dict] = None, completion_cache: Optional[Dict] = None
+) -> str:
+    lines: List[str] = []
+    for histogram in (request_duration, request_size, response_size):
+        lines.extend(histogram.render())
+    for series in (llm_prompt_tokens, llm_cache_write_tokens, llm_completion_tokens, llm_cost, llm_first_token):
+        lines.extend(series.render())
+    lines.extend(sample("http_requests_in_flight", "Requests being handled.", "gauge", in_flight.current))
+    lines.extend(sample("http_requests_in_flight_max", "Most requests handled at once since startup.", "gauge", in_flight.max))
+    if pool is not None:
+        lines.extend(pool_metrics(pool))
+    lines.extend(cache_metrics(cache))
+    if system_prompts is not None:
+        lines.extend(system_prompt_metrics(system_prompts))
+    if completion_cache is not None:
+        lines.extend(completion_cache_metrics(completion_cache))
+    return "\n".join(lines) + "\n"
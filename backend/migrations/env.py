@@ -0,0 +1,44 @@
+"""Alembic environment: runs migrations on the server's async engine."""
+
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+
+import server
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = server.Base.metadata
+
+
+def run_migrations_offline():
+    context.configure(url=server.DATABASE_URL, target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection):
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_migrations_online():
+    engine = server.get_engine()
+    engine.echo = False
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+        await connection.commit()
+    await engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+elif config.attributes.get("connection") is not None:
+    # A caller-supplied synchronous connection, e.g. init_db stamping or tests migrating a scratch database
+    do_run_migrations(config.attributes["connection"])
+else:
+    asyncio.run(run_migrations_online())
@@ -0,0 +1,199 @@
+"""Baseline: the schema the server used to create on every startup
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-17
+
+Safe to run on databases created by the old startup hook: it only creates
+what is missing, then moves legacy inline chat histories into chat_entries.
+Everything here is frozen as of this revision; it must not import the
+models, which keep changing after it.
+"""
+import base64
+import binascii
+import hashlib
+import logging
+from datetime import datetime
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Columns added to note_sessions after the old startup hook first created it
+SESSION_COLUMNS = (
+    ("row_version", sa.Integer(), "1"),
+    ("versioned_chat_length", sa.Integer(), "0"),
+    ("document_versioned", sa.Boolean(), sa.text("false")),
+)
+
+NOTIFY_DDL = (
+    """
+    CREATE OR REPLACE FUNCTION notify_session_changed() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('session_changed', OLD.id);
+        ELSE
+            PERFORM pg_notify('session_changed', NEW.id || ' ' || NEW.row_version);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS note_sessions_changed ON note_sessions",
+    """
+    CREATE TRIGGER note_sessions_changed AFTER UPDATE OR DELETE ON note_sessions
+    FOR EACH ROW EXECUTE FUNCTION notify_session_changed()
+    """,
+)
+
+
+def create_tables(existing: set):
+    if "status_checks" not in existing:
+        op.create_table(
+            "status_checks",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("client_name", sa.String(), nullable=False),
+            sa.Column("timestamp", sa.DateTime(), nullable=False),
+        )
+    if "note_sessions" not in existing:
+        op.create_table(
+            "note_sessions",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("last_modified", sa.DateTime(), nullable=False),
+            sa.Column("context", sa.JSON(), nullable=False),
+            sa.Column("chat_history", sa.JSON(), nullable=False),
+            sa.Column("living_document", sa.Text(), nullable=False),
+            sa.Column("current_version", sa.Integer(), nullable=False),
+            sa.Column("versions", sa.JSON(), nullable=False),
+            *(
+                sa.Column(name, type_, server_default=default, nullable=False)
+                for name, type_, default in SESSION_COLUMNS
+            ),
+        )
+    if "chat_entries" not in existing:
+        op.create_table(
+            "chat_entries",
+            sa.Column(
+                "session_id", sa.String(), sa.ForeignKey("note_sessions.id", ondelete="CASCADE"), primary_key=True
+            ),
+            sa.Column("seq", sa.Integer(), primary_key=True),
+            sa.Column("entry_id", sa.String(), nullable=False),
+            sa.Column("role", sa.String(), nullable=False),
+            sa.Column("text", sa.Text(), nullable=False),
+            sa.Column("image", sa.JSON(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+        )
+    if "document_revisions" not in existing:
+        op.create_table(
+            "document_revisions",
+            sa.Column(
+                "session_id", sa.String(), sa.ForeignKey("note_sessions.id", ondelete="CASCADE"), primary_key=True
+            ),
+            sa.Column("revision", sa.Integer(), primary_key=True),
+            sa.Column("kind", sa.String(), nullable=False),
+            sa.Column("depth", sa.Integer(), nullable=False),
+            sa.Column("data", sa.JSON(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+        )
+    if "attachments" not in existing:
+        op.create_table(
+            "attachments",
+            sa.Column("hash", sa.String(64), primary_key=True),
+            sa.Column("content_type", sa.String(), nullable=False),
+            sa.Column("size", sa.Integer(), nullable=False),
+            sa.Column("data", sa.LargeBinary(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+        )
+
+
+def adopt_note_sessions(inspector):
+    """Columns the old startup hook's create_all never added to an existing table"""
+    columns = {column["name"] for column in inspector.get_columns("note_sessions")}
+    for name, type_, default in SESSION_COLUMNS:
+        if name not in columns:
+            op.add_column("note_sessions", sa.Column(name, type_, server_default=default, nullable=False))
+
+
+def stored_image(image: dict, blobs: dict) -> dict:
+    """An inline image as a reference to the attachments row holding its bytes"""
+    payload = image.get("base64") or ""
+    if payload.startswith("data:") and "," in payload:
+        payload = payload.split(",", 1)[1]
+    data = base64.b64decode(payload, validate=True)
+    digest = hashlib.sha256(data).hexdigest()
+    blobs[digest] = (image.get("type") or "application/octet-stream", data)
+    return {"name": image.get("name"), "type": image.get("type"), "size": len(data), "hash": digest}
+
+
+def move_chat_histories(bind):
+    """Move legacy inline chat_history arrays into chat_entries, and their images into attachments"""
+    sessions = sa.table("note_sessions", sa.column("id", sa.String), sa.column("chat_history", sa.JSON))
+    entries = sa.table(
+        "chat_entries",
+        sa.column("session_id", sa.String), sa.column("seq", sa.Integer), sa.column("entry_id", sa.String),
+        sa.column("role", sa.String), sa.column("text", sa.Text), sa.column("image", sa.JSON),
+        sa.column("created_at", sa.DateTime),
+    )
+    attachments = sa.table(
+        "attachments",
+        sa.column("hash", sa.String), sa.column("content_type", sa.String), sa.column("size", sa.Integer),
+        sa.column("data", sa.LargeBinary), sa.column("created_at", sa.DateTime),
+    )
+    now = datetime.utcnow()
+    result = bind.execute(
+        sa.select(sessions.c.id, sessions.c.chat_history)
+        .where(sa.cast(sessions.c.chat_history, sa.Text) != "[]")
+    )
+    for session_id, chat_history in result.all():
+        rows, blobs = [], {}
+        for seq, entry in enumerate(chat_history or [], start=1):
+            image = entry.get("image")
+            if image and image.get("base64"):
+                try:
+                    image = stored_image(image, blobs)
+                except (binascii.Error, ValueError):
+                    logging.warning("Keeping an undecodable inline image for session %s", session_id)
+            rows.append({
+                "session_id": session_id, "seq": seq, "entry_id": entry["id"], "role": entry["role"],
+                "text": entry["text"], "image": image or None, "created_at": now,
+            })
+        if blobs:
+            existing = set(bind.execute(sa.select(attachments.c.hash).where(attachments.c.hash.in_(list(blobs)))).scalars())
+            missing = [
+                {"hash": digest, "content_type": content_type, "size": len(data), "data": data, "created_at": now}
+                for digest, (content_type, data) in blobs.items() if digest not in existing
+            ]
+            if missing:
+                bind.execute(attachments.insert(), missing)
+        if rows:
+            bind.execute(entries.insert(), rows)
+        bind.execute(sessions.update().where(sessions.c.id == session_id).values(chat_history=[]))
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing = set(inspector.get_table_names())
+    create_tables(existing)
+    if "note_sessions" in existing:
+        adopt_note_sessions(inspector)
+    indexes = {index["name"] for index in sa.inspect(bind).get_indexes("note_sessions")}
+    if "ix_note_sessions_last_modified_id" not in indexes:
+        # Backs keyset pagination of GET /sessions (newest first)
+        op.create_index("ix_note_sessions_last_modified_id", "note_sessions", ["last_modified", "id"])
+    if bind.dialect.name == "postgresql":
+        for ddl in NOTIFY_DDL:
+            op.execute(ddl)
+    move_chat_histories(bind)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP TRIGGER IF EXISTS note_sessions_changed ON note_sessions")
+        op.execute("DROP FUNCTION IF EXISTS notify_session_changed()")
+    for table in ("attachments", "document_revisions", "chat_entries", "note_sessions", "status_checks"):
+        op.drop_table(table)
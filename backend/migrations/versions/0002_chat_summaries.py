@@ -0,0 +1,28 @@
+"""Rolling summaries of older chat turns, see context_window.py
+
+Revision ID: 0002_chat_summaries
+Revises: 0001_baseline
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0002_chat_summaries"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "chat_summaries",
+        sa.Column("session_id", sa.String(), sa.ForeignKey("note_sessions.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("through_seq", sa.Integer(), nullable=False),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("model", sa.String(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table("chat_summaries")
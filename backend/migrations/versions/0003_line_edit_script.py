@@ -0,0 +1,73 @@
+"""line_edit_script(): document revisions diffed by Postgres, see document_history.py
+
+Revision ID: 0003_line_edit_script
+Revises: 0002_chat_summaries
+Create Date: 2026-10-17
+
+Frozen copy of document_history.EDIT_SCRIPT_DDL as of this revision. Nothing
+to do on SQLite, whose writes still diff documents in Python.
+"""
+from alembic import op
+
+revision = "0003_line_edit_script"
+down_revision = "0002_chat_summaries"
+branch_labels = None
+depends_on = None
+
+# Lines as str.splitlines(keepends=True) splits them
+LINE_PATTERN = (
+    r"([^\n\r\v\f\x1c-\x1e\x85\u2028\u2029]*(?:\r\n|[\n\r\v\f\x1c-\x1e\x85\u2028\u2029])"
+    r"|[^\n\r\v\f\x1c-\x1e\x85\u2028\u2029]+)"
+)
+
+EDIT_SCRIPT_DDL = rf"""
+CREATE OR REPLACE FUNCTION line_edit_script(old_text text, new_text text) RETURNS jsonb AS $$
+DECLARE
+    old_lines text[] := ARRAY(
+        SELECT m[1] FROM regexp_matches(old_text, '{LINE_PATTERN}', 'g') WITH ORDINALITY AS t(m, n) ORDER BY n
+    );
+    new_lines text[] := ARRAY(
+        SELECT m[1] FROM regexp_matches(new_text, '{LINE_PATTERN}', 'g') WITH ORDINALITY AS t(m, n) ORDER BY n
+    );
+    old_count int := coalesce(array_length(old_lines, 1), 0);
+    new_count int := coalesce(array_length(new_lines, 1), 0);
+    prefix int := 0;
+    suffix int := 0;
+    script jsonb := '[]';
+BEGIN
+    WHILE prefix < least(old_count, new_count) AND old_lines[prefix + 1] = new_lines[prefix + 1] LOOP
+        prefix := prefix + 1;
+    END LOOP;
+    WHILE suffix < least(old_count, new_count) - prefix
+            AND old_lines[old_count - suffix] = new_lines[new_count - suffix] LOOP
+        suffix := suffix + 1;
+    END LOOP;
+    IF length(array_to_string(new_lines[prefix + 1:new_count - suffix], '')) >= length(new_text) THEN
+        RETURN NULL;
+    END IF;
+    IF prefix > 0 THEN
+        script := script || to_jsonb(prefix);
+    END IF;
+    IF old_count - prefix - suffix > 0 THEN
+        script := script || to_jsonb(prefix + suffix - old_count);
+    END IF;
+    IF new_count - prefix - suffix > 0 THEN
+        script := script || jsonb_build_array(to_jsonb(new_lines[prefix + 1:new_count - suffix]));
+    END IF;
+    IF suffix > 0 THEN
+        script := script || to_jsonb(suffix);
+    END IF;
+    RETURN script;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE
+"""
+
+
+def upgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(EDIT_SCRIPT_DDL)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP FUNCTION IF EXISTS line_edit_script(text, text)")
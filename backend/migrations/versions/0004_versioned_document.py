@@ -0,0 +1,25 @@
+"""note_sessions.versioned_document: the document SQL checkpoints diff against
+
+Revision ID: 0004_versioned_document
+Revises: 0003_line_edit_script
+Create Date: 2026-10-17
+
+Existing sessions start out NULL (unknown), so their next checkpoint is a
+keyframe; every checkpoint after that stores a line edit script.
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0004_versioned_document"
+down_revision = "0003_line_edit_script"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("note_sessions", sa.Column("versioned_document", sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("note_sessions") as batch:
+        batch.drop_column("versioned_document")
@@ -0,0 +1,78 @@
+"""
+Access control for ``POST /api/sessions/{id}/chat``, which spends the server's LLM key.
+
+``CHAT_ENABLED=false`` turns the endpoint off. ``CHAT_SERVER_KEY=false`` stops
+it from falling back to the server's key, so every caller has to send their
+own in ``X-LLM-Api-Key``. Requests that do use the server's key are limited to
+``CHAT_RATE_LIMIT`` per minute per client address and, separately, per
+session, by a sliding-window ``RateLimiter`` held in process (each instance
+counts its own requests).
+
+Behind a proxy every request arrives from the proxy's address, so the client
+is taken from ``X-Forwarded-For`` when ``TRUSTED_PROXY_HOPS`` says how many
+proxies append to it (1 on Cloud Run). Only the entries those proxies added
+are used; anything before them was sent by the client and could be forged.
+"""
+
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Optional
+
+CHAT_ENABLED = os.getenv("CHAT_ENABLED", "true").lower() != "false"
+CHAT_SERVER_KEY = os.getenv("CHAT_SERVER_KEY", "true").lower() != "false"
+# 0 disables the limit
+CHAT_RATE_LIMIT = max(0, int(os.getenv("CHAT_RATE_LIMIT", "20")))
+# Proxies in front of the server that append the address they were connected from to X-Forwarded-For
+TRUSTED_PROXY_HOPS = max(0, int(os.getenv("TRUSTED_PROXY_HOPS", "0")))
+WINDOW = 60.0
+# Clients tracked at once; the least recently seen are forgotten first
+MAX_KEYS = 10_000
+
+
+class RateLimiter:
+    """At most ``limit`` hits per key within any ``window`` seconds."""
+
+    def __init__(self, limit: int, window: float = WINDOW, max_keys: int = MAX_KEYS, clock: Callable[[], float] = time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        self._hits: "OrderedDict[str, Deque[float]]" = OrderedDict()
+
+    def hit(self, *keys: str) -> Optional[float]:
+        """Record a hit on every key and return None, or, without recording anything, the seconds until all may try again."""
+        if not self.limit:
+            return None
+        now = self.clock()
+        windows = []
+        for key in keys:
+            hits = self._hits.pop(key, None) or deque()
+            self._hits[key] = hits
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            windows.append(hits)
+        full = [hits[0] + self.window - now for hits in windows if len(hits) >= self.limit]
+        if full:
+            return max(full)
+        for hits in windows:
+            hits.append(now)
+        while len(self._hits) > self.max_keys:
+            self._hits.popitem(last=False)
+        return None
+
+    def clear(self):
+        self._hits.clear()
+
+
+
+def client_address(peer: Optional[str], forwarded_for: Optional[str]) -> str:
+    """The address the outermost trusted proxy received the request from, else the connecting ``peer``."""
+    if TRUSTED_PROXY_HOPS and forwarded_for:
+        addresses = [address.strip() for address in forwarded_for.split(",") if address.strip()]
+        if addresses:
+            return addresses[max(0, len(addresses) - TRUSTED_PROXY_HOPS)]
+    return peer or "unknown"
+
+
+chat_limiter = RateLimiter(CHAT_RATE_LIMIT)
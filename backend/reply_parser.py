@@ -0,0 +1,240 @@
+"""
+Incremental parser for the model's ``{"reply": ..., "document": ...}`` answer.
+
+``POST /api/sessions/{id}/chat`` feeds it each streamed chunk; ``feed``
+returns the text decoded so far for the ``reply`` and ``document`` strings, so
+the reply can be shown from its first words on and the document rendered as it
+is written. The parser never waits for the rest of the object and tolerates
+what models actually send:
+
+- markdown fences around the object, and text after it;
+- raw newlines and unknown escapes inside strings;
+- other keys, with any value, which are skipped;
+- truncation: ``finish`` closes an unterminated reply. A document that was cut
+  off is not used (``document`` is None), since storing it would drop the end
+  of the living document.
+
+An answer that is not an object at all is streamed as reply text. If the
+character-level parse fails, ``finish`` falls back to ``json.loads`` on the
+outermost braces.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+FIELDS = ("reply", "document")
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+@dataclass
+class ParsedReply:
+    reply: str
+    document: Optional[str]
+    # Whether anything had to be closed, skipped or guessed
+    repaired: bool
+
+
+class ReplyParser:
+    def __init__(self):
+        self.raw: List[str] = []
+        self.values: Dict[str, List[str]] = {}
+        self.closed: set = set()
+        self.state = "start"
+        self.key: List[str] = []
+        self.field: Optional[str] = None
+        self.escape: Optional[str] = None
+        self.high_surrogate: Optional[int] = None
+        # Nesting and string state of a skipped non-string value
+        self.depth = 0
+        self.skip_string = False
+        self.skip_escape = False
+        self.repaired = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """Consume ``chunk``; returns (field, text) deltas in order, at most one per field run."""
+        self.raw.append(chunk)
+        deltas: List[Tuple[str, str]] = []
+        for char in chunk:
+            text = self._step(char)
+            if text:
+                field = self.field or "reply"
+                if deltas and deltas[-1][0] == field:
+                    deltas[-1] = (field, deltas[-1][1] + text)
+                else:
+                    deltas.append((field, text))
+                self.values.setdefault(field, []).append(text)
+        return deltas
+
+    def _step(self, char: str) -> str:
+        state = self.state
+        if state == "string":
+            return self._string(char)
+        if state == "plain":
+            return char
+        if state in ("done", "broken"):
+            return ""
+        if state == "fence":
+            if char == "\n":
+                self.state = "start"
+            return ""
+        if state == "key":
+            if char == '"' and not (self.key and self.key[-1] == "\\"):
+                self.state = "colon"
+            else:
+                self.key.append(char)
+            return ""
+        if state == "skip":
+            self._skip(char)
+            return ""
+        if char.isspace():
+            return ""
+
+        if state == "start":
+            if char == "{":
+                self.state = "key_or_end"
+            elif char == "`":
+                self.state = "fence"
+            else:
+                self.state = "plain"
+                return char
+        elif state == "key_or_end":
+            if char == '"':
+                self.key = []
+                self.state = "key"
+            elif char == "}":
+                self.state = "done"
+            elif char != ",":
+                self._break()
+        elif state == "colon":
+            if char == ":":
+                self.state = "value"
+            else:
+                self._break()
+        elif state == "value":
+            name = "".join(self.key)
+            if char == '"':
+                self.field = name if name in FIELDS else None
+                if self.field is not None:
+                    self.values[self.field] = []
+                self.state = "string"
+            else:
+                # Numbers, literals, arrays and objects: skipped up to the next key
+                self.depth = 1 if char in "[{" else 0
+                self.state = "skip"
+        elif state == "after_value":
+            if char == ",":
+                self.state = "key_or_end"
+            elif char == "}":
+                self.state = "done"
+            else:
+                self._break()
+        return ""
+
+    def _string(self, char: str) -> str:
+        if self.escape is not None:
+            return self._escaped(char)
+        if char == "\\":
+            self.escape = ""
+            return ""
+        if char == '"':
+            if self.field is not None:
+                self.closed.add(self.field)
+            self.state = "after_value"
+            self.field = None
+            return ""
+        return self._emit(char)
+
+    def _escaped(self, char: str) -> str:
+        if self.escape == "":
+            if char == "u":
+                self.escape = "u"
+                return ""
+            self.escape = None
+            if char not in ESCAPES:
+                self.repaired = True
+            return self._emit(ESCAPES.get(char, char))
+        self.escape += char
+        if len(self.escape) < 5:
+            return ""
+        digits, self.escape = self.escape[1:], None
+        try:
+            code = int(digits, 16)
+        except ValueError:
+            self.repaired = True
+            return self._emit("\\u" + digits)
+        if 0xD800 <= code < 0xDC00:
+            self.high_surrogate = code
+            return ""
+        if 0xDC00 <= code < 0xE000 and self.high_surrogate is not None:
+            code = 0x10000 + ((self.high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self.high_surrogate = None
+        return self._emit(chr(code))
+
+    def _emit(self, text: str) -> str:
+        if self.high_surrogate is not None:
+            # A high surrogate without its pair
+            self.high_surrogate = None
+            self.repaired = True
+            text = "�" + text
+        return text if self.field is not None else ""
+
+    def _skip(self, char: str):
+        if self.skip_string:
+            if self.skip_escape:
+                self.skip_escape = False
+            elif char == "\\":
+                self.skip_escape = True
+            elif char == '"':
+                self.skip_string = False
+        elif char == '"':
+            self.skip_string = True
+        elif char in "[{":
+            self.depth += 1
+        elif char in "]}":
+            if self.depth == 0:
+                self.state = "done"
+            else:
+                self.depth -= 1
+        elif char == "," and self.depth == 0:
+            self.state = "key_or_end"
+
+    def _break(self):
+        self.state = "broken"
+        self.field = None
+
+    def finish(self) -> ParsedReply:
+        """The answer as far as it could be read, once the stream has ended."""
+        text = "".join(self.raw)
+        if self.state == "plain" or self.state == "broken":
+            fallback = _loads_object(text)
+            if fallback is not None:
+                return fallback
+            if self.state == "plain":
+                return ParsedReply(text.strip(), None, repaired=False)
+        if self.state == "string" and self.field is not None:
+            # The stream ended inside this string
+            self.repaired = True
+        elif self.state != "done":
+            self.repaired = True
+
+        reply = "".join(self.values.get("reply", []))
+        document = "".join(self.values["document"]) if "document" in self.closed else None
+        if "document" in self.values and document is None:
+            self.repaired = True
+        return ParsedReply(reply, document, self.repaired)
+
+
+def _loads_object(text: str) -> Optional[ParsedReply]:
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        parsed = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("reply"), str):
+        return None
+    document = parsed.get("document")
+    return ParsedReply(parsed["reply"], document if isinstance(document, str) else None, repaired=True)
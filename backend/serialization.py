@@ -0,0 +1,78 @@
+"""
+Fast JSON responses for session data read from the database.
+
+Stored chat entries and version records were validated when they were written,
+so read endpoints build plain ``NoteSession``/``ChatVersion``-shaped dicts and
+return a ``TrustedJSONResponse``. FastAPI skips ``response_model`` validation for
+responses returned directly, and the body is encoded in one pass by orjson when
+it is installed, or by pydantic-core's serializer otherwise.
+"""
+
+from typing import Any, Iterable, List, Optional
+
+from fastapi.responses import JSONResponse
+from pydantic_core import to_json
+
+import version_store
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return to_json(content)
+
+
+class TrustedJSONResponse(JSONResponse):
+    """JSONResponse for already-valid payloads; datetimes are encoded as ISO 8601."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def image_payload(image: Optional[dict]) -> Optional[dict]:
+    if not image:
+        return None
+    return {
+        "name": image.get("name"),
+        "type": image.get("type"),
+        "size": image.get("size"),
+        "base64": image.get("base64"),
+        "hash": image.get("hash"),
+    }
+
+
+def chat_entry_payload(entry: dict) -> dict:
+    """A stored chat entry in ``ChatEntry`` shape (stored entries may omit optional keys)."""
+    return {
+        "id": entry["id"],
+        "role": entry["role"],
+        "text": entry["text"],
+        "image": image_payload(entry.get("image")),
+    }
+
+
+def chat_history_payload(entries: Iterable[dict]) -> List[dict]:
+    return [chat_entry_payload(entry) for entry in entries]
+
+
+def version_payload(version: dict) -> dict:
+    return {
+        "id": version["id"],
+        "version_number": version["version_number"],
+        "timestamp": version["timestamp"],
+        "chatHistory": chat_history_payload(version["chatHistory"]),
+        "livingDocument": version["livingDocument"],
+        "modelUsed": version["modelUsed"],
+        "checkpoint_name": version.get("checkpoint_name"),
+        "auto_checkpoint": version.get("auto_checkpoint", True),
+    }
+
+
+def versions_payload(records: List[dict]) -> List[dict]:
+    """Materialize a stored version chain straight into ``ChatVersion`` dicts."""
+    return [version_payload(version) for version in version_store.iter_materialized(records or [])]
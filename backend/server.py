@@ -1,17 +1,52 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+# Imported first so cold-start timings cover everything below
+import startup_profile
+
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Text, DateTime, Integer, JSON, select, update, delete
+from sqlalchemy import String, Text, DateTime, Integer, Boolean, JSON, LargeBinary, ForeignKey, Index, select, update, delete, insert, func, cast, tuple_, inspect, text, literal, literal_column, case, and_, or_, null, true
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.expression import Values
+from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
 import os
 import logging
+import asyncio
+import time
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from typing import List, Optional, Dict, Any, Literal, Tuple
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from types import SimpleNamespace
+import base64
+import binascii
 import json
+import math
+
+import attachments
+import completion_cache
+import compression
+import context_window
+import db_pool
+import db_timing
+import document_history
+import json_patch
+import llm_client
+import metrics
+import prompts
+import rate_limit
+import reply_parser
+import serialization
+import session_cache
+import sql_json
+import sqlite_backend
+import version_store
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
@@ -20,15 +55,50 @@ load_dotenv(ROOT_DIR / '.env')
 # Database setup
 DATABASE_URL = os.getenv('DATABASE_URL')
 if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable is required")
+    raise ValueError("DATABASE_URL environment variable is required (e.g. sqlite:///./aimmar.db for a local database)")
 
 # Convert postgresql:// to postgresql+asyncpg:// for asyncpg driver
 if DATABASE_URL.startswith('postgresql://'):
     DATABASE_URL = DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://', 1)
+# and sqlite:// to sqlite+aiosqlite://, tuned in sqlite_backend.py
+DATABASE_URL = sqlite_backend.normalize_url(DATABASE_URL)
+
+# The engine (and with it the driver and pool) is created on first use, not at
+# import; pool profile from DB_POOL_* / DB_STATEMENT_CACHE (see db_pool.py)
+DATABASE_BACKEND = make_url(DATABASE_URL).get_backend_name()
+# Statement logging for local debugging; per-request timings are in db_timing.py
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"
+_engine = None
+_session_factory = None
+
+def get_engine():
+    global _engine, _session_factory
+    if _engine is None:
+        _engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO, **db_pool.engine_options(DATABASE_URL))
+        db_timing.attach(_engine)
+        if _engine.dialect.name == "sqlite":
+            sqlite_backend.attach(_engine, {"line_edit_script": document_history.edit_script_json})
+        _session_factory = async_sessionmaker(_engine, expire_on_commit=False)
+    return _engine
+
+def async_session() -> AsyncSession:
+    get_engine()
+    return _session_factory()
 
-# Create async engine
-engine = create_async_engine(DATABASE_URL, echo=True)
-async_session = async_sessionmaker(engine, expire_on_commit=False)
+def __getattr__(name):
+    # ``server.engine`` for scripts and tests; code in this module calls get_engine()
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Encoded GET /sessions/{id} and /versions bodies, see session_cache.py
+read_cache = session_cache.SessionCache()
+# Stored upstream answers, when LLM_CACHE_PATH is set; see completion_cache.py
+response_cache = completion_cache.from_env()
+invalidation_listener = None
+listener_task = None
+# Background summary jobs by session id, see summarise_history
+summary_tasks: Dict[str, asyncio.Task] = {}
 
 # Database Models
 class Base(DeclarativeBase):
@@ -47,10 +117,70 @@ class NoteSessionDB(Base):
     id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     last_modified: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     context: Mapped[dict] = mapped_column(JSON)
+    # Legacy inline history; messages now live in chat_entries (see migrate_chat_history)
     chat_history: Mapped[list] = mapped_column(JSON, default=list)
     living_document: Mapped[str] = mapped_column(Text, default="")
     current_version: Mapped[int] = mapped_column(Integer, default=1)
     versions: Mapped[list] = mapped_column(JSON, default=list)
+    # Incremented by every write; exposed as the ETag for If-Match conditional updates
+    row_version: Mapped[int] = mapped_column(Integer, default=1, server_default="1", nullable=False)
+    # How much of the current state the newest version already holds, so a
+    # checkpoint can be delta-encoded in SQL (see checkpoint_values)
+    versioned_chat_length: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    document_versioned: Mapped[bool] = mapped_column(Boolean, default=False, server_default=text("false"), nullable=False)
+    # The newest version's document, which the next checkpoint diffs against; NULL when unknown
+    versioned_document: Mapped[Optional[str]] = mapped_column(Text, nullable=True, deferred=True)
+    
+    __table_args__ = (
+        # Backs keyset pagination of GET /sessions (newest first)
+        Index("ix_note_sessions_last_modified_id", "last_modified", "id"),
+    )
+
+# Columns of a session row as plain rows select it, without the deferred versioned_document
+SESSION_COLUMNS = tuple(column for column in NoteSessionDB.__table__.c if column.key != "versioned_document")
+
+class ChatEntryDB(Base):
+    __tablename__ = "chat_entries"
+    
+    session_id: Mapped[str] = mapped_column(String, ForeignKey("note_sessions.id", ondelete="CASCADE"), primary_key=True)
+    seq: Mapped[int] = mapped_column(Integer, primary_key=True)
+    entry_id: Mapped[str] = mapped_column(String)
+    role: Mapped[str] = mapped_column(String)
+    text: Mapped[str] = mapped_column(Text)
+    image: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self) -> dict:
+        return {"id": self.entry_id, "role": self.role, "text": self.text, "image": self.image}
+
+class DocumentRevisionDB(Base):
+    __tablename__ = "document_revisions"
+    
+    session_id: Mapped[str] = mapped_column(String, ForeignKey("note_sessions.id", ondelete="CASCADE"), primary_key=True)
+    revision: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String)  # 'checkpoint' (full text) or 'delta' (line edit script)
+    depth: Mapped[int] = mapped_column(Integer, default=0)  # revisions since the last checkpoint
+    data: Mapped[Any] = mapped_column(JSON)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class ChatSummaryDB(Base):
+    __tablename__ = "chat_summaries"
+    
+    # Rolling summary of the entries the chat prompt no longer sends verbatim (see context_window.py)
+    session_id: Mapped[str] = mapped_column(String, ForeignKey("note_sessions.id", ondelete="CASCADE"), primary_key=True)
+    through_seq: Mapped[int] = mapped_column(Integer)  # covers the entries with seq <= through_seq
+    text: Mapped[str] = mapped_column(Text)
+    model: Mapped[str] = mapped_column(String)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class AttachmentDB(Base):
+    __tablename__ = "attachments"
+    
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)  # SHA-256 of data
+    content_type: Mapped[str] = mapped_column(String)
+    size: Mapped[int] = mapped_column(Integer)
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 # Dependency to get database session
 async def get_db():
@@ -73,7 +203,8 @@ class ImageFile(BaseModel):
     name: str
     type: str
     size: int
-    base64: str
+    base64: Optional[str] = None  # inline payload on upload; stored entries only keep the hash
+    hash: Optional[str] = None  # served from /api/attachments/{hash}
 
 class ChatEntry(BaseModel):
     id: str
@@ -106,11 +237,52 @@ class NoteSession(BaseModel):
     current_version: int = 1
     versions: List[ChatVersion] = []
 
+class SessionPage(BaseModel):
+    sessions: List[NoteSession]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= to fetch the next page
+
+class DocumentRevision(BaseModel):
+    revision: int
+    timestamp: datetime
+    checkpoint: bool
+    livingDocument: Optional[str] = None
+
 class SessionCreate(BaseModel):
     context: NoteContext
     chatHistory: List[ChatEntry] = []
     livingDocument: str = ""
 
+class SessionUpdate(BaseModel):
+    """Fields a PUT may replace; omitted (or null) ones are left as stored.
+
+    Versions and the bookkeeping that delta-encodes them are written only by
+    the version endpoints, so a body naming any other field is rejected.
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    context: Optional[NoteContext] = None
+    chat_history: Optional[List[ChatEntry]] = None
+    living_document: Optional[str] = None
+
+class PatchOperation(BaseModel):
+    """One RFC 6902 operation on /livingDocument, /chatHistory or /context"""
+    op: Literal["add", "remove", "replace", "move", "copy", "test"]
+    path: str
+    value: Any = None
+    from_: Optional[str] = Field(None, alias="from")
+
+    def to_dict(self) -> dict:
+        operation = {"op": self.op, "path": self.path}
+        if "value" in self.model_fields_set:
+            operation["value"] = self.value
+        if self.from_ is not None:
+            operation["from"] = self.from_
+        return operation
+
+class SessionPatchResult(BaseModel):
+    id: str
+    lastModified: datetime
+
 class VersionCreate(BaseModel):
     session_id: str
     checkpoint_name: Optional[str] = None
@@ -125,6 +297,741 @@ class VersionRestore(BaseModel):
     session_id: str
     version_id: str
 
+class ChatTurn(BaseModel):
+    text: str
+    image: Optional[ImageFile] = None
+    model: Optional[str] = None  # defaults to the session's selectedModel
+
+# Concurrency helpers
+def etag(row_version: int) -> str:
+    return f'"{row_version}"'
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Row version named by an If-Match header; None when absent or a wildcard"""
+    if not if_match or if_match.strip() == "*":
+        return None
+    try:
+        return int(if_match.split(",")[0].strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=412, detail="Precondition failed")
+
+def conflict(expected: Optional[int]) -> HTTPException:
+    if expected is not None:
+        return HTTPException(status_code=412, detail="Session was modified, reload and retry")
+    return HTTPException(status_code=409, detail="Session was modified concurrently, please retry")
+
+async def bump_row_version(db: AsyncSession, session_id: str, expected: Optional[int], **values) -> Optional[int]:
+    """Apply ``values`` and increment row_version in a single UPDATE.
+
+    With ``expected`` set the UPDATE only matches that row version, so a
+    read-modify-write cannot overwrite a concurrent change and no lock is held
+    between the read and the write. Returns the new row version, or None when
+    no row matched.
+    """
+    query = update(NoteSessionDB).where(NoteSessionDB.id == session_id)
+    if expected is not None:
+        query = query.where(NoteSessionDB.row_version == expected)
+    result = await db.execute(
+        query
+        .values(**values, row_version=NoteSessionDB.row_version + 1)
+        .returning(NoteSessionDB.row_version)
+        .execution_options(synchronize_session=False)
+    )
+    read_cache.invalidate(session_id)
+    return result.scalar_one_or_none()
+
+async def write_session(db: AsyncSession, session_id: str, read_version: int, expected: Optional[int], **values) -> int:
+    """Write ``values`` computed from the row as read at ``read_version``, failing with 412/409 if it has moved on"""
+    row_version = await bump_row_version(db, session_id, read_version, **values)
+    if row_version is None:
+        await db.rollback()
+        raise conflict(expected)
+    return row_version
+
+def check_if_match(expected: Optional[int], row_version: int):
+    if expected is not None and expected != row_version:
+        raise conflict(expected)
+
+async def missing_or_conflict(db: AsyncSession, session_id: str, expected: Optional[int]) -> HTTPException:
+    """Explain why a conditional write matched no row; only runs on the failure path"""
+    await db.rollback()
+    if await db.scalar(select(NoteSessionDB.id).where(NoteSessionDB.id == session_id)):
+        return conflict(expected)
+    return HTTPException(status_code=404, detail="Session not found")
+
+# Attempts at a write that depends on no read, while concurrent writes keep moving the row on
+WRITE_ATTEMPTS = 3
+
+def revision_head(session_id: str) -> tuple:
+    """Scalar subqueries for the latest document revision and its depth, to select alongside a session"""
+    latest = (
+        select(DocumentRevisionDB.revision, DocumentRevisionDB.depth)
+        .where(DocumentRevisionDB.session_id == session_id)
+        .order_by(DocumentRevisionDB.revision.desc())
+        .limit(1)
+    )
+    return (
+        latest.with_only_columns(DocumentRevisionDB.revision).scalar_subquery().label("last_revision"),
+        latest.with_only_columns(DocumentRevisionDB.depth).scalar_subquery().label("last_depth"),
+    )
+
+async def update_session_row(
+    db: AsyncSession,
+    session_id: str,
+    expected: Optional[int],
+    columns: tuple = (),
+    *,
+    read: Any = None,
+    append: List[dict] = (),
+    history: Optional[List[dict]] = None,
+    stored: Optional[List[Tuple[int, dict]]] = None,
+    blobs: List[dict] = (),
+    **values
+) -> Optional[SimpleNamespace]:
+    """Apply ``values`` and return ``row_version`` plus ``columns`` of the updated row.
+
+    The write's child rows go with it: ``append`` entries after the stored
+    history, or ``history`` in its place (see replace_chat_history, which also
+    explains ``stored``), the attachment ``blobs`` they reference (see
+    extract_attachments) and a revision of a changed ``living_document``.
+    Postgres does all of it in one statement (session_write). SQLite runs one
+    statement per table, and reads the previous document first when it changes
+    since it cannot return pre-update values.
+
+    ``read`` is the row as the caller read it: ``row_version`` plus, when the
+    document changes, ``living_document`` and revision_head's columns. The
+    write then only applies to that version. A write that depends on no read
+    (neither ``read`` nor ``expected``) is retried when a concurrent write
+    moves the row on under it. Returns None when no row matched.
+    """
+    if db.bind.dialect.name == "postgresql":
+        statement = session_write(session_id, expected, read, columns, append, history, blobs, values)
+        for _ in range(WRITE_ATTEMPTS):
+            row = (await db.execute(statement)).one_or_none()
+            if row is None or row.row_version is not None or read is not None or expected is not None:
+                break
+        if row is None or row.row_version is None:
+            return None
+        read_cache.invalidate(session_id)
+        return SimpleNamespace(**{key: value for key, value in row._mapping.items() if key != "found"})
+    
+    previous = read
+    for _ in range(WRITE_ATTEMPTS):
+        if previous is None and "living_document" in values:
+            result = await db.execute(
+                select(NoteSessionDB.row_version, NoteSessionDB.living_document, *revision_head(session_id))
+                .where(NoteSessionDB.id == session_id)
+            )
+            previous = result.one_or_none()
+            if previous is None:
+                return None
+        query = update(NoteSessionDB).where(NoteSessionDB.id == session_id)
+        if expected is not None:
+            query = query.where(NoteSessionDB.row_version == expected)
+        if previous is not None:
+            query = query.where(NoteSessionDB.row_version == previous.row_version)
+        result = await db.execute(
+            query
+            .values(**values, row_version=NoteSessionDB.row_version + 1)
+            .returning(NoteSessionDB.row_version, *columns)
+            .execution_options(synchronize_session=False)
+        )
+        row = result.one_or_none()
+        if row is not None or read is not None or expected is not None or previous is None:
+            break
+        previous = None
+    if row is None:
+        return None
+    read_cache.invalidate(session_id)
+    
+    await save_attachments(db, blobs)
+    if history is not None:
+        await replace_chat_history(db, session_id, history, stored)
+    elif append:
+        await append_chat_entries(db, session_id, append)
+    if "living_document" in values:
+        await record_document_revision(
+            db, session_id, previous.living_document, values["living_document"],
+            previous.last_revision, previous.last_depth
+        )
+    return SimpleNamespace(**dict(row._mapping))
+
+def session_write(
+    session_id: str,
+    expected: Optional[int],
+    read: Any,
+    columns: tuple,
+    append: List[dict],
+    history: Optional[List[dict]],
+    blobs: List[dict],
+    values: dict
+):
+    """The single Postgres statement behind update_session_row.
+
+    The ``previous`` CTE reads what the child rows are computed from (the
+    document and revision head, the last sequence number, the kept prefix of
+    the history) in the statement's snapshot. The UPDATE only applies if
+    row_version is still the one that snapshot saw: a write that committed in
+    between makes it match nothing, rather than letting the children be
+    computed from a stale state. The child writes are data-modifying CTEs that
+    run only if the UPDATE did. Selects ``found`` when the session exists, and
+    the updated row's columns (NULL when it had moved on).
+    """
+    now = datetime.utcnow()
+    state = [NoteSessionDB.id, NoteSessionDB.row_version]
+    if "living_document" in values:
+        last_revision, last_depth = (head.element for head in revision_head(session_id))
+        document = literal(values["living_document"], Text)
+        state += [
+            NoteSessionDB.living_document,
+            document.label("document"),
+            last_revision.label("last_revision"),
+            last_depth.label("last_depth"),
+            # NULL stores a checkpoint: at the interval, or when nothing survived
+            case(
+                (
+                    last_depth + 1 < document_history.CHECKPOINT_INTERVAL,
+                    func.line_edit_script(NoteSessionDB.living_document, document, type_=JSONB),
+                ),
+            ).label("script"),
+        ]
+    if append:
+        state.append(
+            select(func.coalesce(func.max(ChatEntryDB.seq), 0))
+            .where(ChatEntryDB.session_id == session_id)
+            .scalar_subquery()
+            .label("last_seq")
+        )
+    if history is not None:
+        rows = json_entries(history)
+        # Read twice, sent once
+        incoming = select(rows.c.value, rows.c.seq).cte("incoming")
+        state.append(kept_prefix_sql(session_id, incoming, len(history)).label("keep"))
+    previous = select(*state).where(NoteSessionDB.id == session_id).cte("previous")
+    
+    query = update(NoteSessionDB).where(
+        NoteSessionDB.id == previous.c.id,
+        NoteSessionDB.row_version == previous.c.row_version
+    )
+    if expected is not None:
+        query = query.where(NoteSessionDB.row_version == expected)
+    if read is not None:
+        query = query.where(NoteSessionDB.row_version == read.row_version)
+    if "living_document" in values:
+        values = {**values, "living_document": previous.c.document}
+    if history is not None:
+        # The newest version can now share at most the kept prefix
+        versioned = values.get("versioned_chat_length", NoteSessionDB.versioned_chat_length)
+        values = {**values, "versioned_chat_length": func.least(versioned, previous.c.keep)}
+    returning = {returned.key: returned for returned in (NoteSessionDB.row_version, *columns)}
+    updated = (
+        query
+        .values(**values, row_version=NoteSessionDB.row_version + 1)
+        .returning(*returning.values())
+        .cte("updated")
+    )
+    written = select(updated.c.row_version).exists()
+    
+    children = []
+    if blobs:
+        children.append(attachment_upsert(blobs, now, written).cte("attachments_written"))
+    if append:
+        appended = json_entries(append)
+        children.append(
+            insert(ChatEntryDB)
+            .from_select(ENTRY_COLUMNS, entry_rows(previous.c.id, appended, now, previous.c.last_seq).join(previous, true()).where(written))
+            .cte("entries_appended")
+        )
+    if history is not None:
+        children.append(
+            delete(ChatEntryDB)
+            .where(ChatEntryDB.session_id == session_id, ChatEntryDB.seq > len(history), written)
+            .cte("entries_dropped")
+        )
+        rewrite = postgresql.insert(ChatEntryDB)
+        rewrite = rewrite.from_select(
+            ENTRY_COLUMNS,
+            entry_rows(previous.c.id, incoming, now).join(previous, true()).where(incoming.c.seq > previous.c.keep, written)
+        ).on_conflict_do_update(
+            index_elements=[ChatEntryDB.session_id, ChatEntryDB.seq],
+            set_={name: rewrite.excluded[name] for name in ENTRY_COLUMNS[2:]}
+        )
+        children.append(rewrite.cte("entries_written"))
+    if "living_document" in values:
+        script = previous.c.script
+        children.append(
+            insert(DocumentRevisionDB).from_select(
+                ["session_id", "revision", "kind", "depth", "data", "created_at"],
+                select(
+                    previous.c.id,
+                    func.coalesce(previous.c.last_revision, 0) + 1,
+                    case((script.is_(None), document_history.CHECKPOINT), else_=document_history.DELTA),
+                    case((script.is_(None), 0), else_=previous.c.last_depth + 1),
+                    cast(func.coalesce(script, func.to_jsonb(previous.c.document)), JSON),
+                    literal(now, DateTime),
+                )
+                .where(previous.c.living_document.is_distinct_from(previous.c.document), written)
+            ).cte("revision_written")
+        )
+    
+    return (
+        select(previous.c.id.label("found"), *updated.c)
+        .select_from(previous.outerjoin(updated, true()))
+        .add_cte(*children)
+    )
+
+# Conditional GET helpers
+def validators(row_version: int, last_modified: datetime) -> dict:
+    """Response headers that let clients revalidate instead of re-downloading"""
+    return {
+        "ETag": etag(row_version),
+        "Last-Modified": format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True),
+        # Browsers may store the body but must revalidate it, never reuse it heuristically
+        "Cache-Control": "no-cache",
+    }
+
+def not_modified(request: Request, row_version: int, last_modified: datetime) -> bool:
+    """RFC 9110 evaluation: If-None-Match when present, otherwise If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag(row_version) in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    # HTTP dates have whole-second precision
+    return last_modified.replace(microsecond=0) <= since
+
+async def conditional_response(db: AsyncSession, request: Request, session_id: str, view: str) -> Optional[Response]:
+    """A 304 or the cached body of ``view`` when either is still current, from one indexed lookup.
+
+    The lookup only reads ``row_version`` and ``last_modified``, and is skipped
+    when the request carries no validators and nothing is cached. Returns None
+    when the caller has to build the response.
+    """
+    row = None
+    conditional = "if-none-match" in request.headers or "if-modified-since" in request.headers
+    if conditional or read_cache.holds(session_id, view):
+        result = await db.execute(
+            select(NoteSessionDB.row_version, NoteSessionDB.last_modified).where(NoteSessionDB.id == session_id)
+        )
+        row = result.one_or_none()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        if not_modified(request, row.row_version, row.last_modified):
+            return Response(status_code=304, headers=validators(row.row_version, row.last_modified))
+    
+    body = read_cache.get(session_id, view, row.row_version if row else None)
+    if body is None:
+        return None
+    return Response(body, media_type="application/json", headers=validators(row.row_version, row.last_modified))
+
+def cache_response(view: str, session: Any, payload: Any) -> Response:
+    response = serialization.TrustedJSONResponse(payload, headers=validators(session.row_version, session.last_modified))
+    read_cache.put(session.id, view, session.row_version, response.body)
+    return response
+
+# Pagination helpers
+def encode_cursor(last_modified: datetime, session_id: str) -> str:
+    raw = json.dumps([last_modified.isoformat(), session_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        last_modified, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(last_modified), session_id
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Response helpers
+def session_payload(session: Any, chat_history: List[dict]) -> dict:
+    """``NoteSession`` JSON for a stored session row, without re-validating trusted data"""
+    return {
+        "id": session.id,
+        "lastModified": session.last_modified,
+        "context": session.context,
+        "chatHistory": serialization.chat_history_payload(chat_history),
+        "livingDocument": session.living_document,
+        "current_version": session.current_version,
+        "versions": serialization.versions_payload(session.versions),
+    }
+
+# Chat history helpers
+def chat_entry_row(session_id: str, seq: Optional[int], entry: dict) -> dict:
+    """Insert parameters for one entry; a ``seq`` of None is left to the statement"""
+    row = {
+        "session_id": session_id,
+        "entry_id": entry["id"],
+        "role": entry["role"],
+        "text": entry["text"],
+        "image": entry.get("image"),
+    }
+    if seq is not None:
+        row["seq"] = seq
+    return row
+
+def extract_attachments(entries: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """Copies of ``entries`` whose inline images reference their bytes by hash, and the attachment rows to store.
+
+    Each distinct image becomes one row, however many entries carry it.
+    """
+    stored = []
+    blobs: Dict[str, dict] = {}
+    for entry in entries:
+        image = entry.get("image")
+        if image and image.get("base64"):
+            try:
+                content_type = attachments.content_type(image)
+                data = attachments.decode_image(image)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            digest = attachments.content_hash(data)
+            blobs[digest] = {"hash": digest, "content_type": content_type, "size": len(data), "data": data}
+            entry = {**entry, "image": attachments.image_reference(image, digest, len(data))}
+        stored.append(entry)
+    return stored, list(blobs.values())
+
+async def save_attachments(db, blobs: List[dict]):
+    """Write attachment rows from extract_attachments.
+
+    One already stored has its ``created_at`` refreshed instead, which also
+    locks it against a concurrent collect_attachments.
+    """
+    if not blobs:
+        return
+    # Collection skips anything this fresh, and waits for this transaction before rechecking
+    result = await db.execute(
+        update(AttachmentDB)
+        .where(AttachmentDB.hash.in_([blob["hash"] for blob in blobs]))
+        .values(created_at=datetime.utcnow())
+        .returning(AttachmentDB.hash)
+        .execution_options(synchronize_session=False)
+    )
+    existing = set(result.scalars())
+    missing = [blob for blob in blobs if blob["hash"] not in existing]
+    if missing:
+        # A concurrent upload of the same image may get there first; its row is identical
+        dialect = db.dialect if isinstance(db, AsyncConnection) else db.bind.dialect
+        if dialect.name in ("postgresql", "sqlite"):
+            dialect_insert = postgresql.insert if dialect.name == "postgresql" else sqlite.insert
+            await db.execute(dialect_insert(AttachmentDB).on_conflict_do_nothing(), missing)
+        else:
+            await db.execute(insert(AttachmentDB), missing)
+
+async def store_attachments(db, entries: List[dict]) -> List[dict]:
+    """Move inline image payloads into the attachments table; see extract_attachments"""
+    stored, blobs = extract_attachments(entries)
+    await save_attachments(db, blobs)
+    return stored
+
+def attachment_upsert(blobs: List[dict], now: datetime, *conditions):
+    """save_attachments as one Postgres statement, to run as a CTE; ``conditions`` gate it"""
+    rows = Values(
+        literal_column("hash", String), literal_column("content_type", String), literal_column("size", Integer),
+        literal_column("data", LargeBinary), name="blobs",
+    ).data([(blob["hash"], blob["content_type"], blob["size"], blob["data"]) for blob in blobs])
+    upsert = postgresql.insert(AttachmentDB)
+    return upsert.from_select(
+        ["hash", "content_type", "size", "data", "created_at"],
+        select(rows, literal(now, DateTime)).where(*conditions)
+    ).on_conflict_do_update(index_elements=[AttachmentDB.hash], set_={"created_at": upsert.excluded.created_at})
+
+async def load_chat_histories(db: AsyncSession, session_ids: List[str]) -> Dict[str, List[dict]]:
+    histories: Dict[str, List[dict]] = {session_id: [] for session_id in session_ids}
+    if not session_ids:
+        return histories
+    result = await db.execute(
+        select(ChatEntryDB)
+        .where(ChatEntryDB.session_id.in_(session_ids))
+        .order_by(ChatEntryDB.session_id, ChatEntryDB.seq)
+    )
+    for row in result.scalars():
+        histories[row.session_id].append(row.to_dict())
+    return histories
+
+async def load_chat_history(db: AsyncSession, session_id: str) -> List[dict]:
+    return (await load_chat_histories(db, [session_id]))[session_id]
+
+def entry_content(entry: dict) -> tuple:
+    """What a stored entry must match to be kept: id, role, text and the image reference"""
+    image = entry.get("image")
+    if image:
+        image = {key: value for key, value in image.items() if value is not None and key != "base64"}
+    return entry["id"], entry["role"], entry["text"], image or None
+
+async def load_stored_entries(db: AsyncSession, session_id: str) -> List[Tuple[int, dict]]:
+    """The stored history as ``(seq, entry)`` pairs, for replace_chat_history"""
+    result = await db.execute(
+        select(ChatEntryDB)
+        .where(ChatEntryDB.session_id == session_id)
+        .order_by(ChatEntryDB.seq)
+    )
+    return [(row.seq, row.to_dict()) for row in result.scalars()]
+
+def kept_prefix(stored: List[Tuple[int, dict]], entries: List[dict]) -> int:
+    """How many leading stored entries ``entries`` leaves unchanged"""
+    keep = 0
+    for (seq, stored_entry), entry in zip(stored, entries):
+        if entry_content(stored_entry) != entry_content(entry):
+            break
+        keep += 1
+    return keep
+
+# Columns entry_rows selects, in order
+ENTRY_COLUMNS = ["session_id", "seq", "entry_id", "role", "text", "image", "created_at"]
+
+def json_entries(entries: List[dict]):
+    """``entries`` sent to Postgres as one jsonb parameter, as rows of ``value`` and ``seq`` (from 1)"""
+    payload = [{"id": entry["id"], "role": entry["role"], "text": entry["text"], "image": entry.get("image")} for entry in entries]
+    return (
+        func.jsonb_array_elements(literal(payload, JSONB))
+        .table_valued(literal_column("value", JSONB), with_ordinality="seq")
+        .render_derived()
+    )
+
+def entry_rows(session_id: Any, rows: Any, now: datetime, after: Any = 0):
+    """Select of ENTRY_COLUMNS for json_entries ``rows``, numbered from ``after`` + 1"""
+    value = rows.c.value
+    return select(
+        session_id,
+        after + rows.c.seq,
+        value["id"].astext,
+        value["role"].astext,
+        value["text"].astext,
+        cast(value["image"], JSON),
+        literal(now, DateTime),
+    ).select_from(rows)
+
+def image_content(image: Any):
+    """entry_content's image in Postgres: the jsonb object without nulls or payload, NULL if that leaves nothing"""
+    return case((
+        func.jsonb_typeof(image) == "object",
+        func.nullif(func.jsonb_strip_nulls(image).op("-")(literal_column("'base64'")), literal_column("'{}'::jsonb")),
+    ))
+
+def kept_prefix_sql(session_id: str, rows: Any, count: int):
+    """kept_prefix in Postgres, of json_entries ``rows`` (``count`` of them) against the stored history.
+
+    Sequence numbers run from 1 without gaps, so the prefix ends before the
+    first position where the two differ or only one has an entry.
+    """
+    stored = (
+        select(
+            ChatEntryDB.seq, ChatEntryDB.entry_id, ChatEntryDB.role, ChatEntryDB.text,
+            cast(ChatEntryDB.image, JSONB).label("image"),
+        )
+        .where(ChatEntryDB.session_id == session_id)
+        .subquery("stored")
+    )
+    value = rows.c.value
+    same = and_(
+        stored.c.entry_id == value["id"].astext,
+        stored.c.role == value["role"].astext,
+        stored.c.text == value["text"].astext,
+        image_content(stored.c.image).is_not_distinct_from(image_content(value["image"])),
+    )
+    first_difference = (
+        select(func.min(func.coalesce(rows.c.seq, stored.c.seq)))
+        .select_from(rows.join(stored, stored.c.seq == rows.c.seq, full=True))
+        .where(or_(rows.c.seq.is_(None), stored.c.seq.is_(None), ~same))
+        .scalar_subquery()
+    )
+    return func.coalesce(first_difference - 1, count)
+
+async def replace_chat_history(
+    db: AsyncSession,
+    session_id: str,
+    entries: List[dict],
+    stored: Optional[List[Tuple[int, dict]]] = None
+):
+    """Make the stored history equal to ``entries``.
+
+    The prefix of entries that are unchanged is left in place; everything from
+    the first entry that differs (in id or content) is deleted and re-inserted.
+    Callers that read ``stored`` (load_stored_entries) before a conditional
+    write of the session pass it in, and have already capped
+    ``versioned_chat_length`` at kept_prefix in that write.
+    """
+    lower_versioned = stored is None
+    if stored is None:
+        stored = await load_stored_entries(db, session_id)
+    keep = kept_prefix(stored, entries)
+    
+    if keep < len(stored):
+        stale = delete(ChatEntryDB).where(ChatEntryDB.session_id == session_id)
+        if keep:
+            stale = stale.where(ChatEntryDB.seq > stored[keep - 1][0])
+        await db.execute(stale)
+        if lower_versioned:
+            # The newest version can now share at most the kept prefix
+            await db.execute(
+                update(NoteSessionDB)
+                .where(NoteSessionDB.id == session_id, NoteSessionDB.versioned_chat_length > keep)
+                .values(versioned_chat_length=keep)
+            )
+    if keep < len(entries):
+        next_seq = stored[keep - 1][0] + 1 if keep else 1
+        await db.execute(
+            insert(ChatEntryDB),
+            [chat_entry_row(session_id, next_seq + i, entry) for i, entry in enumerate(entries[keep:])]
+        )
+
+async def append_chat_entries(db: AsyncSession, session_id: str, entries: List[dict]):
+    """Insert ``entries`` after the stored history without reading it first.
+
+    Each row's sequence number is computed in SQL from the (session_id, seq)
+    primary key index; a concurrent append surfaces as an IntegrityError.
+    """
+    next_seq = (
+        select(func.coalesce(func.max(ChatEntryDB.seq), 0) + 1)
+        .where(ChatEntryDB.session_id == session_id)
+        .scalar_subquery()
+    )
+    await db.execute(
+        insert(ChatEntryDB).values(seq=next_seq),
+        [chat_entry_row(session_id, None, entry) for entry in entries]
+    )
+
+# Document history helpers
+async def record_document_revision(
+    db: AsyncSession,
+    session_id: str,
+    previous: Optional[str],
+    text: str,
+    last_revision: Optional[int],
+    last_depth: Optional[int]
+):
+    """Append ``text`` to the session's document history as an edit script against ``previous``.
+
+    ``last_revision``/``last_depth`` describe the latest stored revision (see
+    ``revision_head``); callers select them with the row they write so this
+    costs a single INSERT.
+    """
+    if previous == text:
+        return
+    kind, depth, data = document_history.encode_revision(
+        previous if last_revision else None, text, last_depth if last_revision else None
+    )
+    await db.execute(
+        insert(DocumentRevisionDB).values(
+            session_id=session_id,
+            revision=(last_revision or 0) + 1,
+            kind=kind,
+            depth=depth,
+            data=data,
+        )
+    )
+
+# Version checkpoint helpers
+def chat_history_json(dialect: str, session_id: str, after: Any = 0):
+    """Scalar subquery aggregating the session's entries with ``seq > after`` into a JSON array"""
+    entry = sql_json.build_object(
+        dialect,
+        id=ChatEntryDB.entry_id,
+        role=ChatEntryDB.role,
+        text=ChatEntryDB.text,
+        image=sql_json.as_json(dialect, ChatEntryDB.image),
+    )
+    rows = (
+        select(entry.label("entry"), ChatEntryDB.seq)
+        .where(ChatEntryDB.session_id == session_id)
+        .order_by(ChatEntryDB.seq)
+        .subquery()
+    )
+    # ``after`` may be a note_sessions column, so it filters outside the derived table
+    return (
+        select(sql_json.aggregate_array(dialect, rows.c.entry, rows.c.seq))
+        .where(rows.c.seq > after)
+        .scalar_subquery()
+    )
+
+def checkpoint_values(
+    dialect: str,
+    session_id: str,
+    version_id: str,
+    timestamp: datetime,
+    checkpoint_name: Optional[str],
+    auto_checkpoint: bool
+) -> Optional[dict]:
+    """UPDATE values that append a version of the current state to the chain in SQL.
+
+    The record is built and appended by the database (``jsonb ||`` on
+    Postgres), with the version number taken from ``current_version``, so a
+    checkpoint never transfers the existing history in either direction. It is
+    a version_store delta: the chat entries past ``versioned_chat_length`` and,
+    unless ``document_versioned``, the document as a line edit script against
+    ``versioned_document`` (``line_edit_script``, see document_history.py). Only
+    a document with no line left from its parent is stored as a one-op script
+    inserting the whole text. A keyframe is written instead when version_store
+    would write one, or when the parent's document is unknown. Returns None
+    for backends without server-side JSON; callers then append in Python.
+    """
+    if not sql_json.supports(dialect):
+        return None
+    
+    versions = NoteSessionDB.versions
+    base = NoteSessionDB.versioned_chat_length
+    parent_depth = func.coalesce(sql_json.last_element_field(dialect, versions, "depth", Integer), 0)
+    metadata = dict(
+        id=literal(version_id, String),
+        version_number=NoteSessionDB.current_version + 1,
+        timestamp=literal(timestamp.isoformat(), String),
+        modelUsed=NoteSessionDB.context["selectedModel"].as_string(),
+        checkpoint_name=literal(checkpoint_name, String),
+        auto_checkpoint=literal(auto_checkpoint, Boolean),
+    )
+    keyframe = sql_json.build_object(
+        dialect,
+        **metadata,
+        kind=literal("keyframe", String),
+        depth=literal(0, Integer),
+        chatHistory=chat_history_json(dialect, session_id),
+        livingDocument=NoteSessionDB.living_document,
+    )
+    delta = sql_json.build_object(
+        dialect,
+        **metadata,
+        kind=literal("delta", String),
+        depth=parent_depth + 1,
+        parent_id=sql_json.last_element_field(dialect, versions, "id", String),
+        chat=sql_json.build_object(dialect, base=base, append=chat_history_json(dialect, session_id, base)),
+        doc=case(
+            (NoteSessionDB.document_versioned, null()),
+            else_=sql_json.as_json(dialect, func.coalesce(
+                func.line_edit_script(NoteSessionDB.versioned_document, NoteSessionDB.living_document, type_=JSON),
+                # A single inserted "line" holding the whole text replaces the parent's document
+                sql_json.build_array(dialect, sql_json.build_array(dialect, NoteSessionDB.living_document)),
+            )),
+        ),
+    )
+    record = case(
+        (
+            or_(
+                sql_json.array_length(dialect, versions) == 0,
+                parent_depth + 1 >= version_store.KEYFRAME_INTERVAL,
+                base == 0,
+                NoteSessionDB.versioned_document.is_(None),
+            ),
+            keyframe,
+        ),
+        else_=delta,
+    )
+    return {
+        "versions": sql_json.array_append(dialect, versions, record),
+        "current_version": NoteSessionDB.current_version + 1,
+        "versioned_chat_length": (
+            select(func.count()).where(ChatEntryDB.session_id == session_id).scalar_subquery()
+        ),
+        "document_versioned": True,
+        "versioned_document": NoteSessionDB.living_document,
+    }
+
 # Create FastAPI app
 app = FastAPI(title="aiMMar Backend", version="2.0.0")
 
@@ -146,8 +1053,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "Server-Timing", "X-LLM-Cache"],
 )
 
+# gzip/br/zstd responses, and gzip/zstd request bodies for compressed autosaves
+app.add_middleware(compression.CompressionMiddleware)
+# Query count and DB time per request in the Server-Timing header
+app.add_middleware(db_timing.ServerTimingMiddleware)
+# Outside compression, so body sizes are measured as sent
+app.add_middleware(metrics.MetricsMiddleware, router=app.router)
+# Outermost, so the first request is timed end to end
+app.add_middleware(startup_profile.FirstRequestMiddleware)
+
 # Create router
 api_router = APIRouter(prefix="/api")
 
@@ -161,6 +1078,29 @@ async def health_check():
     """Health check endpoint for Cloud Run"""
     return {"status": "healthy", "service": "aiMMar Backend", "version": "2.0.0"}
 
+@api_router.get("/startup-profile")
+async def get_startup_profile():
+    """Cold-start timings of this instance: interpreter, imports, startup hook, first request"""
+    return startup_profile.profile.report()
+
+@api_router.get("/db/pool")
+async def database_pool_stats():
+    """Connection pool occupancy and checkout wait times on this instance"""
+    return db_pool.pool_stats(get_engine())
+
+@api_router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the session read cache on this instance"""
+    return read_cache.stats()
+
+@api_router.get("/metrics")
+async def prometheus_metrics():
+    """Request, pool, cache and LLM usage metrics of this instance in the Prometheus text format"""
+    pool = db_pool.pool_stats(_engine) if _engine is not None else None
+    completions = await asyncio.to_thread(response_cache.stats) if response_cache is not None else None
+    body = metrics.render(pool, read_cache.stats(), prompts.system_prompt_stats, completions)
+    return Response(body, headers={"Content-Type": metrics.CONTENT_TYPE})
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate, db: AsyncSession = Depends(get_db)):
     status_obj = StatusCheckDB(client_name=input.client_name)
@@ -186,209 +1126,925 @@ async def get_status_checks(db: AsyncSession = Depends(get_db)):
 # Session Management Endpoints
 @api_router.post("/sessions", response_model=NoteSession)
 async def create_session(input: SessionCreate, db: AsyncSession = Depends(get_db)):
+    chat_history, blobs = extract_attachments([entry.model_dump() for entry in input.chatHistory])
+    
     # Create initial version
     initial_version = ChatVersion(
         version_number=1,
-        chatHistory=input.chatHistory,
+        chatHistory=chat_history,
         livingDocument=input.livingDocument,
         modelUsed=input.context.selectedModel,
         checkpoint_name="Initial Version",
         auto_checkpoint=False
     )
     
-    session_obj = NoteSessionDB(
+    # Generated here rather than by the database so the response needs no refresh
+    session = SimpleNamespace(
+        id=str(uuid.uuid4()),
+        last_modified=datetime.utcnow(),
         context=input.context.model_dump(),
-        chat_history=[entry.model_dump() for entry in input.chatHistory],
+        chat_history=[],
         living_document=input.livingDocument,
         current_version=1,
-        versions=[initial_version.model_dump()]
+        versions=version_store.append_version([], initial_version.model_dump(mode="json")),
+        row_version=1,
+        versioned_chat_length=len(chat_history),
+        document_versioned=True,
+        versioned_document=input.livingDocument
+    )
+    kind, depth, data = document_history.encode_revision(None, input.livingDocument, None)
+    statement = insert(NoteSessionDB).values(**vars(session))
+    revision = insert(DocumentRevisionDB).values(
+        session_id=session.id, revision=1, kind=kind, depth=depth, data=data, created_at=session.last_modified
     )
     
-    db.add(session_obj)
+    if db.bind.dialect.name == "postgresql":
+        # One statement: the first revision, entries and attachments are CTEs of the session's INSERT
+        children = [revision.cte("revision_written")]
+        if chat_history:
+            rows = json_entries(chat_history)
+            children.append(
+                insert(ChatEntryDB)
+                .from_select(ENTRY_COLUMNS, entry_rows(literal(session.id, String), rows, session.last_modified))
+                .cte("entries_written")
+            )
+        if blobs:
+            children.append(attachment_upsert(blobs, session.last_modified).cte("attachments_written"))
+        await db.execute(statement.add_cte(*children))
+    else:
+        await db.execute(statement)
+        await db.execute(revision)
+        if chat_history:
+            await db.execute(
+                insert(ChatEntryDB),
+                [chat_entry_row(session.id, seq, entry) for seq, entry in enumerate(chat_history, start=1)]
+            )
+        await save_attachments(db, blobs)
     await db.commit()
-    await db.refresh(session_obj)
     
-    return NoteSession(
-        id=session_obj.id,
-        lastModified=session_obj.last_modified,
-        context=NoteContext(**session_obj.context),
-        chatHistory=[ChatEntry(**entry) for entry in session_obj.chat_history],
-        livingDocument=session_obj.living_document,
-        current_version=session_obj.current_version,
-        versions=[ChatVersion(**version) for version in session_obj.versions]
+    return serialization.TrustedJSONResponse(
+        session_payload(session, chat_history),
+        headers=validators(session.row_version, session.last_modified)
     )
 
-@api_router.get("/sessions", response_model=List[NoteSession])
-async def get_sessions(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(NoteSessionDB))
+@api_router.get("/sessions", response_model=SessionPage)
+async def get_sessions(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """List sessions newest first, one keyset page at a time"""
+    query = (
+        select(NoteSessionDB)
+        .order_by(NoteSessionDB.last_modified.desc(), NoteSessionDB.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        query = query.where(tuple_(NoteSessionDB.last_modified, NoteSessionDB.id) < tuple_(*decode_cursor(cursor)))
+    
+    result = await db.execute(query)
     sessions = result.scalars().all()
-    return [NoteSession(
-        id=session.id,
-        lastModified=session.last_modified,
-        context=NoteContext(**session.context),
-        chatHistory=[ChatEntry(**entry) for entry in session.chat_history],
-        livingDocument=session.living_document,
-        current_version=session.current_version,
-        versions=[ChatVersion(**version) for version in session.versions]
-    ) for session in sessions]
+    next_cursor = None
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        next_cursor = encode_cursor(sessions[-1].last_modified, sessions[-1].id)
+    
+    histories = await load_chat_histories(db, [session.id for session in sessions])
+    return serialization.TrustedJSONResponse({
+        "sessions": [session_payload(session, histories[session.id]) for session in sessions],
+        "next_cursor": next_cursor,
+    })
+
+# Sessions fetched per round trip while exporting; bounds the export's memory use
+EXPORT_BATCH_SIZE = 50
+
+async def export_sessions(ndjson: bool):
+    """Encoded sessions, newest first, fetched through a server-side cursor.
+
+    Each batch of ``EXPORT_BATCH_SIZE`` rows gets its chat entries in one query
+    and is released once written, so memory stays flat however many sessions
+    there are. Every session is yielded as its own chunk, separator included,
+    so the first bytes go out before the rest of its batch is encoded.
+    """
+    async with async_session() as db:
+        # Plain rows rather than entities: the identity map is emptied per batch
+        result = await db.stream(
+            select(*SESSION_COLUMNS)
+            .order_by(NoteSessionDB.last_modified.desc(), NoteSessionDB.id.desc())
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        first = True
+        if not ndjson:
+            yield b"["
+        async for sessions in result.partitions():
+            histories = await load_chat_histories(db, [session.id for session in sessions])
+            for session in sessions:
+                body = serialization.dumps(session_payload(session, histories.pop(session.id)))
+                if ndjson:
+                    yield body + b"\n"
+                else:
+                    yield body if first else b"," + body
+                first = False
+            db.expunge_all()
+        if not ndjson:
+            yield b"]"
+
+@api_router.get("/sessions/export", response_model=List[NoteSession])
+async def export_all_sessions(request: Request):
+    """Stream every session as a JSON array, or as NDJSON when the client accepts application/x-ndjson"""
+    ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+    return StreamingResponse(
+        export_sessions(ndjson),
+        media_type="application/x-ndjson" if ndjson else "application/json",
+        headers={"Vary": "Accept"}
+    )
 
 @api_router.get("/sessions/{session_id}", response_model=NoteSession)
-async def get_session(session_id: str, db: AsyncSession = Depends(get_db)):
+async def get_session(session_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    cached = await conditional_response(db, request, session_id, "session")
+    if cached is not None:
+        return cached
+    
     result = await db.execute(select(NoteSessionDB).where(NoteSessionDB.id == session_id))
     session = result.scalar_one_or_none()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return NoteSession(
-        id=session.id,
-        lastModified=session.last_modified,
-        context=NoteContext(**session.context),
-        chatHistory=[ChatEntry(**entry) for entry in session.chat_history],
-        livingDocument=session.living_document,
-        current_version=session.current_version,
-        versions=[ChatVersion(**version) for version in session.versions]
-    )
+    chat_history = await load_chat_history(db, session_id)
+    return cache_response("session", session, session_payload(session, chat_history))
 
 @api_router.put("/sessions/{session_id}", response_model=NoteSession)
-async def update_session(session_id: str, session_update: dict, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(NoteSessionDB).where(NoteSessionDB.id == session_id))
-    session = result.scalar_one_or_none()
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+async def update_session(
+    session_id: str,
+    session_update: SessionUpdate,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    expected = parse_if_match(if_match)
+    session_update = session_update.model_dump(exclude_none=True)
+    chat_history = session_update.pop("chat_history", None)
+    blobs = []
+    if chat_history is not None:
+        chat_history, blobs = extract_attachments(chat_history)
     
-    # Update session fields
-    update_dict = {
-        "last_modified": datetime.utcnow(),
-        **session_update
-    }
+    if "living_document" in session_update:
+        session_update["document_versioned"] = False
     
-    await db.execute(
-        update(NoteSessionDB)
-        .where(NoteSessionDB.id == session_id)
-        .values(**update_dict)
+    # One UPDATE ... RETURNING both writes the row and supplies the response,
+    # including the stored history when the request leaves it alone. Chat
+    # history is stored row-per-message; only the changed tail is rewritten.
+    dialect = db.bind.dialect.name
+    columns = SESSION_COLUMNS
+    if chat_history is None and sql_json.supports(dialect):
+        columns += (chat_history_json(dialect, session_id).label("stored_history"),)
+    session = await update_session_row(
+        db, session_id, expected, columns,
+        history=chat_history,
+        blobs=blobs,
+        last_modified=datetime.utcnow(),
+        **session_update
     )
+    if session is None:
+        raise await missing_or_conflict(db, session_id, expected)
+    
+    if chat_history is None:
+        chat_history = session.stored_history if hasattr(session, "stored_history") else await load_chat_history(db, session_id)
     await db.commit()
     
-    # Fetch updated session
-    result = await db.execute(select(NoteSessionDB).where(NoteSessionDB.id == session_id))
-    updated_session = result.scalar_one()
+    return serialization.TrustedJSONResponse(
+        session_payload(session, chat_history),
+        headers=validators(session.row_version, session.last_modified)
+    )
+
+PATCHABLE_FIELDS = {"livingDocument", "chatHistory", "context"}
+
+def _patched_fields(operation: dict) -> set:
+    """Top-level session fields an operation reads or writes"""
+    fields = set()
+    for pointer in (operation["path"], operation.get("from")):
+        if pointer is None:
+            continue
+        tokens = json_patch.parse_pointer(pointer)
+        if not tokens or tokens[0] not in PATCHABLE_FIELDS:
+            raise json_patch.JsonPatchError(f"Path not patchable: {pointer!r}")
+        fields.add(tokens[0])
+    return fields
+
+def _is_chat_append(operation: dict) -> bool:
+    return operation["op"] == "add" and operation["path"] == "/chatHistory/-"
+
+def _is_document_write(operation: dict) -> bool:
+    return operation["op"] in ("add", "replace") and operation["path"] == "/livingDocument"
+
+@api_router.patch("/sessions/{session_id}", response_model=SessionPatchResult)
+async def patch_session(
+    session_id: str,
+    operations: List[PatchOperation],
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Apply a JSON Patch so a turn uploads only what changed, not the whole session"""
+    expected = parse_if_match(if_match)
+    ops = [operation.to_dict() for operation in operations]
+    try:
+        for operation in ops:
+            json_patch.validate_operation(operation)
+        fields = [_patched_fields(operation) for operation in ops]
+    except json_patch.JsonPatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    touched = set().union(*fields)
     
-    return NoteSession(
-        id=updated_session.id,
-        lastModified=updated_session.last_modified,
-        context=NoteContext(**updated_session.context),
-        chatHistory=[ChatEntry(**entry) for entry in updated_session.chat_history],
-        livingDocument=updated_session.living_document,
-        current_version=updated_session.current_version,
-        versions=[ChatVersion(**version) for version in updated_session.versions]
+    # A turn (history appends plus a new document) depends on nothing stored, so skip the read
+    blind = all(_is_chat_append(operation) or _is_document_write(operation) for operation in ops)
+    row = None
+    if blind:
+        document = {}
+        for operation in ops:
+            if _is_document_write(operation):
+                document["livingDocument"] = operation["value"]
+    else:
+        result = await db.execute(
+            select(
+                NoteSessionDB.context,
+                NoteSessionDB.living_document,
+                NoteSessionDB.row_version,
+                *revision_head(session_id)
+            )
+            .where(NoteSessionDB.id == session_id)
+        )
+        row = result.one_or_none()
+        if not row:
+            raise HTTPException(status_code=404, detail="Session not found")
+        check_if_match(expected, row.row_version)
+        document = {"context": dict(row.context), "livingDocument": row.living_document}
+    
+    # Pure appends to the history are inserted directly; anything else needs the full history
+    append_only = all(
+        _is_chat_append(operation) or "chatHistory" not in operation_fields
+        for operation, operation_fields in zip(ops, fields)
     )
+    if append_only:
+        appended = [operation["value"] for operation in ops if _is_chat_append(operation)]
+        ops = [operation for operation in ops if not _is_chat_append(operation)]
+    elif "chatHistory" in touched:
+        document["chatHistory"] = await load_chat_history(db, session_id)
+    
+    try:
+        if not blind:
+            json_patch.apply_patch(document, ops)
+            if not isinstance(document.get("context"), dict):
+                raise json_patch.JsonPatchError("context must be an object")
+            context = NoteContext(**document["context"]).model_dump()
+        if "livingDocument" in touched and not isinstance(document.get("livingDocument"), str):
+            raise json_patch.JsonPatchError("livingDocument must be a string")
+        if append_only:
+            chat_entries = [ChatEntry(**entry).model_dump() for entry in appended]
+        elif isinstance(document.get("chatHistory"), list):
+            chat_entries = [ChatEntry(**entry).model_dump() for entry in document["chatHistory"]]
+        else:
+            raise json_patch.JsonPatchError("chatHistory must be a list")
+    except json_patch.JsonPatchTestFailed as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (json_patch.JsonPatchError, ValidationError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    update_dict = {"last_modified": datetime.utcnow()}
+    if "context" in touched:
+        update_dict["context"] = context
+    if "livingDocument" in touched:
+        update_dict["living_document"] = document["livingDocument"]
+        update_dict["document_versioned"] = False
+    children = {}
+    if "chatHistory" in touched:
+        chat_entries, children["blobs"] = extract_attachments(chat_entries)
+        children["append" if append_only else "history"] = chat_entries
+    
+    try:
+        written = await update_session_row(db, session_id, expected, read=row, **children, **update_dict)
+        if written is None:
+            raise await missing_or_conflict(db, session_id, expected)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Concurrent append, please retry")
+    
+    response.headers["ETag"] = etag(written.row_version)
+    return SessionPatchResult(id=session_id, lastModified=update_dict["last_modified"])
 
 @api_router.delete("/sessions/{session_id}")
-async def delete_session(session_id: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(delete(NoteSessionDB).where(NoteSessionDB.id == session_id))
+async def delete_session(session_id: str, if_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    expected = parse_if_match(if_match)
+    query = delete(NoteSessionDB).where(NoteSessionDB.id == session_id)
+    if expected is not None:
+        query = query.where(NoteSessionDB.row_version == expected)
+    result = await db.execute(query)
     if result.rowcount == 0:
-        raise HTTPException(status_code=404, detail="Session not found")
+        raise await missing_or_conflict(db, session_id, expected)
+    read_cache.invalidate(session_id)
+    # Chat entries and document revisions go with it through ON DELETE CASCADE
     await db.commit()
     return {"message": "Session deleted successfully"}
 
+@api_router.post("/sessions/{session_id}/messages", response_model=ChatEntry)
+async def append_message(
+    session_id: str,
+    entry: ChatEntry,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Append one message to the session's history without rewriting the existing entries"""
+    expected = parse_if_match(if_match)
+    stored, blobs = extract_attachments([entry.model_dump()])
+    try:
+        written = await update_session_row(
+            db, session_id, expected, append=stored, blobs=blobs, last_modified=datetime.utcnow()
+        )
+        if written is None:
+            raise await missing_or_conflict(db, session_id, expected)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Concurrent append, please retry")
+    
+    response.headers["ETag"] = etag(written.row_version)
+    return ChatEntry(**stored[0])
+
+# Chat Endpoints
+def sse_event(event: str, data: Any) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + serialization.dumps(data) + b"\n\n"
+
+async def replay_completion(text: str):
+    """A stored answer, in place of the upstream's stream"""
+    yield text
+
+async def record_turn(session_id: str, entries: List[dict], living_document: Optional[str]) -> tuple:
+    """Append a finished turn and its document in one transaction; returns the row version and stored entries.
+
+    Raises 404 when the session was deleted meanwhile, and 409 when concurrent
+    writes kept moving it on through every retry of update_session_row.
+    """
+    values = {"last_modified": datetime.utcnow()}
+    if living_document is not None:
+        values.update(living_document=living_document, document_versioned=False)
+    entries, blobs = extract_attachments(entries)
+    async with async_session() as db:
+        written = await update_session_row(db, session_id, None, append=entries, blobs=blobs, **values)
+        if written is None:
+            raise await missing_or_conflict(db, session_id, None)
+        await db.commit()
+    return written.row_version, entries
+
+def current_summaries():
+    """Summaries whose entries are all still stored.
+
+    Replacing part of the history re-inserts every entry after the first change,
+    so a summary is stale once the entry it ends with is newer than it.
+    """
+    return (
+        select(ChatSummaryDB.session_id, ChatSummaryDB.text, ChatSummaryDB.through_seq)
+        .join(ChatEntryDB, (ChatEntryDB.session_id == ChatSummaryDB.session_id) & (ChatEntryDB.seq == ChatSummaryDB.through_seq))
+        .where(ChatEntryDB.created_at <= ChatSummaryDB.updated_at)
+        .subquery()
+    )
+
+async def summarise_history(session_id: str, model: str, through_seq: int, api_key: Optional[str]):
+    """Roll the session's summary forward to cover the entries up to ``through_seq``"""
+    async with async_session() as db:
+        summaries = current_summaries()
+        result = await db.execute(select(summaries.c.text, summaries.c.through_seq).where(summaries.c.session_id == session_id))
+        previous = result.one_or_none()
+        result = await db.execute(
+            select(ChatEntryDB)
+            .where(
+                ChatEntryDB.session_id == session_id,
+                ChatEntryDB.seq > (previous.through_seq if previous else 0),
+                ChatEntryDB.seq <= through_seq,
+            )
+            .order_by(ChatEntryDB.seq)
+        )
+        older = result.scalars().all()
+    if not older:
+        return
+    
+    messages = prompts.summary_messages(
+        previous.text if previous else None, [row.to_dict() for row in older], context_window.SUMMARY_TOKENS * 3 // 4
+    )
+    payload = llm_client.completion_request(model, messages, max_tokens=context_window.SUMMARY_TOKENS, json_reply=False)
+    usage = llm_client.Usage()
+    summary = "".join([delta async for delta in llm_client.stream_completion(payload, api_key, usage=usage)]).strip()
+    metrics.record_completion(model, "summary", usage)
+    if not summary:
+        return
+    
+    last = older[-1]
+    async with async_session() as db:
+        # The history may have been replaced while the model was writing
+        current = await db.execute(
+            select(ChatEntryDB.entry_id, ChatEntryDB.created_at)
+            .where(ChatEntryDB.session_id == session_id, ChatEntryDB.seq == last.seq)
+        )
+        if current.one_or_none() != (last.entry_id, last.created_at):
+            return
+        await db.execute(delete(ChatSummaryDB).where(ChatSummaryDB.session_id == session_id))
+        await db.execute(
+            insert(ChatSummaryDB).values(session_id=session_id, through_seq=last.seq, text=summary, model=model)
+        )
+        await db.commit()
+
+async def run_summary(session_id: str, model: str, through_seq: int, api_key: Optional[str]):
+    try:
+        await summarise_history(session_id, model, through_seq, api_key)
+    except Exception as e:
+        # The turns stay unsummarised and the next chat request tries again
+        logging.warning("Summarising session %s failed: %s", session_id, e)
+    finally:
+        summary_tasks.pop(session_id, None)
+
+def schedule_summary(session_id: str, model: str, through_seq: int, api_key: Optional[str]):
+    """Start a summary job unless one is already running for the session"""
+    if session_id not in summary_tasks:
+        summary_tasks[session_id] = asyncio.create_task(run_summary(session_id, model, through_seq, api_key))
+
+async def chat_events(
+    session_id: str,
+    user_entry: dict,
+    first: Optional[str],
+    stream,
+    model: str,
+    usage: llm_client.Usage,
+    first_token: float,
+    cache_key: Optional[str] = None
+):
+    """Relay the answer as ``reply``/``document`` deltas, then store the turn and report it in a final ``done`` event"""
+    parser = reply_parser.ReplyParser()
+    try:
+        if first is not None:
+            for field, chunk_text in parser.feed(first):
+                yield sse_event(field, {"text": chunk_text})
+            async for delta in stream:
+                for field, chunk_text in parser.feed(delta):
+                    yield sse_event(field, {"text": chunk_text})
+    except llm_client.UpstreamError as e:
+        yield sse_event("error", {"status": e.status, "detail": e.detail})
+        return
+    metrics.record_completion(model, "chat", usage, first_token)
+    
+    answer = parser.finish()
+    if not answer.reply.strip() and answer.document is None:
+        yield sse_event("error", {"status": 502, "detail": "The model returned an empty response"})
+        return
+    # A repaired answer is not replayed: the next identical request gets a fresh attempt
+    if cache_key is not None and not answer.repaired:
+        try:
+            await asyncio.to_thread(response_cache.put, cache_key, model, "".join(parser.raw))
+        except Exception as e:
+            logging.warning("Storing the completion failed: %s", e)
+    # Without a complete document the stored one is kept rather than truncated
+    model_entry = {"id": str(uuid.uuid4()), "role": "model", "text": answer.reply, "image": None}
+    try:
+        row_version, entries = await record_turn(session_id, [user_entry, model_entry], answer.document)
+    except IntegrityError:
+        yield sse_event("error", {"status": 409, "detail": "Concurrent append, the turn was not saved"})
+        return
+    except HTTPException as e:
+        detail = "Session was deleted" if e.status_code == 404 else f"{e.detail}; the turn was not saved"
+        yield sse_event("error", {"status": e.status_code, "detail": detail})
+        return
+    yield sse_event("done", {
+        "reply": answer.reply,
+        "document": answer.document,
+        "repaired": answer.repaired,
+        "usage": usage.payload(),
+        "chatEntries": serialization.chat_history_payload(entries),
+        "etag": etag(row_version),
+    })
+
+@api_router.post("/sessions/{session_id}/chat")
+async def chat(
+    session_id: str,
+    turn: ChatTurn,
+    request: Request,
+    x_llm_api_key: Optional[str] = Header(None),
+    x_llm_cache: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Answer a message with the session's model, streaming the reply and document as Server-Sent Events"""
+    if not rate_limit.CHAT_ENABLED:
+        raise HTTPException(status_code=403, detail="Chat is disabled on this server")
+    if not x_llm_api_key:
+        # Only requests spending the server's key are limited; callers with their own key pay for it
+        if not rate_limit.CHAT_SERVER_KEY:
+            raise HTTPException(status_code=401, detail="Send an LLM API key in X-LLM-Api-Key")
+        client_host = rate_limit.client_address(
+            request.client.host if request.client else None, request.headers.get("x-forwarded-for")
+        )
+        retry_after = rate_limit.chat_limiter.hit(f"client:{client_host}", f"session:{session_id}")
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many chat requests, please retry later",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+    
+    summaries = current_summaries()
+    result = await db.execute(
+        select(NoteSessionDB.context, NoteSessionDB.living_document, summaries.c.text.label("summary"), summaries.c.through_seq)
+        .outerjoin(summaries, summaries.c.session_id == NoteSessionDB.id)
+        .where(NoteSessionDB.id == session_id)
+    )
+    session = result.one_or_none()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    # Entries the summary covers are never loaded
+    result = await db.execute(
+        select(ChatEntryDB)
+        .where(ChatEntryDB.session_id == session_id, ChatEntryDB.seq > (session.through_seq or 0))
+        .order_by(ChatEntryDB.seq)
+    )
+    rows = result.scalars().all()
+    unsummarised = [row.to_dict() for row in rows]
+    # Give the connection back while the model is thinking; the turn is stored with a new one
+    await db.close()
+    
+    model = turn.model or session.context.get("selectedModel")
+    user_entry = {"id": str(uuid.uuid4()), "role": "user", "text": turn.text, "image": turn.image.model_dump() if turn.image else None}
+    hints = prompts.cache_hints(model)
+    fixed = prompts.build_messages(
+        session.context, [], session.living_document, turn.text, user_entry["image"], session.summary, hints
+    )
+    recent = context_window.recent_entries(
+        model, unsummarised, context_window.TOKEN_BUDGET - context_window.count_messages(model, fixed)
+    )
+    messages = prompts.build_messages(
+        session.context, recent, session.living_document, turn.text, user_entry["image"], session.summary, hints
+    )
+    payload = llm_client.completion_request(model, messages)
+    
+    cache_status = cache_key = cached = None
+    if response_cache is not None:
+        if (x_llm_cache or "").lower() == completion_cache.BYPASS:
+            response_cache.bypassed()
+            cache_status = "bypass"
+        else:
+            cache_key = completion_cache.key(payload)
+            cached = await asyncio.to_thread(response_cache.get, cache_key)
+            cache_status = "miss" if cached is None else "hit"
+    
+    # Wait for the first token before answering, so a refused request (bad key, rate limit) is a plain HTTP error
+    usage = llm_client.Usage()
+    if cached is not None:
+        stream = replay_completion(cached)
+    else:
+        stream = llm_client.stream_completion(payload, x_llm_api_key, request.headers.get("origin"), usage)
+    started = time.perf_counter()
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except llm_client.UpstreamError as e:
+        status = e.status if 400 <= e.status < 500 or e.status == 504 else 502
+        raise HTTPException(status_code=status, detail=e.detail)
+    first_token = time.perf_counter() - started
+    
+    if context_window.needs_summary(len(unsummarised), len(recent)):
+        keep = min(context_window.RECENT_ENTRIES, len(recent))
+        schedule_summary(session_id, context_window.SUMMARY_MODEL or model, rows[len(rows) - keep - 1].seq, x_llm_api_key)
+    
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if cache_status is not None:
+        headers["X-LLM-Cache"] = cache_status
+    return StreamingResponse(
+        chat_events(
+            session_id, user_entry, first, stream, model, usage, first_token, cache_key if cached is None else None
+        ),
+        media_type="text/event-stream",
+        headers=headers,
+    )
+
+# Document History Endpoints
+@api_router.get("/sessions/{session_id}/document/revisions", response_model=List[DocumentRevision])
+async def get_document_revisions(session_id: str, db: AsyncSession = Depends(get_db)):
+    """List the document's revisions without rebuilding their text"""
+    result = await db.execute(
+        select(DocumentRevisionDB.revision, DocumentRevisionDB.kind, DocumentRevisionDB.created_at)
+        .where(DocumentRevisionDB.session_id == session_id)
+        .order_by(DocumentRevisionDB.revision)
+    )
+    return [DocumentRevision(
+        revision=row.revision,
+        timestamp=row.created_at,
+        checkpoint=row.kind == document_history.CHECKPOINT
+    ) for row in result.all()]
+
+@api_router.get("/sessions/{session_id}/document/revisions/{revision}", response_model=DocumentRevision)
+async def get_document_revision(session_id: str, revision: int, db: AsyncSession = Depends(get_db)):
+    """Rebuild one revision by replaying the edit scripts since its nearest checkpoint"""
+    checkpoint = (
+        select(func.max(DocumentRevisionDB.revision))
+        .where(
+            DocumentRevisionDB.session_id == session_id,
+            DocumentRevisionDB.revision <= revision,
+            DocumentRevisionDB.kind == document_history.CHECKPOINT
+        )
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        select(DocumentRevisionDB.revision, DocumentRevisionDB.kind, DocumentRevisionDB.data, DocumentRevisionDB.created_at)
+        .where(
+            DocumentRevisionDB.session_id == session_id,
+            DocumentRevisionDB.revision >= checkpoint,
+            DocumentRevisionDB.revision <= revision
+        )
+        .order_by(DocumentRevisionDB.revision)
+    )
+    rows = result.all()
+    if not rows or rows[-1].revision != revision:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    
+    return DocumentRevision(
+        revision=revision,
+        timestamp=rows[-1].created_at,
+        checkpoint=rows[-1].kind == document_history.CHECKPOINT,
+        livingDocument=document_history.rebuild((row.kind, row.data) for row in rows)
+    )
+
+# Attachment Endpoints
+@api_router.get("/attachments/{digest}")
+async def get_attachment(digest: str, request: Request, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(
+        select(AttachmentDB.content_type, AttachmentDB.size).where(AttachmentDB.hash == digest)
+    )
+    attachment = result.one_or_none()
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    
+    headers = {
+        "Cache-Control": attachments.CACHE_CONTROL,
+        "ETag": f'"{digest}"',
+        "Accept-Ranges": "bytes",
+        **attachments.response_headers(attachment.content_type),
+    }
+    if headers["ETag"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        byte_range = attachments.parse_range(request.headers.get("range"), attachment.size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{attachment.size}"})
+    
+    if byte_range is None:
+        result = await db.execute(select(AttachmentDB.data).where(AttachmentDB.hash == digest))
+        return Response(content=result.scalar_one(), headers=headers)
+    
+    # Let the database slice the blob so only the requested bytes are transferred
+    start, end = byte_range
+    result = await db.execute(
+        select(func.substr(AttachmentDB.data, start + 1, end - start + 1, type_=LargeBinary))
+        .where(AttachmentDB.hash == digest)
+    )
+    return Response(
+        content=result.scalar_one(),
+        status_code=206,
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{attachment.size}"},
+    )
+
+@api_router.post("/attachments/gc")
+async def collect_attachments(min_age_seconds: int = 3600, db: AsyncSession = Depends(get_db)):
+    """Delete attachments that no chat entry or stored version references"""
+    dialect = db.bind.dialect.name
+    if not sql_json.supports(dialect):
+        raise HTTPException(status_code=501, detail="Attachment collection needs server-side JSON support")
+    
+    in_versions = sql_json.nested_strings(dialect, NoteSessionDB.versions, "image", "hash").subquery()
+    # References are checked by the DELETE itself, and fresh uploads are skipped, so a
+    # write still in flight (store_attachments refreshes created_at) is never collected
+    cutoff = datetime.utcnow() - timedelta(seconds=min_age_seconds)
+    result = await db.execute(
+        delete(AttachmentDB)
+        .where(
+            AttachmentDB.created_at < cutoff,
+            ~select(ChatEntryDB.seq).where(ChatEntryDB.image["hash"].as_string() == AttachmentDB.hash).exists(),
+            ~select(in_versions.c.value).where(in_versions.c.value == AttachmentDB.hash).exists(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    
+    return {"deleted": result.rowcount}
+
 # Versioning Endpoints
 @api_router.post("/sessions/{session_id}/versions", response_model=ChatVersion)
-async def create_version(session_id: str, version_input: VersionCreate, db: AsyncSession = Depends(get_db)):
+async def create_version(
+    session_id: str,
+    version_input: VersionCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    expected = parse_if_match(if_match)
+    dialect = db.bind.dialect.name
+    version_id, timestamp = str(uuid.uuid4()), datetime.utcnow()
+    values = checkpoint_values(
+        dialect, session_id, version_id, timestamp, version_input.checkpoint_name, version_input.auto_checkpoint
+    )
+    
+    if values is not None:
+        # Appended by the database; only the new version's own state comes back
+        row = await update_session_row(
+            db, session_id, expected,
+            (
+                NoteSessionDB.current_version,
+                NoteSessionDB.living_document,
+                NoteSessionDB.context,
+                chat_history_json(dialect, session_id).label("entries"),
+            ),
+            last_modified=timestamp,
+            **values
+        )
+        if row is None:
+            raise await missing_or_conflict(db, session_id, expected)
+        await db.commit()
+        response.headers["ETag"] = etag(row.row_version)
+        return ChatVersion(
+            id=version_id,
+            version_number=row.current_version,
+            timestamp=timestamp,
+            chatHistory=row.entries,
+            livingDocument=row.living_document,
+            modelUsed=row.context["selectedModel"],
+            checkpoint_name=version_input.checkpoint_name,
+            auto_checkpoint=version_input.auto_checkpoint
+        )
+    
     result = await db.execute(select(NoteSessionDB).where(NoteSessionDB.id == session_id))
     session = result.scalar_one_or_none()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    check_if_match(expected, session.row_version)
     
     # Create new version
     new_version_number = session.current_version + 1
     new_version = ChatVersion(
+        id=version_id,
         version_number=new_version_number,
-        chatHistory=[ChatEntry(**entry) for entry in session.chat_history],
+        timestamp=timestamp,
+        chatHistory=await load_chat_history(db, session_id),
         livingDocument=session.living_document,
         modelUsed=session.context['selectedModel'],
         checkpoint_name=version_input.checkpoint_name,
         auto_checkpoint=version_input.auto_checkpoint
     )
     
-    # Add to versions list
-    versions = session.versions.copy()
-    versions.append(new_version.model_dump())
+    # Add to versions list as a delta against the previous version
+    versions = version_store.append_version(session.versions, new_version.model_dump(mode="json"))
     
-    # Update in database
-    await db.execute(
-        update(NoteSessionDB)
-        .where(NoteSessionDB.id == session_id)
-        .values(versions=versions, current_version=new_version_number)
+    # Update in database, only if nobody else wrote since we read the versions
+    row_version = await write_session(
+        db, session_id, session.row_version, expected,
+        versions=versions,
+        current_version=new_version_number,
+        versioned_chat_length=len(new_version.chatHistory),
+        document_versioned=True,
+        versioned_document=new_version.livingDocument,
+        last_modified=timestamp
     )
     await db.commit()
+    response.headers["ETag"] = etag(row_version)
     
     return new_version
 
 @api_router.get("/sessions/{session_id}/versions", response_model=List[ChatVersion])
-async def get_versions(session_id: str, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(NoteSessionDB).where(NoteSessionDB.id == session_id))
-    session = result.scalar_one_or_none()
+async def get_versions(session_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    cached = await conditional_response(db, request, session_id, "versions")
+    if cached is not None:
+        return cached
+    
+    result = await db.execute(
+        select(NoteSessionDB.id, NoteSessionDB.versions, NoteSessionDB.row_version, NoteSessionDB.last_modified)
+        .where(NoteSessionDB.id == session_id)
+    )
+    session = result.one_or_none()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return [ChatVersion(**version) for version in session.versions]
+    return cache_response("versions", session, serialization.versions_payload(session.versions))
 
 @api_router.post("/sessions/{session_id}/restore")
-async def restore_version(version_restore: VersionRestore, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(NoteSessionDB).where(NoteSessionDB.id == version_restore.session_id))
-    session = result.scalar_one_or_none()
-    if not session:
+async def restore_version(
+    version_restore: VersionRestore,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    expected = parse_if_match(if_match)
+    result = await db.execute(
+        select(NoteSessionDB, *revision_head(version_restore.session_id))
+        .where(NoteSessionDB.id == version_restore.session_id)
+    )
+    row = result.one_or_none()
+    if not row:
         raise HTTPException(status_code=404, detail="Session not found")
+    session = row.NoteSessionDB
+    check_if_match(expected, session.row_version)
     
     # Find the version to restore
-    target_version = None
-    for version in session.versions:
-        if version['id'] == version_restore.version_id:
-            target_version = ChatVersion(**version)
-            break
-    
-    if not target_version:
+    target = version_store.materialize(session.versions, version_restore.version_id)
+    if not target:
         raise HTTPException(status_code=404, detail="Version not found")
+    target_version = ChatVersion(**target)
     
-    # Create a checkpoint of current state before restoring
-    current_checkpoint = ChatVersion(
-        version_number=session.current_version + 1,
-        chatHistory=[ChatEntry(**entry) for entry in session.chat_history],
-        livingDocument=session.living_document,
-        modelUsed=session.context['selectedModel'],
-        checkpoint_name=f"Auto-backup before restore to v{target_version.version_number}",
-        auto_checkpoint=True
-    )
+    # Versions saved before attachments existed may still carry inline images
+    chat_history, blobs = extract_attachments([entry.model_dump() for entry in target_version.chatHistory])
     
-    versions = session.versions.copy()
-    versions.append(current_checkpoint.model_dump())
+    # Create a checkpoint of current state before restoring
+    checkpoint_name = f"Auto-backup before restore to v{target_version.version_number}"
+    dialect = db.bind.dialect.name
+    values = checkpoint_values(dialect, session.id, str(uuid.uuid4()), datetime.utcnow(), checkpoint_name, True)
+    stored = None
+    if dialect != "postgresql" or values is None:
+        # Safe to read before writing: the write below fails if the session moved on since it was read
+        stored = await load_stored_entries(db, session.id)
+    if values is None:
+        current_checkpoint = ChatVersion(
+            version_number=session.current_version + 1,
+            chatHistory=[entry for _, entry in stored],
+            livingDocument=session.living_document,
+            modelUsed=session.context['selectedModel'],
+            checkpoint_name=checkpoint_name,
+            auto_checkpoint=True
+        )
+        values = {
+            "versions": version_store.append_version(session.versions, current_checkpoint.model_dump(mode="json")),
+            "current_version": current_checkpoint.version_number,
+            "versioned_document": current_checkpoint.livingDocument,
+        }
     
-    # Restore to target version
+    # Restore to target version; the backup shares the history only up to what the restore keeps
+    # (Postgres caps versioned_chat_length at the kept prefix in the UPDATE itself)
     context = session.context.copy()
     context['selectedModel'] = target_version.modelUsed
+    values.update(
+        living_document=target_version.livingDocument,
+        context=context,
+        last_modified=datetime.utcnow(),
+        document_versioned=session.living_document == target_version.livingDocument
+    )
+    if stored is not None:
+        values["versioned_chat_length"] = kept_prefix(stored, chat_history)
     
-    await db.execute(
-        update(NoteSessionDB)
-        .where(NoteSessionDB.id == version_restore.session_id)
-        .values(
-            chat_history=[entry.model_dump() for entry in target_version.chatHistory],
-            living_document=target_version.livingDocument,
-            context=context,
-            versions=versions,
-            current_version=current_checkpoint.version_number,
-            last_modified=datetime.utcnow()
-        )
+    read = SimpleNamespace(
+        row_version=session.row_version,
+        living_document=session.living_document,
+        last_revision=row.last_revision,
+        last_depth=row.last_depth,
     )
+    written = await update_session_row(
+        db, session.id, expected, read=read, history=chat_history, stored=stored, blobs=blobs, **values
+    )
+    if written is None:
+        raise await missing_or_conflict(db, session.id, expected)
     await db.commit()
+    response.headers["ETag"] = etag(written.row_version)
     
     return {"message": f"Session restored to version {target_version.version_number}"}
 
 @api_router.post("/sessions/{session_id}/switch-model")
-async def switch_model(model_switch: ModelSwitch, db: AsyncSession = Depends(get_db)):
+async def switch_model(
+    model_switch: ModelSwitch,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    expected = parse_if_match(if_match)
+    dialect = db.bind.dialect.name
+    checkpoint_name = f"Before model switch to {model_switch.new_model}"
+    
+    if sql_json.supports(dialect):
+        # Context edit and checkpoint both happen in a single UPDATE
+        update_dict = {
+            "last_modified": datetime.utcnow(),
+            "context": sql_json.set_key(
+                dialect, NoteSessionDB.context, "selectedModel", literal(model_switch.new_model, String)
+            ),
+        }
+        if model_switch.create_checkpoint:
+            update_dict.update(checkpoint_values(
+                dialect, model_switch.session_id, str(uuid.uuid4()), datetime.utcnow(), checkpoint_name, True
+            ))
+        row = await update_session_row(db, model_switch.session_id, expected, **update_dict)
+        if row is None:
+            raise await missing_or_conflict(db, model_switch.session_id, expected)
+        await db.commit()
+        response.headers["ETag"] = etag(row.row_version)
+        return {"message": f"Model switched to {model_switch.new_model}"}
+    
     result = await db.execute(select(NoteSessionDB).where(NoteSessionDB.id == model_switch.session_id))
     session = result.scalar_one_or_none()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    check_if_match(expected, session.row_version)
     
     update_dict = {"last_modified": datetime.utcnow()}
     
@@ -396,52 +2052,60 @@ async def switch_model(model_switch: ModelSwitch, db: AsyncSession = Depends(get
     if model_switch.create_checkpoint:
         checkpoint = ChatVersion(
             version_number=session.current_version + 1,
-            chatHistory=[ChatEntry(**entry) for entry in session.chat_history],
+            chatHistory=await load_chat_history(db, session.id),
             livingDocument=session.living_document,
             modelUsed=session.context['selectedModel'],
-            checkpoint_name=f"Before model switch to {model_switch.new_model}",
+            checkpoint_name=checkpoint_name,
             auto_checkpoint=True
         )
         
-        versions = session.versions.copy()
-        versions.append(checkpoint.model_dump())
+        versions = version_store.append_version(session.versions, checkpoint.model_dump(mode="json"))
         update_dict["versions"] = versions
         update_dict["current_version"] = checkpoint.version_number
+        update_dict["versioned_chat_length"] = len(checkpoint.chatHistory)
+        update_dict["document_versioned"] = True
+        update_dict["versioned_document"] = checkpoint.livingDocument
     
     # Switch model
     context = session.context.copy()
     context['selectedModel'] = model_switch.new_model
     update_dict["context"] = context
     
-    await db.execute(
-        update(NoteSessionDB)
-        .where(NoteSessionDB.id == model_switch.session_id)
-        .values(**update_dict)
-    )
+    row_version = await write_session(db, session.id, session.row_version, expected, **update_dict)
     await db.commit()
+    response.headers["ETag"] = etag(row_version)
     
     return {"message": f"Model switched to {model_switch.new_model}"}
 
 @api_router.delete("/sessions/{session_id}/versions/{version_id}")
-async def delete_version(session_id: str, version_id: str, db: AsyncSession = Depends(get_db)):
+async def delete_version(
+    session_id: str,
+    version_id: str,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    expected = parse_if_match(if_match)
     result = await db.execute(select(NoteSessionDB).where(NoteSessionDB.id == session_id))
     session = result.scalar_one_or_none()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    check_if_match(expected, session.row_version)
     
     # Don't allow deletion of the initial version
     if len(session.versions) <= 1:
         raise HTTPException(status_code=400, detail="Cannot delete the only version")
     
-    # Find and remove the version
-    versions = [v for v in session.versions if v['id'] != version_id]
+    # Find and remove the version, re-encoding any versions stored as deltas against it
+    versions = version_store.remove_version(session.versions, version_id)
+    update_dict = {"versions": versions, "last_modified": datetime.utcnow()}
+    if session.versions[-1].get("id") == version_id:
+        # The newest version is gone; the next checkpoint starts over from a keyframe
+        update_dict.update(versioned_chat_length=0, document_versioned=False, versioned_document=None)
     
-    await db.execute(
-        update(NoteSessionDB)
-        .where(NoteSessionDB.id == session_id)
-        .values(versions=versions)
-    )
+    row_version = await write_session(db, session_id, session.row_version, expected, **update_dict)
     await db.commit()
+    response.headers["ETag"] = etag(row_version)
     
     return {"message": "Version deleted successfully"}
 
@@ -449,20 +2113,107 @@ async def delete_version(session_id: str, version_id: str, db: AsyncSession = De
 app.include_router(api_router)
 
 # Database initialization
+async def migrate_chat_history(conn):
+    """Move legacy inline chat_history arrays into the chat_entries table"""
+    result = await conn.execute(
+        select(NoteSessionDB.id, NoteSessionDB.chat_history)
+        .where(cast(NoteSessionDB.chat_history, Text) != "[]")
+    )
+    for session_id, chat_history in result.all():
+        try:
+            chat_history = await store_attachments(conn, chat_history)
+        except HTTPException:
+            logging.warning("Keeping undecodable inline images for session %s", session_id)
+        if chat_history:
+            await conn.execute(
+                insert(ChatEntryDB),
+                [chat_entry_row(session_id, seq, entry) for seq, entry in enumerate(chat_history, start=1)]
+            )
+        await conn.execute(
+            update(NoteSessionDB)
+            .where(NoteSessionDB.id == session_id)
+            .values(chat_history=[])
+        )
+
+def add_missing_columns(sync_conn):
+    """create_all never alters existing tables; add columns introduced since they were created"""
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=sync_conn.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            sync_conn.execute(text(ddl))
+
+def create_schema(sync_conn):
+    """Tables, columns, indexes and triggers of the current models; safe to rerun on an existing database"""
+    Base.metadata.create_all(sync_conn)
+    add_missing_columns(sync_conn)
+    # create_all skips indexes on tables that already exist
+    for index in NoteSessionDB.__table__.indexes:
+        index.create(sync_conn, checkfirst=True)
+    if sync_conn.dialect.name == "postgresql":
+        session_cache.install_trigger(sync_conn)
+        document_history.install_function(sync_conn)
+
+def stamp_head(sync_conn):
+    """Record the schema create_schema just built as the latest migration, so `alembic upgrade head` skips it"""
+    # Imported here: only the bootstrap path needs Alembic, not every cold start
+    from alembic.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    
+    MigrationContext.configure(sync_conn).stamp(ScriptDirectory(str(ROOT_DIR / "migrations")), "head")
+
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """Bootstrap without Alembic, for tests and DB_INIT_ON_STARTUP; deployments run `alembic upgrade head`"""
+    async with get_engine().begin() as conn:
+        await conn.run_sync(create_schema)
+        await migrate_chat_history(conn)
+        await conn.run_sync(stamp_head)
+
+async def start_invalidation_listener():
+    global invalidation_listener
+    try:
+        invalidation_listener = await session_cache.listen(get_engine(), read_cache)
+    except Exception as e:
+        logging.warning("Session cache invalidations will not be received: %s", e)
 
 # Startup event
 @app.on_event("startup")
 async def startup():
-    await init_db()
-    logging.info("Database initialized")
+    global listener_task
+    # Schema changes run before deploys (alembic upgrade head), not on every cold start
+    if os.getenv("DB_INIT_ON_STARTUP", "false").lower() == "true":
+        await init_db()
+        logging.info("Database initialized")
+    listen = os.getenv("SESSION_CACHE_LISTEN", "true").lower() != "false"
+    # Transaction poolers do not deliver notifications to a held LISTEN
+    if DATABASE_BACKEND == "postgresql" and listen and not db_pool.behind_pooler(DATABASE_URL):
+        # Connects in the background so the first request does not wait for it
+        listener_task = asyncio.create_task(start_invalidation_listener())
+    startup_profile.profile.mark("startup")
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown():
-    await engine.dispose()
+    if listener_task is not None and not listener_task.done():
+        listener_task.cancel()
+    for task in list(summary_tasks.values()):
+        task.cancel()
+    if invalidation_listener is not None:
+        await invalidation_listener.close()
+    await llm_client.close()
+    if response_cache is not None:
+        response_cache.close()
+    if _engine is not None:
+        await _engine.dispose()
 
 # Configure logging
 logging.basicConfig(
@@ -471,6 +2222,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+startup_profile.profile.mark("imported")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv('PORT', 8000))
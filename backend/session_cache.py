@@ -0,0 +1,175 @@
+"""
+In-process cache of encoded session responses.
+
+``GET /api/sessions/{id}`` and ``GET /api/sessions/{id}/versions`` keep their
+encoded bodies here, keyed by session id, view and ``row_version``. Every write
+bumps ``row_version``, so a body is only served while the stored row still has
+the version it was built from: a hit costs one indexed lookup of that column
+instead of loading the session, its chat entries and the version chain, and a
+missed invalidation can never surface stale data.
+
+Invalidation keeps the cache from holding dead bodies. Writes drop the local
+entries; on Postgres a trigger on ``note_sessions`` NOTIFYs the new row version
+and every instance listening on ``CHANNEL`` drops older entries for that
+session. The cache is an LRU bounded by total body size, and entries also
+expire after ``TTL`` seconds.
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+MAX_BYTES = max(0, int(os.getenv("SESSION_CACHE_MAX_BYTES", str(64 * 1024 * 1024))))
+TTL = float(os.getenv("SESSION_CACHE_TTL", "300"))
+
+VIEWS = ("session", "versions")
+CHANNEL = "session_changed"
+
+# Installed by server.create_schema on Postgres; the payload is "<id> <row_version>", or just the id on delete
+TRIGGER_DDL = (
+    f"""
+    CREATE OR REPLACE FUNCTION notify_session_changed() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('{CHANNEL}', OLD.id);
+        ELSE
+            PERFORM pg_notify('{CHANNEL}', NEW.id || ' ' || NEW.row_version);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS note_sessions_changed ON note_sessions",
+    """
+    CREATE TRIGGER note_sessions_changed AFTER UPDATE OR DELETE ON note_sessions
+    FOR EACH ROW EXECUTE FUNCTION notify_session_changed()
+    """,
+)
+
+
+class SessionCache:
+    """Size-bounded LRU of response bodies keyed by (session id, view)."""
+
+    def __init__(self, max_bytes: int = MAX_BYTES, ttl: float = TTL, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        # (session id, view) -> (row_version, expires at, body)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, float, bytes]]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+        self.listening = False
+
+    def _drop(self, key: Tuple[str, str]):
+        _, _, body = self._entries.pop(key)
+        self.size -= len(body)
+
+    def _live(self, key: Tuple[str, str]) -> Optional[Tuple[int, float, bytes]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= self.clock():
+            self._drop(key)
+            return None
+        return entry
+
+    def holds(self, session_id: str, view: str) -> bool:
+        """Whether a body is cached, i.e. whether checking the row version can pay off."""
+        return self._live((session_id, view)) is not None
+
+    def get(self, session_id: str, view: str, row_version: Optional[int]) -> Optional[bytes]:
+        """The cached body if it was built at ``row_version``; None counts as a miss."""
+        key = (session_id, view)
+        entry = self._live(key)
+        if entry is None or row_version is None or entry[0] != row_version:
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, session_id: str, view: str, row_version: int, body: bytes):
+        key = (session_id, view)
+        if key in self._entries:
+            self._drop(key)
+        if len(body) > self.max_bytes:
+            return
+        self._entries[key] = (row_version, self.clock() + self.ttl, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, session_id: str, row_version: Optional[int] = None) -> int:
+        """Drop bodies of a session built before ``row_version`` (all of them when None)."""
+        dropped = 0
+        for view in VIEWS:
+            entry = self._entries.get((session_id, view))
+            if entry is not None and (row_version is None or entry[0] < row_version):
+                self._drop((session_id, view))
+                dropped += 1
+        self.invalidations += dropped
+        return dropped
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "remote_invalidations": self.remote_invalidations,
+            "listening": self.listening,
+        }
+
+
+def parse_notification(payload: str) -> Tuple[str, Optional[int]]:
+    session_id, _, row_version = payload.partition(" ")
+    return session_id, int(row_version) if row_version else None
+
+
+async def listen(engine, cache: SessionCache):
+    """Hold a connection that LISTENs on ``CHANNEL`` and invalidates ``cache``.
+
+    Returns the SQLAlchemy connection to close at shutdown. Notifications do
+    not arrive through transaction-mode poolers (e.g. Neon's ``-pooler`` host),
+    which only costs memory: stale bodies are never served either way.
+    """
+    conn = await engine.connect()
+    raw = await conn.get_raw_connection()
+    driver = raw.driver_connection
+
+    def on_notify(connection, pid, channel, payload):
+        session_id, row_version = parse_notification(payload)
+        cache.remote_invalidations += cache.invalidate(session_id, row_version)
+
+    def on_terminate(connection):
+        cache.listening = False
+        logging.warning("Session cache invalidation listener disconnected; relying on row_version checks")
+
+    await driver.add_listener(CHANNEL, on_notify)
+    driver.add_termination_listener(on_terminate)
+    cache.listening = True
+    return conn
+
+
+def install_trigger(sync_conn):
+    for ddl in TRIGGER_DDL:
+        sync_conn.execute(text(ddl))
@@ -0,0 +1,114 @@
+"""
+Dialect-specific SQL for building and editing JSON values inside a statement.
+
+Postgres (``jsonb``) and SQLite (JSON1) can both assemble and modify JSON on the
+server but spell it differently. ``supports`` tells callers whether a backend
+is covered; for anything else they read the value and rewrite it in Python.
+Expressions returned here are typed ``JSON`` so results decode as usual.
+"""
+
+from typing import Any
+
+from sqlalchemy import JSON, cast, func, literal_column, select, true
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by
+
+SUPPORTED_DIALECTS = ("postgresql", "sqlite")
+
+
+def supports(dialect: str) -> bool:
+    return dialect in SUPPORTED_DIALECTS
+
+
+def _postgres(dialect: str) -> bool:
+    return dialect == "postgresql"
+
+
+def _nested(dialect: str, value: Any):
+    """SQLite forgets a value is JSON once it passes through a subquery; json() marks it again."""
+    if not _postgres(dialect) and isinstance(getattr(value, "type", None), JSON):
+        return func.json(value, type_=JSON)
+    return value
+
+
+def as_json(dialect: str, column: Any):
+    """A JSON column as a value that nests as JSON (not as a string) in the builders below."""
+    if _postgres(dialect):
+        return cast(column, JSONB)
+    return func.json(column, type_=JSON)
+
+
+def build_object(dialect: str, **fields: Any):
+    args = []
+    for key, value in fields.items():
+        args.extend((literal_column(f"'{key}'"), _nested(dialect, value)))
+    if _postgres(dialect):
+        return func.jsonb_build_object(*args, type_=JSON)
+    return func.json_object(*args, type_=JSON)
+
+
+def build_array(dialect: str, *items: Any):
+    if _postgres(dialect):
+        return func.jsonb_build_array(*items, type_=JSON)
+    return func.json_array(*(_nested(dialect, item) for item in items), type_=JSON)
+
+
+def aggregate_array(dialect: str, value: Any, order_by: Any):
+    """Aggregate ``value`` over the rows of a query into a JSON array, ``[]`` when there are none.
+
+    SQLite (before 3.44) has no ORDER BY inside aggregates and keeps the order
+    rows arrive in, so select from a subquery already ordered by ``order_by``.
+    """
+    if _postgres(dialect):
+        return func.coalesce(func.jsonb_agg(aggregate_order_by(value, order_by)), literal_column("'[]'::jsonb"), type_=JSON)
+    return func.json_group_array(_nested(dialect, value), type_=JSON)
+
+
+def array_length(dialect: str, column: Any):
+    if _postgres(dialect):
+        return func.jsonb_array_length(cast(column, JSONB))
+    return func.json_array_length(column)
+
+
+def last_element_field(dialect: str, column: Any, key: str, type_: Any):
+    """``column[-1][key]`` as SQL ``type_``; NULL for an empty array or missing key."""
+    if _postgres(dialect):
+        element = cast(column, JSONB).op("->")(literal_column("-1")).op("->>")(literal_column(f"'{key}'"))
+    else:
+        element = func.json_extract(column, f"$[#-1].{key}")
+    return cast(element, type_)
+
+
+def array_append(dialect: str, column: Any, element: Any):
+    """``column`` with ``element`` appended, computed without sending the array to the client."""
+    if _postgres(dialect):
+        array = func.coalesce(cast(column, JSONB), literal_column("'[]'::jsonb"))
+        return cast(array.op("||")(func.jsonb_build_array(element)), JSON)
+    return func.json_insert(func.coalesce(column, "[]"), "$[#]", func.json(element), type_=JSON)
+
+
+def set_key(dialect: str, column: Any, key: str, value: Any):
+    """``column`` (a JSON object) with ``key`` set to ``value``."""
+    if _postgres(dialect):
+        return cast(cast(column, JSONB).op("||")(func.jsonb_build_object(literal_column(f"'{key}'"), value)), JSON)
+    return func.json_set(column, f"$.{key}", value, type_=JSON)
+
+
+def nested_strings(dialect: str, column: Any, parent: str, key: str):
+    """Rows of every string stored at ``<parent>.<key>``, at any depth of ``column``, as ``value``.
+
+    One row per occurrence, for each row of ``column``'s table; the value is
+    SQL text on both backends.
+    """
+    table = column.expression.table
+    if _postgres(dialect):
+        found = func.jsonb_path_query(
+            cast(column, JSONB), literal_column(f"'lax $.**.{parent}.{key}'::jsonpath")
+        ).table_valued("value").render_derived()
+        return select(found.c.value.op("#>>")(literal_column("'{}'")).label("value")).select_from(table).join(found, true())
+    tree = func.json_tree(column).table_valued("key", "value", "path", "type")
+    return (
+        select(tree.c.value)
+        .select_from(table)
+        .join(tree, true())
+        .where(tree.c.key == key, tree.c.path.like(f"%.{parent}"), tree.c.type == "text")
+    )
@@ -0,0 +1,78 @@
+"""
+SQLite as a local storage backend, for development, load tests and profiling.
+
+Selected by the URL: ``DATABASE_URL=sqlite:///./aimmar.db`` (rewritten to the
+``sqlite+aiosqlite`` driver like ``postgresql://`` is to asyncpg). Every new
+connection is tuned with ``PRAGMAS``:
+
+- ``journal_mode=WAL``: readers do not block the writer and a commit is one
+  append to the log instead of a rollback-journal rewrite. Stored in the file.
+- ``synchronous=NORMAL``: fsync at checkpoints rather than every commit; safe
+  in WAL mode, a power cut can only lose the last transactions.
+- ``foreign_keys=ON``: enforce the schema's ``ON DELETE CASCADE`` as Postgres
+  does (SQLite ignores foreign keys unless asked per connection).
+- ``busy_timeout``: wait ``SQLITE_BUSY_TIMEOUT_MS`` for the write lock instead
+  of failing with "database is locked".
+- ``cache_size``, ``temp_store``, ``mmap_size``: keep pages and temporary
+  b-trees in memory.
+
+JSON columns are stored as text and queried with SQLite's JSON1 functions (see
+sql_json.py), so the same endpoints append versions and aggregate chat
+history in SQL on both backends.
+"""
+
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+CACHE_KIB = int(os.getenv("SQLITE_CACHE_KIB", str(64 * 1024)))
+MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+
+# WAL needs a file; in-memory databases keep their "memory" journal
+FILE_PRAGMAS: List[Tuple[str, object]] = [("journal_mode", "WAL")]
+PRAGMAS: List[Tuple[str, object]] = [
+    ("synchronous", "NORMAL"),
+    ("foreign_keys", "ON"),
+    ("busy_timeout", BUSY_TIMEOUT_MS),
+    # negative values are KiB rather than pages
+    ("cache_size", -CACHE_KIB),
+    ("temp_store", "MEMORY"),
+    ("mmap_size", MMAP_BYTES),
+]
+
+
+def normalize_url(url: str) -> str:
+    """Use the async driver for plain ``sqlite://`` URLs."""
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+def in_memory(url: str) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+
+def pragmas(url: str) -> List[Tuple[str, object]]:
+    return PRAGMAS if in_memory(url) else FILE_PRAGMAS + PRAGMAS
+
+
+def attach(engine, functions: Optional[Dict[str, Callable]] = None):
+    """Apply ``pragmas`` to every connection ``engine`` (an AsyncEngine on SQLite) opens.
+
+    ``functions`` are registered on each connection as deterministic SQL
+    functions of the same name, for SQL that Postgres runs as stored functions.
+    """
+    statements = [f"PRAGMA {name}={value}" for name, value in pragmas(str(engine.url))]
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def tune(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+        for name, function in (functions or {}).items():
+            dbapi_connection.create_function(name, function.__code__.co_argcount, function, deterministic=True)
+
@@ -0,0 +1,66 @@
+"""
+Cold-start timings for scale-to-zero deployments.
+
+``server`` imports this module first and marks the end of its own import,
+the end of the startup hook and the first served request. Times are relative
+to this module's import; ``interpreter_ms`` is how long the process ran before
+that (Linux only), so their sum is the cold start a client sees. The report is
+logged once after the first request and served at ``GET /api/startup-profile``.
+"""
+
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process was started, from /proc; None elsewhere."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        age = process_age()
+        self.interpreter_ms = None if age is None else round(max(0.0, age * 1000), 1)
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, name: str):
+        """Record ``name`` the first time it happens."""
+        self.marks.setdefault(name, (time.perf_counter() - self.started) * 1000)
+
+    def report(self) -> Dict[str, Optional[float]]:
+        report = {"interpreter_ms": self.interpreter_ms}
+        report.update({f"{name}_ms": round(ms, 1) for name, ms in self.marks.items()})
+        if self.interpreter_ms is not None and "first_request" in self.marks:
+            report["cold_start_ms"] = round(self.interpreter_ms + self.marks["first_request"], 1)
+        return report
+
+
+profile = StartupProfile()
+
+
+class FirstRequestMiddleware:
+    """Marks and logs the profile when the first HTTP response has been sent."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.done = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await self.app(scope, receive, send)
+        if not self.done and scope["type"] == "http":
+            self.done = True
+            profile.mark("first_request")
+            logging.info("Startup profile: %s", profile.report())
@@ -0,0 +1,206 @@
+"""
+Delta-encoded storage for session versions.
+
+``NoteSessionDB.versions`` holds a chain of version records. Every
+``KEYFRAME_INTERVAL``-th record is a keyframe carrying the full chat history and
+living document; the records in between only carry the changes against their
+parent (the record before them). Full ``ChatVersion`` payloads are rebuilt on
+demand by replaying the chain from the nearest keyframe.
+
+Records written before delta encoding existed are plain ``ChatVersion`` dumps
+without a ``kind`` field; they are read as keyframes. Records appended in SQL
+(``server.checkpoint_values``) use the same format, with a changed document
+diffed by the database (``line_edit_script``, see document_history.py).
+"""
+
+import difflib
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+KEYFRAME_INTERVAL = max(1, int(os.getenv("VERSION_KEYFRAME_INTERVAL", "25")))
+
+# Fields copied verbatim from a ChatVersion into its stored record
+METADATA_FIELDS = (
+    "id",
+    "version_number",
+    "timestamp",
+    "modelUsed",
+    "checkpoint_name",
+    "auto_checkpoint",
+)
+
+
+# Line-level document diffs
+def diff_lines(old: str, new: str) -> List[Any]:
+    """Encode ``new`` as an edit script against ``old``.
+
+    The script is a list of ops: a positive int copies that many lines from
+    ``old``, a negative int skips that many lines of ``old`` and a list of
+    strings inserts those lines.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+
+    ops: List[Any] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(-(i2 - i1))
+        if j2 > j1:
+            ops.append(new_lines[j1:j2])
+    return ops
+
+
+def apply_line_diff(old: str, ops: List[Any]) -> str:
+    """Rebuild a document from its predecessor and a ``diff_lines`` script."""
+    old_lines = old.splitlines(keepends=True)
+    result: List[str] = []
+    position = 0
+    for op in ops:
+        if isinstance(op, list):
+            result.extend(op)
+        elif op > 0:
+            result.extend(old_lines[position:position + op])
+            position += op
+        else:
+            position -= op
+    return "".join(result)
+
+
+# Chat history diffs
+def diff_chat(old: List[dict], new: List[dict]) -> Dict[str, Any]:
+    """Encode ``new`` as the common prefix length with ``old`` plus the appended entries."""
+    base = 0
+    for old_entry, new_entry in zip(old, new):
+        if old_entry != new_entry:
+            break
+        base += 1
+    return {"base": base, "append": new[base:]}
+
+
+def apply_chat_diff(old: List[dict], delta: Dict[str, Any]) -> List[dict]:
+    return old[:delta["base"]] + delta["append"]
+
+
+# Version records
+def _is_keyframe(record: dict) -> bool:
+    return record.get("kind", "keyframe") == "keyframe"
+
+
+def _metadata(version: dict) -> dict:
+    return {field: version.get(field) for field in METADATA_FIELDS}
+
+
+def _keyframe(version: dict) -> dict:
+    return {
+        **_metadata(version),
+        "kind": "keyframe",
+        "depth": 0,
+        "chatHistory": version["chatHistory"],
+        "livingDocument": version["livingDocument"],
+    }
+
+
+def _state(record: dict, parent: Optional[dict]) -> dict:
+    """Materialize a record given the materialized state of its parent."""
+    if _is_keyframe(record):
+        chat_history = record["chatHistory"]
+        living_document = record["livingDocument"]
+    else:
+        chat_history = apply_chat_diff(parent["chatHistory"], record["chat"])
+        doc_ops = record.get("doc")
+        living_document = parent["livingDocument"] if doc_ops is None else apply_line_diff(parent["livingDocument"], doc_ops)
+    return {**_metadata(record), "chatHistory": chat_history, "livingDocument": living_document}
+
+
+def encode_version(version: dict, parent_record: Optional[dict], parent_state: Optional[dict]) -> dict:
+    """Build the stored record for a JSON-mode ``ChatVersion`` dump."""
+    if parent_record is None or parent_state is None:
+        return _keyframe(version)
+
+    depth = parent_record.get("depth", 0) + 1
+    if depth >= KEYFRAME_INTERVAL:
+        return _keyframe(version)
+
+    chat = diff_chat(parent_state["chatHistory"], version["chatHistory"])
+    if chat["base"] == 0 and parent_state["chatHistory"]:
+        # History was rewritten (e.g. a restore); a diff would not save anything
+        return _keyframe(version)
+
+    doc = None
+    if version["livingDocument"] != parent_state["livingDocument"]:
+        doc = diff_lines(parent_state["livingDocument"], version["livingDocument"])
+
+    return {
+        **_metadata(version),
+        "kind": "delta",
+        "depth": depth,
+        "parent_id": parent_record.get("id"),
+        "chat": chat,
+        "doc": doc,
+    }
+
+
+def iter_materialized(records: List[dict]) -> Iterator[dict]:
+    """Yield the full ChatVersion payload of every record, in stored order."""
+    state = None
+    for record in records:
+        state = _state(record, state)
+        yield state
+
+
+def materialize_all(records: List[dict]) -> List[dict]:
+    return list(iter_materialized(records))
+
+
+def materialize(records: List[dict], version_id: str) -> Optional[dict]:
+    """Rebuild a single version, replaying only from its nearest keyframe."""
+    index = next((i for i, record in enumerate(records) if record.get("id") == version_id), None)
+    if index is None:
+        return None
+
+    start = index
+    while start > 0 and not _is_keyframe(records[start]):
+        start -= 1
+
+    state = None
+    for record in records[start:index + 1]:
+        state = _state(record, state)
+    return state
+
+
+def materialize_head(records: List[dict]) -> Optional[dict]:
+    if not records:
+        return None
+    return materialize(records, records[-1].get("id"))
+
+
+def iter_stored_entries(records: List[dict]) -> Iterator[dict]:
+    """Yield every chat entry physically stored in the chain, without materializing it."""
+    for record in records:
+        if _is_keyframe(record):
+            yield from record.get("chatHistory") or []
+        else:
+            yield from record["chat"]["append"]
+
+
+def append_version(records: List[dict], version: dict) -> List[dict]:
+    """Return a new record list with ``version`` appended as a keyframe or delta."""
+    parent_record = records[-1] if records else None
+    parent_state = materialize_head(records)
+    return records + [encode_version(version, parent_record, parent_state)]
+
+
+def remove_version(records: List[dict], version_id: str) -> List[dict]:
+    """Drop a version and re-encode the chain so its children stay decodable."""
+    rebuilt: List[dict] = []
+    parent_state = None
+    for state in iter_materialized(records):
+        if state["id"] == version_id:
+            continue
+        rebuilt.append(encode_version(state, rebuilt[-1] if rebuilt else None, parent_state))
+        parent_state = state
+    return rebuilt
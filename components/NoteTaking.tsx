@@ -210,7 +210,11 @@ export const NoteTaking: React.FC<NoteTakingProps> = ({
       }
       
       setSession(finalSession)
-      await storageService.saveSession(finalSession)
+      await storageService.patchSession(finalSession, [
+        { op: 'add', path: '/chatHistory/-', value: userMessage },
+        { op: 'add', path: '/chatHistory/-', value: aiMessage },
+        { op: 'replace', path: '/livingDocument', value: response.document }
+      ])
       onSave(finalSession)
       
     } catch (err) {
@@ -12,59 +12,74 @@ if (typeof window !== 'undefined') {
   console.log('StorageService - API_BASE_URL:', API_BASE_URL)
 }
 
+// Sessions per request to GET /sessions; further pages are fetched when the user asks for them
+const SESSIONS_PAGE_SIZE = 20;
+
+export interface SessionPage {
+  sessions: NoteSession[];
+  nextCursor: string | null;
+}
+
+// Sessions saved in this browser, migrated to the current format
+const getLocalSessions = (): NoteSession[] => {
+  try {
+    const storedSessions = localStorage.getItem(SESSIONS_KEY);
+    if (storedSessions) {
+      const sessions = JSON.parse(storedSessions);
+      
+      // Migrate old sessions to new format
+      return sessions.map((session: any) => {
+        // Add versioning fields if missing
+        if (!session.current_version) {
+          session.current_version = 1;
+        }
+        if (!session.versions) {
+          session.versions = [{
+            id: `${session.id}_v1`,
+            version_number: 1,
+            timestamp: new Date().toISOString(),
+            chatHistory: session.chatHistory || [],
+            livingDocument: session.livingDocument || '',
+            modelUsed: session.context?.selectedModel || modelService.getDefaultModel(),
+            checkpoint_name: 'Initial Version',
+            auto_checkpoint: false
+          }];
+        }
+        if (!session.context?.selectedModel) {
+          session.context.selectedModel = modelService.getDefaultModel();
+        }
+        return session;
+      });
+    }
+  } catch (error) {
+    console.error("Failed to load sessions from local storage:", error);
+  }
+  return [];
+};
+
 export const storageService = {
-  // Get sessions from API first, fallback to localStorage
-  getSessions: async (): Promise<NoteSession[]> => {
+  // Get one page of sessions, newest first, from the API; falls back to every locally stored session.
+  // Pass the previous page's nextCursor to continue; nextCursor is null on the last page.
+  getSessionsPage: async (cursor: string | null = null): Promise<SessionPage> => {
     // Only try API if backend URL is configured
     if (API_BASE_URL) {
       try {
-        // Try to get sessions from API
-        const response = await fetch(`${API_BASE_URL}/sessions`);
+        const params = new URLSearchParams({ limit: String(SESSIONS_PAGE_SIZE) });
+        if (cursor) {
+          params.set('cursor', cursor);
+        }
+        const response = await fetch(`${API_BASE_URL}/sessions?${params}`);
         if (response.ok) {
-          const sessions = await response.json();
-          return sessions;
+          const page = await response.json();
+          return { sessions: page.sessions, nextCursor: page.next_cursor ?? null };
         }
       } catch (error) {
         console.warn("Failed to load sessions from API, falling back to localStorage:", error);
       }
     }
 
-    // Fallback to localStorage
-    try {
-      const storedSessions = localStorage.getItem(SESSIONS_KEY);
-      if (storedSessions) {
-        const sessions = JSON.parse(storedSessions);
-        
-        // Migrate old sessions to new format
-        const migratedSessions = sessions.map((session: any) => {
-          // Add versioning fields if missing
-          if (!session.current_version) {
-            session.current_version = 1;
-          }
-          if (!session.versions) {
-            session.versions = [{
-              id: `${session.id}_v1`,
-              version_number: 1,
-              timestamp: new Date().toISOString(),
-              chatHistory: session.chatHistory || [],
-              livingDocument: session.livingDocument || '',
-              modelUsed: session.context?.selectedModel || modelService.getDefaultModel(),
-              checkpoint_name: 'Initial Version',
-              auto_checkpoint: false
-            }];
-          }
-          if (!session.context?.selectedModel) {
-            session.context.selectedModel = modelService.getDefaultModel();
-          }
-          return session;
-        });
-        
-        return migratedSessions;
-      }
-    } catch (error) {
-      console.error("Failed to load sessions from local storage:", error);
-    }
-    return [];
+    // Fallback to localStorage, which is read whole; a follow-up page has nothing more to add
+    return { sessions: cursor ? [] : getLocalSessions(), nextCursor: null };
   },
 
   // Save session to API first, then localStorage
@@ -91,7 +106,7 @@ export const storageService = {
 
     // Fallback to localStorage
     try {
-      const sessions = await storageService.getSessions();
+      const sessions = getLocalSessions();
       const existingIndex = sessions.findIndex(s => s.id === session.id);
       if (existingIndex > -1) {
         sessions[existingIndex] = session;
@@ -104,6 +119,29 @@ export const storageService = {
     }
   },
 
+  // Send only the changes of a turn as a JSON Patch; falls back to a full save
+  patchSession: async (session: NoteSession, operations: Array<{ op: string; path: string; value?: unknown; from?: string }>): Promise<void> => {
+    if (API_BASE_URL) {
+      try {
+        const response = await fetch(`${API_BASE_URL}/sessions/${session.id}`, {
+          method: 'PATCH',
+          headers: {
+            'Content-Type': 'application/json-patch+json',
+          },
+          body: JSON.stringify(operations)
+        });
+
+        if (response.ok) {
+          return; // Successfully patched on API
+        }
+      } catch (error) {
+        console.warn("Failed to patch session via API, saving the full session instead:", error);
+      }
+    }
+
+    await storageService.saveSession(session);
+  },
+
   // Create new session via API
   createSession: async (session: Omit<NoteSession, 'id' | 'lastModified' | 'current_version' | 'versions'>): Promise<NoteSession> => {
     // Only try API if backend URL is configured
@@ -166,8 +204,7 @@ export const storageService = {
     }
 
     // Fallback to localStorage
-    const sessions = await storageService.getSessions();
-    return sessions.find(s => s.id === sessionId) || null;
+    return getLocalSessions().find(s => s.id === sessionId) || null;
   },
 
   // Delete session
@@ -189,7 +226,7 @@ export const storageService = {
 
     // Fallback to localStorage
     try {
-      const sessions = await storageService.getSessions();
+      const sessions = getLocalSessions();
       const filteredSessions = sessions.filter(s => s.id !== sessionId);
       localStorage.setItem(SESSIONS_KEY, JSON.stringify(filteredSessions));
     } catch (error) {
@@ -0,0 +1,164 @@
+"""Shared fixtures: the backend app running on a throwaway SQLite database."""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+import pytest
+from sqlalchemy import event
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Must be set before server is imported; load_dotenv never overrides it
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db"
+
+import llm_client  # noqa: E402
+import rate_limit  # noqa: E402
+import server  # noqa: E402
+
+server.engine.echo = False
+
+
+class Client:
+    """Synchronous wrapper around an in-process httpx client."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.http = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+    def request(self, method, url, **kwargs) -> httpx.Response:
+        return self.loop.run_until_complete(self.http.request(method, url, **kwargs))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+@pytest.fixture(scope="session")
+def client():
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.init_db())
+    yield Client(loop)
+    loop.run_until_complete(server.engine.dispose())
+    loop.close()
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def backend(request, client, monkeypatch):
+    """Runs a test once per storage backend; Postgres needs TEST_POSTGRES_URL pointing at a scratch database."""
+    if request.param == "postgresql":
+        url = os.getenv("TEST_POSTGRES_URL")
+        if not url:
+            pytest.skip("TEST_POSTGRES_URL is not set")
+        monkeypatch.setattr(server, "DATABASE_URL", url.replace("postgresql://", "postgresql+asyncpg://", 1))
+        monkeypatch.setattr(server, "DATABASE_BACKEND", "postgresql")
+        monkeypatch.setattr(server, "_engine", None)
+        monkeypatch.setattr(server, "_session_factory", None)
+        client.loop.run_until_complete(server.init_db())
+    server.read_cache.clear()
+    yield request.param
+    server.read_cache.clear()
+    if request.param == "postgresql":
+        client.loop.run_until_complete(server.engine.dispose())
+
+
+@pytest.fixture
+def count_queries():
+    """Context manager yielding a list that collects every SQL statement executed inside it."""
+
+    @contextmanager
+    def counter():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(server.engine.sync_engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(server.engine.sync_engine, "before_cursor_execute", record)
+
+    return counter
+
+
+@pytest.fixture
+def new_session(client):
+    """Factory creating a session through the API and returning its JSON body."""
+
+    def create(chat_history=None, living_document="# Notes\n"):
+        response = client.post("/api/sessions", json={
+            "context": {"title": "t", "goal": "g", "keywords": "k", "selectedModel": "model-a"},
+            "chatHistory": chat_history or [],
+            "livingDocument": living_document,
+        })
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return create
+
+
+class StubUpstream:
+    """Chat-completions API stand-in: streams ``chunks`` as content deltas and records each request body.
+
+    ``usage``, if set, is sent in a final chunk without choices, as with ``stream_options.include_usage``.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.chunks = ['{"reply": "Hello", "document": "# Notes\\n"}']
+        self.status = 200
+        self.usage = None
+
+    def reply(self, reply, document):
+        text = json.dumps({"reply": reply, "document": document})
+        # Split mid-token, as providers do
+        self.chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        self.requests.append({"path": request.url.path, "headers": dict(request.headers), "body": await request.json()})
+        if self.status != 200:
+            response = JSONResponse({"error": {"message": "stub failure"}}, status_code=self.status)
+        else:
+            response = StreamingResponse(self.events(), media_type="text/event-stream")
+        await response(scope, receive, send)
+
+    async def events(self):
+        yield b": OPENROUTER PROCESSING\n\n"
+        for chunk in self.chunks:
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]})}\n\n".encode()
+        if self.usage is not None:
+            yield f"data: {json.dumps({'choices': [], 'usage': self.usage})}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+
+@pytest.fixture
+def upstream(client, monkeypatch):
+    """Points the chat client at an in-process stub upstream."""
+    stub = StubUpstream()
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=stub), base_url="http://upstream.test/api/v1")
+    monkeypatch.setattr(llm_client, "_client", http)
+    monkeypatch.setattr(llm_client, "API_KEY", "test-key")
+    monkeypatch.setattr(rate_limit, "chat_limiter", rate_limit.RateLimiter(rate_limit.CHAT_RATE_LIMIT))
+    yield stub
+    client.loop.run_until_complete(http.aclose())
@@ -0,0 +1,192 @@
+"""Content-addressed image attachments: hashing, dedupe, Range requests and garbage collection."""
+
+import asyncio
+import base64
+
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import insert, select, update
+
+import attachments
+import server
+
+DATA = bytes(range(100))
+
+
+def image(data=DATA, name="i.png"):
+    return {"name": name, "type": "image/png", "size": len(data), "base64": base64.b64encode(data).decode()}
+
+
+def entry(entry_id, **fields):
+    return {"id": entry_id, "role": "user", "text": f"text {entry_id}", **fields}
+
+
+def test_decode_image():
+    assert attachments.decode_image({"base64": "data:image/png;base64," + base64.b64encode(DATA).decode()}) == DATA
+    with pytest.raises(ValueError):
+        attachments.decode_image({"base64": "not base64!"})
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    # Malformed or unsupported: serve the whole body
+    ("items=0-9", None),
+    ("bytes=0-1,5-6", None),
+    ("bytes=abc-", None),
+    ("bytes=-", None),
+    ("bytes=9-2", None),
+    ("bytes=--5", None),
+])
+def test_parse_range(header, expected):
+    assert attachments.parse_range(header, len(DATA)) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(ValueError):
+        attachments.parse_range(header, len(DATA))
+
+
+def test_images_are_stored_once_and_served_by_hash(client, new_session):
+    session = new_session(chat_history=[entry("a", image=image()), entry("b", image=image(name="copy.png"))])
+    first, second = (e["image"] for e in session["chatHistory"])
+    assert first["hash"] == second["hash"] == attachments.content_hash(DATA)
+    assert first["base64"] is None
+
+    url = f"/api/attachments/{first['hash']}"
+    response = client.get(url)
+    assert response.content == DATA
+    assert response.headers["Cache-Control"] == attachments.CACHE_CONTROL
+    assert client.get(url, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+    suffix = client.get(url, headers={"Range": "bytes=-4"})
+    assert (suffix.status_code, suffix.content) == (206, DATA[-4:])
+    assert suffix.headers["Content-Range"] == "bytes 96-99/100"
+    assert client.get(url, headers={"Range": "bytes=9-2"}).content == DATA
+    unsatisfiable = client.get(url, headers={"Range": "bytes=500-"})
+    assert (unsatisfiable.status_code, unsatisfiable.headers["Content-Range"]) == (416, "bytes */100")
+    assert client.get("/api/attachments/" + "0" * 64).status_code == 404
+
+
+def test_bad_image_is_rejected(client):
+    response = client.post("/api/sessions", json={
+        "context": {"title": "t", "goal": "g", "keywords": "k", "selectedModel": "m"},
+        "chatHistory": [entry("a", image={**image(), "base64": "%%%"})],
+        "livingDocument": "",
+    })
+    assert response.status_code == 400
+
+
+def run(client, statement, commit=False):
+    async def execute():
+        async with server.async_session() as db:
+            result = await db.execute(statement)
+            if commit:
+                await db.commit()
+            else:
+                return result.scalar()
+
+    return client.loop.run_until_complete(execute())
+
+
+@pytest.mark.parametrize("declared", ["text/html", "image/svg+xml", ""])
+def test_only_raster_images_are_accepted(client, declared):
+    response = client.post("/api/sessions", json={
+        "context": {"title": "t", "goal": "g", "keywords": "k", "selectedModel": "m"},
+        "chatHistory": [entry("a", image={**image(b"<script>alert(1)</script>"), "type": declared})],
+        "livingDocument": "",
+    })
+    assert response.status_code == 400
+    assert attachments.content_type({"type": "IMAGE/PNG; charset=x"}) == "image/png"
+
+
+def test_attachments_cannot_be_rendered_as_documents(client, new_session):
+    digest = new_session(chat_history=[entry("a", image=image())])["chatHistory"][0]["image"]["hash"]
+    response = client.get(f"/api/attachments/{digest}")
+    assert response.headers["Content-Type"] == "image/png"
+    assert response.headers["Content-Disposition"] == "inline"
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+    assert "sandbox" in response.headers["Content-Security-Policy"]
+
+    # Stored before types were checked
+    legacy = b"<html><script>alert(1)</script></html>"
+    digest = attachments.content_hash(legacy)
+    run(client, insert(server.AttachmentDB).values(hash=digest, content_type="text/html", size=len(legacy), data=legacy), commit=True)
+    response = client.get(f"/api/attachments/{digest}")
+    assert response.content == legacy
+    assert response.headers["Content-Type"] == "application/octet-stream"
+    assert response.headers["Content-Disposition"] == "attachment"
+    assert client.get(f"/api/attachments/{digest}", headers={"Range": "bytes=0-3"}).headers["X-Content-Type-Options"] == "nosniff"
+
+
+def test_reuploading_refreshes_an_attachment(client, new_session):
+    data = bytes(range(3, 60))
+    digest = new_session(chat_history=[entry("a", image=image(data))])["chatHistory"][0]["image"]["hash"]
+    old = datetime.utcnow() - timedelta(days=2)
+    run(client, update(server.AttachmentDB).where(server.AttachmentDB.hash == digest).values(created_at=old), commit=True)
+
+    new_session(chat_history=[entry("b", image=image(data))])
+    created_at = run(client, select(server.AttachmentDB.created_at).where(server.AttachmentDB.hash == digest))
+    assert created_at > old + timedelta(days=1)
+
+
+def test_gc_keeps_attachments_only_versions_reference(client, new_session):
+    data = bytes(range(11, 90))
+    session = new_session(chat_history=[entry("a", image=image(data))])
+    digest = session["chatHistory"][0]["image"]["hash"]
+    url = f"/api/sessions/{session['id']}"
+    client.put(url, json={"chat_history": [entry("x")]})
+    client.post(f"{url}/versions", json={"session_id": session["id"]})
+
+    client.post("/api/attachments/gc", params={"min_age_seconds": 0})
+    assert client.get(f"/api/attachments/{digest}").status_code == 200
+    client.delete(url)
+    client.post("/api/attachments/gc", params={"min_age_seconds": 0})
+    assert client.get(f"/api/attachments/{digest}").status_code == 404
+
+
+def test_gc_skips_recent_uploads(client, new_session):
+    session = new_session(chat_history=[entry("a", image=image(bytes(range(20, 70))))])
+    digest = session["chatHistory"][0]["image"]["hash"]
+    client.delete(f"/api/sessions/{session['id']}")
+    assert client.post("/api/attachments/gc").json() == {"deleted": 0}
+    assert client.get(f"/api/attachments/{digest}").status_code == 200
+
+
+def test_gc_keeps_referenced_attachments(client, new_session):
+    orphan = bytes(range(50))
+    session = new_session(chat_history=[entry("a", image=image(orphan))])
+    digest = session["chatHistory"][0]["image"]["hash"]
+    kept = new_session(chat_history=[entry("b", image=image())])["chatHistory"][0]["image"]["hash"]
+    client.put(f"/api/sessions/{session['id']}", json={"chat_history": [entry("x")]})
+    # Session creation also stored a version that still references it
+    client.delete(f"/api/sessions/{session['id']}")
+
+    assert client.post("/api/attachments/gc", params={"min_age_seconds": 0}).json()["deleted"] >= 1
+    assert client.get(f"/api/attachments/{digest}").status_code == 404
+    assert client.get(f"/api/attachments/{kept}").status_code == 200
+
+
+def test_concurrent_uploads_of_one_image(client):
+    data = bytes(range(7, 107))
+    body = {
+        "context": {"title": "t", "goal": "g", "keywords": "k", "selectedModel": "m"},
+        "chatHistory": [entry("a", image=image(data))],
+        "livingDocument": "",
+    }
+
+    async def upload():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*(http.post("/api/sessions", json=body) for _ in range(4)))
+
+    responses = client.loop.run_until_complete(upload())
+    assert [response.status_code for response in responses] == [200] * 4
+    assert client.get(f"/api/attachments/{attachments.content_hash(data)}").content == data
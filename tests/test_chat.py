@@ -0,0 +1,132 @@
+"""Server-side chat: prompt from the stored session, reply and document streamed as Server-Sent Events."""
+
+import json
+
+from sqlalchemy import delete
+
+import llm_client
+import prompts
+import server
+
+
+def events(response):
+    """Parsed SSE stream as [(event, data)]."""
+    parsed = []
+    for block in response.text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+def entry(entry_id, role="user"):
+    return {"id": entry_id, "role": role, "text": f"text {entry_id}"}
+
+
+def test_streams_reply_and_document_and_stores_the_turn(client, new_session, upstream):
+    session = new_session(chat_history=[entry("a"), entry("b", role="model")], living_document="# Notes\nold\n")
+    upstream.reply("Got it.", "# Notes\nold\nnew\n")
+
+    response = client.post(f"/api/sessions/{session['id']}/chat", json={"text": "new point"})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/event-stream")
+    stream = events(response)
+    reply = [data["text"] for event, data in stream if event == "reply"]
+    document = [data["text"] for event, data in stream if event == "document"]
+    assert len(reply) > 1
+    assert "".join(reply) == "Got it."
+    assert "".join(document) == "# Notes\nold\nnew\n"
+    event, done = stream[-1]
+    assert event == "done"
+    assert done["reply"] == "Got it."
+    assert done["repaired"] is False
+    assert [e["role"] for e in done["chatEntries"]] == ["user", "model"]
+
+    stored = client.get(f"/api/sessions/{session['id']}")
+    assert stored.headers["ETag"] == done["etag"]
+    stored = stored.json()
+    assert [e["text"] for e in stored["chatHistory"]] == ["text a", "text b", "new point", "Got it."]
+    assert stored["livingDocument"] == "# Notes\nold\nnew\n"
+
+
+def test_prompt_is_built_from_the_stored_session(client, new_session, upstream):
+    session = new_session(chat_history=[entry("a"), entry("b", role="model")], living_document="# Notes\nold\n")
+    client.post(f"/api/sessions/{session['id']}/chat", json={"text": "next", "model": "model-b"})
+
+    request = upstream.requests[-1]
+    assert request["path"] == "/api/v1/chat/completions"
+    assert request["headers"]["authorization"] == "Bearer test-key"
+    body = request["body"]
+    assert body["stream"] is True
+    assert body["stream_options"] == {"include_usage": True}
+    assert body["model"] == "model-b"
+    roles = [message["role"] for message in body["messages"]]
+    assert roles == ["system", "system", "user", "assistant", "system", "user"]
+    assert body["messages"][0]["content"] == prompts.SYSTEM_PROMPT
+    assert "Session Title:** t" in body["messages"][1]["content"]
+    assert body["messages"][4]["content"].endswith("# Notes\nold\n")
+    assert body["messages"][-1]["content"] == "next"
+
+
+def test_upstream_refusal_is_an_http_error(client, new_session, upstream):
+    session = new_session()
+    upstream.status = 429
+    response = client.post(f"/api/sessions/{session['id']}/chat", json={"text": "hi"})
+    assert response.status_code == 429
+    assert "stub failure" in response.json()["detail"]
+    assert client.get(f"/api/sessions/{session['id']}").json()["chatHistory"] == []
+
+
+def test_non_json_answer_keeps_the_document(client, new_session, upstream):
+    session = new_session(living_document="# Notes\nkeep\n")
+    upstream.chunks = ["Just ", "text."]
+    stream = events(client.post(f"/api/sessions/{session['id']}/chat", json={"text": "hi"}))
+    assert "".join(data["text"] for event, data in stream if event == "reply") == "Just text."
+    assert stream[-1][0] == "done"
+    assert stream[-1][1]["document"] is None
+    stored = client.get(f"/api/sessions/{session['id']}").json()
+    assert stored["chatHistory"][-1]["text"] == "Just text."
+    assert stored["livingDocument"] == "# Notes\nkeep\n"
+
+
+def test_missing_session_and_key(client, upstream, monkeypatch, new_session):
+    assert client.post("/api/sessions/missing/chat", json={"text": "hi"}).status_code == 404
+    session = new_session()
+    monkeypatch.setattr(llm_client, "API_KEY", None)
+    assert client.post(f"/api/sessions/{session['id']}/chat", json={"text": "hi"}).status_code == 401
+    response = client.post(f"/api/sessions/{session['id']}/chat", json={"text": "hi"}, headers={"X-LLM-API-Key": "own"})
+    assert response.status_code == 200
+    assert upstream.requests[-1]["headers"]["authorization"] == "Bearer own"
+
+
+def test_truncated_document_is_not_stored(client, new_session, upstream):
+    session = new_session(living_document="# Notes\nkeep\n")
+    upstream.chunks = ['{"reply": "Added.", "docu', 'ment": "# Notes\\nke']
+    stream = events(client.post(f"/api/sessions/{session['id']}/chat", json={"text": "hi"}))
+    event, done = stream[-1]
+    assert event == "done"
+    assert (done["reply"], done["document"], done["repaired"]) == ("Added.", None, True)
+    assert client.get(f"/api/sessions/{session['id']}").json()["livingDocument"] == "# Notes\nkeep\n"
+
+
+def test_lost_write_is_reported_as_a_conflict(client, new_session, upstream, monkeypatch):
+    session = new_session()
+    url = f"/api/sessions/{session['id']}"
+
+    async def always_moved_on(*args, **kwargs):
+        # As if concurrent writes won every attempt
+        return None
+
+    monkeypatch.setattr(server, "update_session_row", always_moved_on)
+    event, error = events(client.post(f"{url}/chat", json={"text": "hi"}))[-1]
+    assert (event, error["status"]) == ("error", 409)
+    assert "not saved" in error["detail"]
+
+    async def deleted_meanwhile(*args, **kwargs):
+        async with server.async_session() as db:
+            await db.execute(delete(server.NoteSessionDB).where(server.NoteSessionDB.id == session["id"]))
+            await db.commit()
+        return None
+
+    monkeypatch.setattr(server, "update_session_row", deleted_meanwhile)
+    event, error = events(client.post(f"{url}/chat", json={"text": "hi"}))[-1]
+    assert (event, error) == ("error", {"status": 404, "detail": "Session was deleted"})
@@ -0,0 +1,63 @@
+"""Chat history stored one row per entry: appends, edits and rewrites."""
+
+from sqlalchemy import select
+
+import server
+
+
+def entry(entry_id, role="user", text=None):
+    return {"id": entry_id, "role": role, "text": text or f"text {entry_id}"}
+
+
+def stored_rows(client, session_id):
+    async def load():
+        async with server.async_session() as db:
+            result = await db.execute(
+                select(server.ChatEntryDB.seq, server.ChatEntryDB.entry_id, server.ChatEntryDB.text)
+                .where(server.ChatEntryDB.session_id == session_id)
+                .order_by(server.ChatEntryDB.seq)
+            )
+            return [tuple(row) for row in result]
+
+    return client.loop.run_until_complete(load())
+
+
+def test_append_message(client, new_session):
+    session = new_session(chat_history=[entry("a")])
+    url = f"/api/sessions/{session['id']}"
+    response = client.post(f"{url}/messages", json=entry("b", role="model"))
+    assert response.status_code == 200
+    assert response.json()["id"] == "b"
+    assert stored_rows(client, session["id"]) == [(1, "a", "text a"), (2, "b", "text b")]
+    assert client.post("/api/sessions/missing/messages", json=entry("c")).status_code == 404
+
+
+def test_put_keeps_unchanged_prefix(client, new_session):
+    session = new_session(chat_history=[entry("a"), entry("b"), entry("c")])
+    url = f"/api/sessions/{session['id']}"
+    client.put(url, json={"chat_history": [entry("a"), entry("b"), entry("d")]})
+    assert stored_rows(client, session["id"]) == [(1, "a", "text a"), (2, "b", "text b"), (3, "d", "text d")]
+
+
+def test_put_edit_of_an_existing_entry_is_stored(client, new_session):
+    session = new_session(chat_history=[entry("a", text="orig"), entry("b")])
+    url = f"/api/sessions/{session['id']}"
+    response = client.put(url, json={"chat_history": [entry("a", text="EDITED"), entry("b")]})
+    assert [e["text"] for e in response.json()["chatHistory"]] == ["EDITED", "text b"]
+    assert [e["text"] for e in client.get(url).json()["chatHistory"]] == ["EDITED", "text b"]
+
+
+def test_patch_edit_of_an_existing_entry_is_stored(client, new_session):
+    session = new_session(chat_history=[entry("a", text="orig"), entry("b")])
+    url = f"/api/sessions/{session['id']}"
+    response = client.patch(url, json=[{"op": "replace", "path": "/chatHistory/0/text", "value": "EDITED"}])
+    assert response.status_code == 200, response.text
+    assert [e["text"] for e in client.get(url).json()["chatHistory"]] == ["EDITED", "text b"]
+
+
+def test_put_entry_without_id_is_rejected(client, new_session):
+    session = new_session(chat_history=[entry("a")])
+    url = f"/api/sessions/{session['id']}"
+    assert client.put(url, json={"chat_history": [{"role": "user", "text": "no id"}]}).status_code == 422
+    assert client.put(url, json={"chat_history": "not a list"}).status_code == 422
+    assert [e["id"] for e in client.get(url).json()["chatHistory"]] == ["a"]
@@ -0,0 +1,146 @@
+"""Checkpoints appended in SQL must decode to the same versions as the Python fallback, on every backend."""
+
+import pytest
+from sqlalchemy import select
+
+import server
+import version_store
+
+CONTEXT = {"title": "t", "goal": "g", "keywords": "k", "selectedModel": "model-a"}
+
+
+def entry(entry_id, role="user"):
+    return {"id": entry_id, "role": role, "text": f"text {entry_id}"}
+
+
+@pytest.fixture(params=["sql", "python"])
+def checkpoint_path(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(server.sql_json, "supports", lambda dialect: False)
+    return request.param
+
+
+def stored_versions(client, session_id):
+    async def load():
+        async with server.async_session() as db:
+            return await db.scalar(select(server.NoteSessionDB.versions).where(server.NoteSessionDB.id == session_id))
+
+    return client.loop.run_until_complete(load())
+
+
+def run_history(client):
+    """Exercise every endpoint that writes a version; returns the session id."""
+    session = client.post("/api/sessions", json={
+        "context": CONTEXT, "chatHistory": [entry("a")], "livingDocument": "# Notes\n",
+    }).json()
+    session_id = session["id"]
+
+    client.post(f"/api/sessions/{session_id}/messages", json=entry("b"))
+    client.patch(f"/api/sessions/{session_id}", json=[
+        {"op": "add", "path": "/chatHistory/-", "value": entry("c", role="model")},
+        {"op": "replace", "path": "/livingDocument", "value": "# Notes\none\n"},
+    ])
+    v2 = client.post(f"/api/sessions/{session_id}/versions", json={"session_id": session_id, "checkpoint_name": "v2"})
+    assert v2.status_code == 200
+    assert v2.json()["version_number"] == 2
+    assert [e["id"] for e in v2.json()["chatHistory"]] == ["a", "b", "c"]
+    client.post(f"/api/sessions/{session_id}/versions", json={"session_id": session_id, "checkpoint_name": "v3"})
+
+    # Rewrite the tail of the history and the document
+    client.put(f"/api/sessions/{session_id}", json={
+        "chat_history": [entry("a"), entry("x")], "living_document": "# Notes\ntwo\n",
+    })
+    client.post(f"/api/sessions/{session_id}/switch-model", json={"session_id": session_id, "new_model": "model-b"})
+    client.post(f"/api/sessions/{session_id}/restore", json={
+        "session_id": session_id, "version_id": v2.json()["id"],
+    })
+    client.post(f"/api/sessions/{session_id}/versions", json={"session_id": session_id, "checkpoint_name": "v6"})
+    return session_id
+
+
+def test_versions_match_history(client, backend, checkpoint_path):
+    session_id = run_history(client)
+
+    versions = client.get(f"/api/sessions/{session_id}/versions").json()
+    assert [
+        (v["version_number"], [e["id"] for e in v["chatHistory"]], v["livingDocument"], v["modelUsed"])
+        for v in versions
+    ] == [
+        (1, ["a"], "# Notes\n", "model-a"),
+        (2, ["a", "b", "c"], "# Notes\none\n", "model-a"),
+        (3, ["a", "b", "c"], "# Notes\none\n", "model-a"),
+        (4, ["a", "x"], "# Notes\ntwo\n", "model-a"),
+        (5, ["a", "x"], "# Notes\ntwo\n", "model-b"),
+        (6, ["a", "b", "c"], "# Notes\none\n", "model-a"),
+    ]
+    assert [v["checkpoint_name"] for v in versions][5] == "v6"
+    assert versions[4]["checkpoint_name"] == "Auto-backup before restore to v2"
+
+    session = client.get(f"/api/sessions/{session_id}").json()
+    assert session["current_version"] == 6
+    assert session["context"]["selectedModel"] == "model-a"
+
+
+def test_checkpoints_are_deltas(client, backend, checkpoint_path):
+    session_id = run_history(client)
+
+    records = stored_versions(client, session_id)
+    assert [record.get("kind") for record in records] == ["keyframe"] + ["delta"] * 5
+    # v3 changed nothing, so it stores neither entries nor a document
+    assert records[2]["chat"] == {"base": 3, "append": []}
+    assert records[2]["doc"] is None
+    # v4 follows a rewrite that kept only the first entry
+    assert records[3]["chat"]["base"] == 1
+    assert [e["id"] for e in records[3]["chat"]["append"]] == ["x"]
+
+
+def test_keyframe_interval(client, backend, checkpoint_path, monkeypatch):
+    monkeypatch.setattr(version_store, "KEYFRAME_INTERVAL", 2)
+    session_id = client.post("/api/sessions", json={
+        "context": CONTEXT, "chatHistory": [entry("a")], "livingDocument": "",
+    }).json()["id"]
+    for name in ("v2", "v3", "v4"):
+        client.post(f"/api/sessions/{session_id}/messages", json=entry(name))
+        client.post(f"/api/sessions/{session_id}/versions", json={"session_id": session_id, "checkpoint_name": name})
+
+    records = stored_versions(client, session_id)
+    assert [(record["kind"], record["depth"]) for record in records] == [
+        ("keyframe", 0), ("delta", 1), ("keyframe", 0), ("delta", 1),
+    ]
+    versions = client.get(f"/api/sessions/{session_id}/versions").json()
+    assert [e["id"] for e in versions[-1]["chatHistory"]] == ["a", "v2", "v3", "v4"]
+
+
+def test_document_checkpoints_store_line_diffs(client, backend, checkpoint_path):
+    lines = [f"line {i}\n" for i in range(200)]
+    session_id = client.post("/api/sessions", json={
+        "context": CONTEXT, "chatHistory": [entry("a")], "livingDocument": "".join(lines),
+    }).json()["id"]
+    for turn in range(3):
+        lines[turn * 50] = f"edited {turn}\n"
+        client.post(f"/api/sessions/{session_id}/messages", json=entry(f"m{turn}"))
+        client.put(f"/api/sessions/{session_id}", json={"living_document": "".join(lines)})
+        client.post(f"/api/sessions/{session_id}/versions", json={"session_id": session_id})
+
+    records = stored_versions(client, session_id)
+    for record in records[1:]:
+        inserted = [op for op in record["doc"] if isinstance(op, list)]
+        assert sum(len(line) for op in inserted for line in op) < 20
+    versions = client.get(f"/api/sessions/{session_id}/versions").json()
+    assert versions[-1]["livingDocument"] == "".join(lines)
+
+
+def test_put_cannot_replace_versions(client, backend):
+    session_id = client.post("/api/sessions", json={
+        "context": CONTEXT, "chatHistory": [entry("a")], "livingDocument": "",
+    }).json()["id"]
+    url = f"/api/sessions/{session_id}"
+    forged = [{"id": "v1", "kind": "keyframe", "depth": 0, "chatHistory": [entry("e9")], "livingDocument": ""}]
+    for field, value in (("versions", forged), ("versioned_chat_length", 0), ("document_versioned", True), ("current_version", 9)):
+        assert client.put(url, json={field: value}).status_code == 422
+    assert client.put(url, json={"context": {"title": "t"}}).status_code == 422
+
+    client.post(f"{url}/messages", json=entry("e4"))
+    client.post(f"{url}/versions", json={"session_id": session_id})
+    versions = client.get(f"{url}/versions").json()
+    assert [[e["id"] for e in v["chatHistory"]] for v in versions] == [["a"], ["a", "e4"]]
@@ -0,0 +1,96 @@
+"""Opt-in cache of upstream completions: keys, LRU and TTL, and replay through the chat endpoint."""
+
+import pytest
+
+import completion_cache
+import server
+
+
+def payload(**changes):
+    request = {
+        "model": "model-a",
+        "messages": [{"role": "system", "content": "static"}, {"role": "user", "content": "hi"}],
+        "temperature": 0.7,
+        "max_tokens": 2048,
+        "stream": True,
+    }
+    return {**request, **changes}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_ignores_encoding_but_not_sampling():
+    hinted = payload(messages=[
+        {"role": "system", "content": [{"type": "text", "text": "static", "cache_control": {"type": "ephemeral"}}]},
+        {"role": "user", "content": "hi"},
+    ], stream_options={"include_usage": True})
+    assert completion_cache.key(hinted) == completion_cache.key(payload())
+    assert completion_cache.key(payload(temperature=0.2)) != completion_cache.key(payload())
+    assert completion_cache.key(payload(model="model-b")) != completion_cache.key(payload())
+
+
+def test_lru_eviction_and_ttl(tmp_path):
+    clock = Clock()
+    cache = completion_cache.CompletionCache(str(tmp_path / "llm.db"), max_bytes=120, ttl=60, clock=clock)
+    texts = {name: name * 100 + "".join(str(i) for i in range(40)) for name in "abc"}
+    cache.put("a", "m", texts["a"])
+    clock.now += 1
+    cache.put("b", "m", texts["b"])
+    clock.now += 1
+    assert cache.get("a") == texts["a"]
+    clock.now += 1
+    cache.put("c", "m", texts["c"])
+    # "b" was least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == texts["a"]
+    assert cache.stats()["evictions"] >= 1
+
+    clock.now += 61
+    assert cache.get("c") is None
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["bytes"] <= 120
+    cache.close()
+
+
+@pytest.fixture
+def response_cache(tmp_path, monkeypatch):
+    cache = completion_cache.CompletionCache(str(tmp_path / "llm.db"))
+    monkeypatch.setattr(server, "response_cache", cache)
+    yield cache
+    cache.close()
+
+
+def test_identical_prompts_are_answered_from_the_cache(client, new_session, upstream, response_cache):
+    upstream.reply("Cached answer.", "# Notes\n- cached\n")
+    first = client.post(f"/api/sessions/{new_session()['id']}/chat", json={"text": "hi"})
+    assert first.headers["X-LLM-Cache"] == "miss"
+
+    # A second session with the same context and document builds the same prompt
+    session = new_session()
+    second = client.post(f"/api/sessions/{session['id']}/chat", json={"text": "hi"})
+    assert second.headers["X-LLM-Cache"] == "hit"
+    assert len(upstream.requests) == 1
+    assert '"reply":"Cached answer."' in second.text
+    assert client.get(f"/api/sessions/{session['id']}").json()["livingDocument"] == "# Notes\n- cached\n"
+
+    bypass = client.post(f"/api/sessions/{new_session()['id']}/chat", json={"text": "hi"}, headers={"X-LLM-Cache": "bypass"})
+    assert bypass.headers["X-LLM-Cache"] == "bypass"
+    assert len(upstream.requests) == 2
+
+    body = client.get("/api/metrics").text
+    assert "llm_completion_cache_hits_total 1" in body
+    assert "llm_completion_cache_bypasses_total 1" in body
+    assert "llm_completion_cache_entries 1" in body
+
+
+def test_repaired_answers_are_not_stored(client, new_session, upstream, response_cache):
+    upstream.chunks = ['{"reply": "Cut o']
+    client.post(f"/api/sessions/{new_session()['id']}/chat", json={"text": "hi"})
+    assert response_cache.stats()["entries"] == 0
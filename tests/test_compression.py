@@ -0,0 +1,152 @@
+"""Compressed responses and compressed request bodies."""
+
+import asyncio
+import gzip
+import json
+
+import brotli
+import httpx
+import pytest
+import zstandard
+from starlette.responses import StreamingResponse
+
+import compression
+
+
+# httpx 0.25 cannot decode zstd, so bodies are read raw and decoded here
+DECODERS = {
+    "br": brotli.decompress,
+    "zstd": lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+}
+
+
+def big_document():
+    return "# Notes\n" + "".join(f"- point {i} lorem ipsum dolor sit amet\n" for i in range(500))
+
+
+def raw_get(client, url, headers):
+    """A response and its body exactly as sent, before httpx decodes it."""
+    async def fetch():
+        async with client.http.stream("GET", url, headers=headers) as response:
+            return response, b"".join([chunk async for chunk in response.aiter_raw()])
+
+    return client.loop.run_until_complete(fetch())
+
+
+def test_large_responses_are_gzipped(client, new_session):
+    session = new_session(living_document=big_document())
+    response = client.get(f"/api/sessions/{session['id']}", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert int(response.headers["Content-Length"]) < len(big_document()) / 5
+    # httpx decodes transparently
+    assert response.json()["livingDocument"] == big_document()
+
+
+@pytest.mark.parametrize("coding", ["zstd", "br"])
+def test_preferred_codings(client, new_session, coding):
+    session = new_session(living_document=big_document())
+    accept = f"gzip;q=0.5, {coding}"
+    response, body = raw_get(client, f"/api/sessions/{session['id']}", {"Accept-Encoding": accept})
+    assert response.headers["Content-Encoding"] == coding
+    assert len(body) < len(big_document()) / 5
+    assert json.loads(DECODERS[coding](body))["livingDocument"] == big_document()
+
+
+def test_small_and_unaccepted_responses_pass_through(client, new_session):
+    session = new_session(living_document=big_document())
+    assert "Content-Encoding" not in client.get("/api/health", headers={"Accept-Encoding": "gzip"}).headers
+    response = client.get(f"/api/sessions/{session['id']}", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    response = client.get(f"/api/sessions/{session['id']}", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_gzip_request_body(client, new_session):
+    session = new_session()
+    body = gzip.compress(json.dumps({"living_document": big_document()}).encode())
+    response = client.put(
+        f"/api/sessions/{session['id']}",
+        content=body,
+        headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["livingDocument"] == big_document()
+
+
+def test_zstd_request_body(client, new_session):
+    session = new_session()
+    body = zstandard.ZstdCompressor().compress(json.dumps({"living_document": big_document()}).encode())
+    response = client.put(
+        f"/api/sessions/{session['id']}",
+        content=body,
+        headers={"Content-Encoding": "zstd", "Content-Type": "application/json"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["livingDocument"] == big_document()
+
+
+def test_bad_request_bodies(client, new_session):
+    session = new_session()
+    url = f"/api/sessions/{session['id']}"
+    headers = {"Content-Type": "application/json"}
+    response = client.put(url, content=b"{}", headers={**headers, "Content-Encoding": "compress"})
+    assert response.status_code == 415
+    response = client.put(url, content=b"not gzip", headers={**headers, "Content-Encoding": "gzip"})
+    assert response.status_code == 400
+
+    with pytest.raises(OverflowError):
+        compression.GzipDecoder().decompress(gzip.compress(b" " * 100_000), 1000)
+
+
+@pytest.mark.parametrize("coding", ["gzip", "zstd", "br"])
+def test_streamed_responses_are_compressed_per_chunk(coding):
+    async def chunks():
+        for i in range(3):
+            yield json.dumps({"chunk": i, "padding": "x" * 2000}).encode()
+
+    async def app(scope, receive, send):
+        await StreamingResponse(chunks(), media_type="application/json")(scope, receive, send)
+
+    async def fetch():
+        transport = httpx.ASGITransport(app=compression.CompressionMiddleware(app))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            async with http.stream("GET", "/", headers={"Accept-Encoding": coding}) as response:
+                return response, b"".join([chunk async for chunk in response.aiter_raw()])
+
+    response, body = asyncio.run(fetch())
+    assert response.headers["Content-Encoding"] == coding
+    assert "Content-Length" not in response.headers
+    assert DECODERS.get(coding, gzip.decompress)(body).count(b'"chunk"') == 3
+
+
+def test_choose_encoding():
+    assert compression.choose_encoding("") is None
+    assert compression.choose_encoding("gzip, deflate") == "gzip"
+    assert compression.choose_encoding("*") == "zstd"
+    assert compression.choose_encoding("gzip, br") == "br"
+    assert compression.choose_encoding("gzip;q=0, identity") is None
+    assert compression.choose_encoding("compress, gzip;q=0.5") == "gzip"
+
+
+def test_decoded_output_is_bounded():
+    sink = compression.BoundedSink()
+    sink.limit = 10
+    sink.write(b"x" * 6)
+    with pytest.raises(OverflowError):
+        sink.write(b"x" * 6)
+
+    bomb = zstandard.ZstdCompressor().compress(b" " * 10_000_000)
+    with pytest.raises(OverflowError):
+        compression.ZstdDecoder().decompress(bomb, 1000)
+
+
+def test_compressed_responses_get_weak_etags(client, new_session):
+    session = new_session(living_document=big_document())
+    url = f"/api/sessions/{session['id']}"
+    plain = client.get(url, headers={"Accept-Encoding": "identity"}).headers["ETag"]
+    compressed = client.get(url, headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    assert compressed == "W/" + plain
+    assert client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": compressed}).status_code == 304
+    response = client.put(url, json={"living_document": "short"}, headers={"If-Match": compressed})
+    assert response.status_code == 200
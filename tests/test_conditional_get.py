@@ -0,0 +1,58 @@
+"""Conditional GET: unchanged sessions cost one indexed lookup and an empty 304."""
+
+import pytest
+
+import server
+
+
+def entry(entry_id, role="user"):
+    return {"id": entry_id, "role": role, "text": f"text {entry_id}"}
+
+
+@pytest.fixture(params=["session", "versions"])
+def url(request, new_session):
+    session = new_session(chat_history=[entry("a")])
+    suffix = "/versions" if request.param == "versions" else ""
+    return f"/api/sessions/{session['id']}{suffix}"
+
+
+def test_if_none_match(client, count_queries, url):
+    first = client.get(url)
+    assert first.headers["Cache-Control"] == "no-cache"
+    server.read_cache.clear()
+    with count_queries() as statements:
+        response = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == first.headers["ETag"]
+    assert len(statements) == 1
+
+    # weak comparison, any tag in the list
+    assert client.get(url, headers={"If-None-Match": f'"0", W/{first.headers["ETag"]}'}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": '"999"'}).status_code == 200
+
+
+def test_if_modified_since(client, url):
+    first = client.get(url)
+    last_modified = first.headers["Last-Modified"]
+    assert client.get(url, headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(url, headers={"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"}).status_code == 200
+    assert client.get(url, headers={"If-Modified-Since": "not a date"}).status_code == 200
+    # If-None-Match takes precedence
+    response = client.get(url, headers={"If-Modified-Since": last_modified, "If-None-Match": '"999"'})
+    assert response.status_code == 200
+
+
+def test_writes_change_validators(client, new_session):
+    session = new_session(chat_history=[entry("a")])
+    session_id = session["id"]
+    first = client.get(f"/api/sessions/{session_id}/versions")
+    client.post(f"/api/sessions/{session_id}/versions", json={"session_id": session_id, "checkpoint_name": "cp"})
+
+    response = client.get(f"/api/sessions/{session_id}/versions", headers={"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+
+
+def test_missing_session(client):
+    assert client.get("/api/sessions/missing", headers={"If-None-Match": '"1"'}).status_code == 404
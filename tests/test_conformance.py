@@ -0,0 +1,254 @@
+"""The full API, run against every storage backend (see the ``backend`` fixture)."""
+
+import asyncio
+import base64
+import uuid
+
+import pytest
+from sqlalchemy import delete, func, select, text, update
+
+import server
+import session_cache
+
+CONTEXT = {"title": "t", "goal": "g", "keywords": "k", "selectedModel": "model-a"}
+PIXEL = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==")
+
+
+def entry(entry_id, role="user", **fields):
+    return {"id": entry_id, "role": role, "text": f"text {entry_id}", **fields}
+
+
+def create(client, chat_history=(), living_document="# Notes\n"):
+    response = client.post("/api/sessions", json={
+        "context": CONTEXT, "chatHistory": list(chat_history), "livingDocument": living_document,
+    })
+    assert response.status_code == 200, response.text
+    return response
+
+
+def run(client, query):
+    async def execute():
+        async with server.async_session() as db:
+            return await db.scalar(query)
+
+    return client.loop.run_until_complete(execute())
+
+
+def test_session_lifecycle(client, backend):
+    created = create(client, [entry("a")])
+    session = created.json()
+    url = f"/api/sessions/{session['id']}"
+    assert session["current_version"] == 1
+
+    fetched = client.get(url)
+    assert fetched.json()["chatHistory"] == [entry("a", image=None)]
+    assert fetched.headers["ETag"] == created.headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": fetched.headers["ETag"]}).status_code == 304
+
+    updated = client.put(url, json={"living_document": "# Notes\none\n"}, headers={"If-Match": fetched.headers["ETag"]})
+    assert updated.status_code == 200
+    assert updated.json()["livingDocument"] == "# Notes\none\n"
+    stale = client.put(url, json={"living_document": "lost"}, headers={"If-Match": fetched.headers["ETag"]})
+    assert stale.status_code == 412
+
+    assert client.post(f"{url}/messages", json=entry("b", role="model")).status_code == 200
+    patched = client.patch(url, json=[
+        {"op": "add", "path": "/chatHistory/-", "value": entry("c")},
+        {"op": "replace", "path": "/context/title", "value": "renamed"},
+    ])
+    assert patched.status_code == 200, patched.text
+
+    final = client.get(url).json()
+    assert [e["id"] for e in final["chatHistory"]] == ["a", "b", "c"]
+    assert final["context"]["title"] == "renamed"
+    assert final["livingDocument"] == "# Notes\none\n"
+
+    assert client.get("/api/sessions/missing").status_code == 404
+    assert client.put("/api/sessions/missing", json={"living_document": "x"}).status_code == 404
+
+
+def test_listing_and_export(client, backend):
+    ids = [create(client).json()["id"] for _ in range(3)]
+    first = client.get("/api/sessions", params={"limit": 2}).json()
+    assert len(first["sessions"]) == 2
+    second = client.get("/api/sessions", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    listed = [s["id"] for s in first["sessions"] + second["sessions"]]
+    assert len(set(listed)) == len(listed)
+    assert listed[:3] == ids[::-1]
+
+    exported = {s["id"] for s in client.get("/api/sessions/export").json()}
+    assert set(ids) <= exported
+
+
+def test_versions(client, backend):
+    session = create(client, [entry("a")]).json()
+    url = f"/api/sessions/{session['id']}"
+    v2 = client.post(f"{url}/versions", json={"session_id": session["id"], "checkpoint_name": "v2"}).json()
+    client.put(url, json={"chat_history": [entry("a"), entry("b")], "living_document": "# Notes\nnew\n"})
+    switched = client.post(f"{url}/switch-model", json={"session_id": session["id"], "new_model": "model-b"})
+    assert switched.status_code == 200, switched.text
+
+    versions = client.get(f"{url}/versions").json()
+    assert [v["version_number"] for v in versions] == [1, 2, 3]
+    assert versions[2]["chatHistory"][-1]["id"] == "b"
+    assert versions[2]["livingDocument"] == "# Notes\nnew\n"
+    assert client.get(url).json()["context"]["selectedModel"] == "model-b"
+
+    restored = client.post(f"{url}/restore", json={"session_id": session["id"], "version_id": v2["id"]})
+    assert restored.status_code == 200, restored.text
+    after = client.get(url).json()
+    assert [e["id"] for e in after["chatHistory"]] == ["a"]
+    assert after["livingDocument"] == "# Notes\n"
+
+    count = len(client.get(f"{url}/versions").json())
+    assert client.delete(f"{url}/versions/{v2['id']}").status_code == 200
+    assert len(client.get(f"{url}/versions").json()) == count - 1
+
+
+def test_document_revisions(client, backend):
+    session = create(client).json()
+    url = f"/api/sessions/{session['id']}"
+    documents = ["# Notes\n"] + [f"# Notes\nline {i}\n" for i in range(3)]
+    for document in documents[1:]:
+        client.put(url, json={"living_document": document})
+
+    revisions = client.get(f"{url}/document/revisions").json()
+    assert len(revisions) == len(documents)
+    for revision, document in zip(revisions, documents):
+        rebuilt = client.get(f"{url}/document/revisions/{revision['revision']}").json()
+        assert rebuilt["livingDocument"] == document
+
+
+def test_history_rewrites(client, backend):
+    image = {"name": "p.png", "type": "image/png", "size": len(PIXEL), "base64": base64.b64encode(PIXEL).decode()}
+    session = create(client, [entry("a", image=image), entry("b"), entry("c")]).json()
+    url = f"/api/sessions/{session['id']}"
+    first = session["chatHistory"][0]
+
+    def stored(column, *conditions):
+        return run(client, select(column).where(server.ChatEntryDB.session_id == session["id"], *conditions))
+
+    created = stored(server.ChatEntryDB.created_at, server.ChatEntryDB.seq == 1)
+
+    for ids in (["a", "b", "c", "d"], ["a", "x"], ["a", "x"], ["a"], ["a", "y", "z"]):
+        history = [first] + [entry(entry_id) for entry_id in ids[1:]]
+        response = client.put(url, json={"chat_history": history})
+        assert response.status_code == 200, response.text
+        assert [e["id"] for e in client.get(url).json()["chatHistory"]] == ids
+        assert stored(func.count()) == stored(func.max(server.ChatEntryDB.seq)) == len(ids)
+    # The entry echoed back with its stored image reference was never rewritten
+    assert stored(server.ChatEntryDB.created_at, server.ChatEntryDB.seq == 1) == created
+    # The initial version shares only the first entry with the rewritten history
+    assert run(client, select(server.NoteSessionDB.versioned_chat_length).where(
+        server.NoteSessionDB.id == session["id"]
+    )) == 1
+    client.post(f"{url}/versions", json={"session_id": session["id"], "checkpoint_name": "v2"})
+    versions = client.get(f"{url}/versions").json()
+    assert [e["id"] for e in versions[-1]["chatHistory"]] == ["a", "y", "z"]
+
+
+def test_concurrent_writes_stay_consistent(client, backend):
+    session = create(client).json()
+    url = f"/api/sessions/{session['id']}"
+    documents = [f"# Notes\nwriter {i}\n" for i in range(6)]
+
+    async def race(requests):
+        return await asyncio.gather(*requests)
+
+    written = client.loop.run_until_complete(race(
+        client.http.put(url, json={"living_document": document}) for document in documents
+    ))
+    appended = client.loop.run_until_complete(race(
+        client.http.post(f"{url}/messages", json=entry(f"m{i}")) for i in range(6)
+    ))
+    # Blind writes retry when they lose a race, and never fail on a duplicate key
+    assert {response.status_code for response in written + appended} <= {200, 409}
+
+    final = client.get(url).json()
+    assert final["livingDocument"] in documents
+    assert len(final["chatHistory"]) == sum(response.status_code == 200 for response in appended)
+    revisions = client.get(f"{url}/document/revisions").json()
+    assert [r["revision"] for r in revisions] == list(range(1, len(revisions) + 1))
+    latest = client.get(f"{url}/document/revisions/{len(revisions)}").json()
+    assert latest["livingDocument"] == final["livingDocument"]
+
+
+def test_attachments(client, backend):
+    image = {"name": "p.png", "type": "image/png", "size": len(PIXEL), "base64": base64.b64encode(PIXEL).decode()}
+    session = create(client, [entry("a", image=image)]).json()
+    stored = session["chatHistory"][0]["image"]
+    assert stored["base64"] is None
+
+    response = client.get(f"/api/attachments/{stored['hash']}")
+    assert response.content == PIXEL
+    assert response.headers["Content-Type"] == "image/png"
+    partial = client.get(f"/api/attachments/{stored['hash']}", headers={"Range": "bytes=0-7"})
+    assert partial.status_code == 206
+    assert partial.content == PIXEL[:8]
+
+
+
+def test_attachment_collection(client, backend):
+    # Unique bytes: a scratch Postgres database keeps the sessions of earlier runs
+    data = PIXEL + uuid.uuid4().bytes
+    image = {"name": "p.png", "type": "image/png", "size": len(data), "base64": base64.b64encode(data).decode()}
+    session = create(client, [entry("a", image=image)]).json()
+    url = f"/api/attachments/{session['chatHistory'][0]['image']['hash']}"
+
+    # Only the initial version references it once the entry is gone
+    client.put(f"/api/sessions/{session['id']}", json={"chat_history": [entry("b")]})
+    client.post("/api/attachments/gc", params={"min_age_seconds": 0})
+    assert client.get(url).status_code == 200
+    client.delete(f"/api/sessions/{session['id']}")
+    assert client.post("/api/attachments/gc", params={"min_age_seconds": 0}).json()["deleted"] >= 1
+    assert client.get(url).status_code == 404
+
+
+def test_delete_cascades(client, backend):
+    session = create(client, [entry("a"), entry("b")]).json()
+    url = f"/api/sessions/{session['id']}"
+    client.put(url, json={"living_document": "# Notes\nmore\n"})
+    assert client.delete(url).status_code == 200
+    assert client.get(url).status_code == 404
+
+    for model in (server.ChatEntryDB, server.DocumentRevisionDB):
+        assert run(client, select(func.count()).select_from(model).where(model.session_id == session["id"])) == 0
+
+
+def test_notifications_invalidate_other_instances(client, backend):
+    if backend != "postgresql":
+        pytest.skip("NOTIFY is Postgres only")
+    session = create(client).json()
+    # Another instance's cache, holding bodies at the session's current version
+    cache = session_cache.SessionCache()
+    cache.put(session["id"], "session", 1, b"{}")
+    cache.put(session["id"], "versions", 1, b"[]")
+
+    async def write_and_wait(statement, view):
+        listener = await session_cache.listen(server.get_engine(), cache)
+        try:
+            async with server.async_session() as db:
+                await db.execute(statement)
+                await db.commit()
+            for _ in range(100):
+                if not cache.holds(session["id"], view):
+                    return True
+                await asyncio.sleep(0.02)
+            return False
+        finally:
+            await listener.close()
+
+    sessions = server.NoteSessionDB
+    bump = update(sessions).where(sessions.id == session["id"]).values(row_version=sessions.row_version + 1)
+    assert client.loop.run_until_complete(write_and_wait(bump, "session"))
+    assert cache.remote_invalidations == 2
+
+    cache.put(session["id"], "session", 2, b"{}")
+    deleted = delete(sessions).where(sessions.id == session["id"])
+    assert client.loop.run_until_complete(write_and_wait(deleted, "session"))
+
+
+def test_sqlite_pragmas(client):
+    assert run(client, text("PRAGMA journal_mode")) == "wal"
+    assert run(client, text("PRAGMA foreign_keys")) == 1
+    assert run(client, text("PRAGMA busy_timeout")) == server.sqlite_backend.BUSY_TIMEOUT_MS
@@ -0,0 +1,82 @@
+"""Chat prompts stay within the token budget; older turns are replaced by a rolling summary."""
+
+import asyncio
+
+import context_window
+import prompts
+import server
+
+
+def entry(entry_id, role="user", words=20):
+    return {"id": entry_id, "role": role, "text": f"{entry_id} " + "word " * words}
+
+
+def wait_for_summaries(client):
+    async def wait():
+        await asyncio.gather(*server.summary_tasks.values())
+
+    client.loop.run_until_complete(wait())
+
+
+def test_token_counts():
+    assert context_window.family("meta-llama/llama-3.2-3b-instruct:free") == "meta-llama"
+    assert context_window.family("claude-3-haiku") == "anthropic"
+    text = "The quick brown fox jumps over the lazy dog. " * 20
+    assert context_window.count_text("microsoft/phi-3-mini", text) > context_window.count_text("anthropic/claude-3", text)
+    assert context_window.count_text("unknown", "日本語") == 3
+
+    image = {"base64": "AAAA", "type": "image/png"}
+    plain = [{"role": "user", "content": "hi"}]
+    with_image = [{"role": "user", "content": prompts.user_content("hi", image)}]
+    assert context_window.count_messages("m", with_image) == context_window.count_messages("m", plain) + context_window.IMAGE_TOKENS
+
+
+def test_recent_entries_fit_the_budget():
+    entries = [entry(str(i)) for i in range(10)]
+    per_entry = context_window.MESSAGE_OVERHEAD + context_window.count_text("m", entries[0]["text"])
+    assert context_window.recent_entries("m", entries, per_entry * 3 + 1) == entries[-3:]
+    assert context_window.recent_entries("m", entries, 0) == []
+
+
+def test_old_turns_are_summarised(client, new_session, upstream, monkeypatch):
+    history = [entry(str(i), role="model" if i % 2 else "user") for i in range(12)]
+    session = new_session(chat_history=history)
+    url = f"/api/sessions/{session['id']}"
+    fixed = prompts.build_messages(session["context"], [], session["livingDocument"], "next")
+    per_entry = context_window.MESSAGE_OVERHEAD + context_window.count_text("model-a", history[-1]["text"])
+    monkeypatch.setattr(context_window, "TOKEN_BUDGET", context_window.count_messages("model-a", fixed) + per_entry * 5)
+    monkeypatch.setattr(context_window, "RECENT_ENTRIES", 4)
+
+    # The summary job runs alongside the turn and gets the same stub answer
+    upstream.chunks = ["Earlier: ", "points 0 to 7."]
+    client.post(f"{url}/chat", json={"text": "next"})
+    sent = upstream.requests[0]["body"]["messages"]
+    assert [m["content"] for m in sent[2:-2]] == [e["text"] for e in history[-5:]]
+
+    # Everything but the four newest entries is summarised in the background
+    wait_for_summaries(client)
+    summary = upstream.requests[1]["body"]
+    assert "response_format" not in summary
+    turns = summary["messages"][-1]["content"]
+    assert "User: 0 word" in turns and "Assistant: 7 word" in turns and "User: 8 word" not in turns
+
+    client.post(f"{url}/chat", json={"text": "again"})
+    wait_for_summaries(client)
+    sent = upstream.requests[2]["body"]["messages"]
+    assert sent[2]["content"] == prompts.SUMMARY_PREAMBLE + "Earlier: points 0 to 7."
+    assert not any(m["content"].startswith("0 word") for m in sent)
+    assert sent[-3]["content"] == "Earlier: points 0 to 7."
+
+    # Replacing the history invalidates the summary
+    client.put(url, json={"chat_history": [entry("x")]})
+    client.post(f"{url}/chat", json={"text": "fresh"})
+    sent = upstream.requests[-1]["body"]["messages"]
+    assert [m["role"] for m in sent] == ["system", "system", "user", "system", "user"]
+    wait_for_summaries(client)
+
+
+def test_short_sessions_are_not_summarised(client, new_session, upstream):
+    session = new_session(chat_history=[entry("a"), entry("b", role="model")])
+    client.post(f"/api/sessions/{session['id']}/chat", json={"text": "hi"})
+    assert not server.summary_tasks
+    assert len(upstream.requests) == 1
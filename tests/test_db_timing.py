@@ -0,0 +1,51 @@
+"""Server-Timing header and slow-query log."""
+
+import json
+import logging
+import re
+
+import db_timing
+
+
+def metrics(response):
+    """Server-Timing header as {name: (duration ms, description)}."""
+    parsed = {}
+    for metric in response.headers["Server-Timing"].split(", "):
+        name, *params = metric.split(";")
+        values = dict(param.split("=", 1) for param in params)
+        parsed[name] = (float(values["dur"]), values.get("desc", "").strip('"'))
+    return parsed
+
+
+def test_server_timing_counts_queries(client, count_queries, new_session):
+    session = new_session()
+    with count_queries() as statements:
+        response = client.get(f"/api/sessions/{session['id']}")
+    timing = metrics(response)
+    assert timing["db"][1] == f"{len(statements)} queries"
+    assert 0 <= timing["db-slowest"][0] <= timing["db"][0] <= timing["app"][0]
+    assert "Server-Timing" in client.get("/api/health").headers
+
+
+def test_requests_without_queries(client):
+    timing = metrics(client.get("/api/health"))
+    assert timing["db"] == (0.0, "0 queries")
+    assert "db-slowest" not in timing
+
+
+def test_slow_query_log(client, new_session, monkeypatch, caplog):
+    session = new_session()
+    monkeypatch.setattr(db_timing, "SLOW_QUERY_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="db.slow_query"):
+        client.get(f"/api/sessions/{session['id']}/versions")
+    records = [json.loads(record.getMessage()) for record in caplog.records if record.name == "db.slow_query"]
+    assert records
+    assert all(record["event"] == "slow_query" and record["duration_ms"] >= 0 for record in records)
+    assert {record["path"] for record in records} == {f"/api/sessions/{session['id']}/versions"}
+    assert all(re.match(r"SELECT ", record["statement"]) for record in records)
+
+
+def test_timings_only_collected_inside_requests(client, new_session):
+    assert db_timing.current() is None
+    new_session()
+    assert db_timing.current() is None
@@ -0,0 +1,104 @@
+"""Document revisions stored as line edit scripts between periodic checkpoints."""
+
+import random
+
+import pytest
+from sqlalchemy import JSON, func, select
+
+import document_history
+import server
+import version_store
+
+
+def test_first_revision_is_a_checkpoint():
+    assert document_history.encode_revision(None, "# A\n", None) == (document_history.CHECKPOINT, 0, "# A\n")
+
+
+def test_small_edit_is_a_delta():
+    previous = "".join(f"line {i}\n" for i in range(20))
+    text = previous.replace("line 7\n", "line seven\n")
+    kind, depth, ops = document_history.encode_revision(previous, text, 0)
+    assert (kind, depth) == (document_history.DELTA, 1)
+    assert ops == [7, -1, ["line seven\n"], 12]
+    assert document_history.rebuild([(document_history.CHECKPOINT, previous), (kind, ops)]) == text
+
+
+def test_full_rewrite_is_a_checkpoint():
+    assert document_history.encode_revision("old\n", "entirely new\n", 0)[:2] == (document_history.CHECKPOINT, 0)
+
+
+def test_checkpoint_every_interval(monkeypatch):
+    monkeypatch.setattr(document_history, "CHECKPOINT_INTERVAL", 3)
+    rows, kinds, depth, previous = [], [], None, None
+    texts = ["".join(f"line {i}\n" for i in range(n + 5)) for n in range(7)]
+    for text in texts:
+        kind, depth, data = document_history.encode_revision(previous, text, depth)
+        rows.append((kind, data))
+        kinds.append(kind[0])
+        previous = text
+    assert "".join(kinds) == "cddcddc"
+    for end, text in enumerate(texts, start=1):
+        start = max(i for i in range(end) if rows[i][0] == document_history.CHECKPOINT)
+        assert document_history.rebuild(rows[start:end]) == text
+
+
+@pytest.mark.parametrize("previous, text", [
+    ("a\nb\n", "a\nb\nc"),
+    ("a\nb\nc\nd\n", "a\nc\nd\n"),
+    ("a\r\nb\r\nc\r\n", "a\r\nb\r\nx\r\n"),
+])
+def test_edit_script_round_trip(previous, text):
+    kind, _, data = document_history.encode_revision(previous, text, 0)
+    rows = [(document_history.CHECKPOINT, previous), (kind, data)]
+    assert document_history.rebuild(rows) == text
+
+
+def test_revisions_endpoint(client, new_session):
+    session = new_session(living_document="# A\nintro\n")
+    url = f"/api/sessions/{session['id']}"
+    client.put(url, json={"living_document": "# A\nintro\nmore\n"})
+    client.put(url, json={"living_document": "# A\nintro\nmore\nend\n"})
+
+    revisions = client.get(f"{url}/document/revisions").json()
+    assert [(r["revision"], r["checkpoint"]) for r in revisions] == [(1, True), (2, False), (3, False)]
+    assert client.get(f"{url}/document/revisions/2").json()["livingDocument"] == "# A\nintro\nmore\n"
+    assert client.get(f"{url}/document/revisions/4").status_code == 404
+
+
+
+def prefix_suffix_script(previous, text):
+    """What line_edit_script computes, in Python: keep the common leading and trailing lines"""
+    old, new = previous.splitlines(keepends=True), text.splitlines(keepends=True)
+    prefix = suffix = 0
+    while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+        prefix += 1
+    while suffix < min(len(old), len(new)) - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    inserted = new[prefix:len(new) - suffix]
+    if sum(map(len, inserted)) >= len(text):
+        return None
+    deleted = len(old) - prefix - suffix
+    return [op for op in (prefix, -deleted, inserted, suffix) if op]
+
+
+def test_edit_script_in_sql(client, backend):
+    # SQLite calls back into Python, which diffs with difflib
+    expected = prefix_suffix_script if backend == "postgresql" else document_history.edit_script
+    rng = random.Random(7)
+    pieces = ["\n", "\r", "\r\n", "\v", "\f", "\x1c", "\x1d", "\x1e", "\x85", "\u2028", "\u2029", "a", "b", "é "]
+    pairs = [("a\nb\nc\n", "a\nx\nc\n"), ("a\n", "a\n"), ("", "a"), ("a\nb\n", "")]
+    pairs += [tuple("".join(rng.choice(pieces) for _ in range(rng.randrange(12))) for _ in "ab") for _ in range(200)]
+
+    async def scripts():
+        async with server.async_session() as db:
+            return [
+                await db.scalar(select(func.line_edit_script(previous, text, type_=JSON)))
+                for previous, text in pairs
+            ]
+
+    results = client.loop.run_until_complete(scripts())
+    assert results[0] == [1, -1, ["x\n"], 1]
+    for (previous, text), script in zip(pairs, results):
+        assert script == expected(previous, text)
+        if script is not None:
+            assert version_store.apply_line_diff(previous, script) == text
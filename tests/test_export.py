@@ -0,0 +1,57 @@
+"""Streaming export of every session, as a JSON array or NDJSON."""
+
+import json
+
+import server
+
+
+def entry(entry_id, role="user"):
+    return {"id": entry_id, "role": role, "text": f"text {entry_id}"}
+
+
+def test_json_array(client, new_session):
+    created = {new_session(chat_history=[entry(f"e{i}")])["id"] for i in range(3)}
+    response = client.get("/api/sessions/export")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/json"
+    sessions = response.json()
+    assert created <= {session["id"] for session in sessions}
+    # newest first, like GET /sessions
+    stamps = [session["lastModified"] for session in sessions]
+    assert stamps == sorted(stamps, reverse=True)
+    exported = next(session for session in sessions if session["id"] in created)
+    assert len(exported["chatHistory"]) == 1
+    assert len(exported["versions"]) == 1
+
+
+def test_ndjson_in_batches(client, count_queries, new_session, monkeypatch):
+    monkeypatch.setattr(server, "EXPORT_BATCH_SIZE", 2)
+    for i in range(5):
+        new_session(chat_history=[entry(f"n{i}")])
+    total = len(client.get("/api/sessions/export").json())
+
+    with count_queries() as statements:
+        response = client.get("/api/sessions/export", headers={"Accept": "application/x-ndjson"})
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert len(lines) == total
+    assert all(json.loads(line)["id"] for line in lines)
+    # one streamed SELECT, then one chat query per batch of two
+    assert len(statements) == 1 + (total + 1) // 2
+
+
+def test_one_chunk_per_session(client, new_session, monkeypatch):
+    monkeypatch.setattr(server, "EXPORT_BATCH_SIZE", 2)
+    for i in range(3):
+        new_session(chat_history=[entry(f"c{i}")])
+
+    async def collect(ndjson):
+        return [chunk async for chunk in server.export_sessions(ndjson)]
+
+    lines = client.loop.run_until_complete(collect(True))
+    assert all(chunk.endswith(b"\n") and chunk.count(b"\n") == 1 for chunk in lines)
+    chunks = client.loop.run_until_complete(collect(False))
+    assert (chunks[0], chunks[-1]) == (b"[", b"]")
+    assert len(chunks) == len(lines) + 2
+    assert all(chunk.startswith(b",{") for chunk in chunks[2:-1])
+    assert [session["id"] for session in json.loads(b"".join(chunks))] == [json.loads(line)["id"] for line in lines]
@@ -0,0 +1,91 @@
+"""RFC 6902 JSON Patch operations and how PATCH /api/sessions/{id} rejects malformed patches."""
+
+import pytest
+
+import json_patch
+
+
+def document():
+    return {"a": {"b": 1}, "list": [1, 2, 3], "x/y": "slash", "t~n": "tilde"}
+
+
+@pytest.mark.parametrize("operation, expected", [
+    ({"op": "add", "path": "/c", "value": 2}, {"c": 2}),
+    ({"op": "add", "path": "/list/0", "value": 0}, {"list": [0, 1, 2, 3]}),
+    ({"op": "add", "path": "/list/-", "value": 4}, {"list": [1, 2, 3, 4]}),
+    ({"op": "remove", "path": "/list/1"}, {"list": [1, 3]}),
+    ({"op": "replace", "path": "/a/b", "value": 5}, {"a": {"b": 5}}),
+    ({"op": "move", "from": "/a/b", "path": "/c"}, {"a": {}, "c": 1}),
+    ({"op": "copy", "from": "/list", "path": "/c"}, {"c": [1, 2, 3]}),
+    ({"op": "replace", "path": "/x~1y", "value": "s"}, {"x/y": "s"}),
+    ({"op": "remove", "path": "/t~0n"}, {"t~n": None}),
+])
+def test_apply_operation(operation, expected):
+    patched = json_patch.apply_patch(document(), [operation])
+    for key, value in expected.items():
+        if value is None:
+            assert key not in patched
+        else:
+            assert patched[key] == value
+
+
+def test_copy_is_independent_of_its_source():
+    patched = json_patch.apply_patch(document(), [
+        {"op": "copy", "from": "/list", "path": "/c"},
+        {"op": "add", "path": "/c/-", "value": 9},
+    ])
+    assert (patched["list"], patched["c"]) == ([1, 2, 3], [1, 2, 3, 9])
+
+
+def test_test_operation():
+    json_patch.apply_patch(document(), [{"op": "test", "path": "/a", "value": {"b": 1}}])
+    with pytest.raises(json_patch.JsonPatchTestFailed):
+        json_patch.apply_patch(document(), [{"op": "test", "path": "/list/0", "value": 2}])
+
+
+def test_pointer_unescapes_tilde_last():
+    assert json_patch.parse_pointer("/~01") == ["~1"]
+    assert json_patch.parse_pointer("/a/~1/") == ["a", "/", ""]
+
+
+@pytest.mark.parametrize("operation", [
+    {"op": "add", "path": "/c"},
+    {"op": "replace", "path": "/a"},
+    {"op": "move", "path": "/c"},
+    {"op": "copy", "path": "/c", "from": "no-slash"},
+    {"op": "nope", "path": "/c"},
+    {"op": "add", "path": "c", "value": 1},
+])
+def test_malformed_operations(operation):
+    with pytest.raises(json_patch.JsonPatchError):
+        json_patch.validate_operation(operation)
+
+
+@pytest.mark.parametrize("operation", [
+    {"op": "remove", "path": "/missing"},
+    {"op": "remove", "path": "/list/3"},
+    {"op": "add", "path": "/list/01", "value": 1},
+    {"op": "add", "path": "/list/-/x", "value": 1},
+    {"op": "move", "from": "/a", "path": "/a/c"},
+    {"op": "remove", "path": ""},
+])
+def test_operations_that_do_not_apply(operation):
+    with pytest.raises(json_patch.JsonPatchError):
+        json_patch.apply_patch(document(), [operation])
+
+
+@pytest.mark.parametrize("operations", [
+    [{"op": "replace", "path": "/livingDocument"}],
+    [{"op": "add", "path": "/chatHistory/-"}],
+    [{"op": "replace", "path": "/livingDocument", "value": 42}],
+    [{"op": "remove", "path": "/livingDocument"}],
+    [{"op": "move", "from": "/livingDocument", "path": "/context/title"}],
+    [{"op": "remove", "path": "/chatHistory"}],
+    [{"op": "remove", "path": "/context"}],
+])
+def test_malformed_session_patch_is_rejected(client, new_session, operations):
+    session = new_session(living_document="doc")
+    url = f"/api/sessions/{session['id']}"
+    response = client.patch(url, json=operations)
+    assert response.status_code == 422, response.text
+    assert client.get(url).json()["livingDocument"] == "doc"
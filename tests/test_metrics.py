@@ -0,0 +1,90 @@
+"""Prometheus metrics at /api/metrics."""
+
+import gzip
+import json
+import re
+
+import metrics
+
+SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+
+def scrape(client):
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+    samples = {}
+    for line in response.text.splitlines():
+        if line.startswith("#"):
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        key = (name, tuple(sorted(re.findall(r'(\w+)="([^"]*)"', labels or ""))))
+        samples[key] = float(value)
+    return samples
+
+
+def series(samples, name, **labels):
+    return samples.get((name, tuple(sorted(labels.items()))))
+
+
+def test_latency_and_sizes_by_route_template(client, new_session):
+    session = new_session()
+    route = "/api/sessions/{session_id}"
+    before = scrape(client)
+    for _ in range(3):
+        client.get(f"/api/sessions/{session['id']}")
+    client.get("/api/sessions/missing")
+    after = scrape(client)
+
+    ok = dict(method="GET", route=route, status="200")
+    count = series(after, "http_request_duration_seconds_count", **ok)
+    assert count - (series(before, "http_request_duration_seconds_count", **ok) or 0) == 3
+    assert series(after, "http_request_duration_seconds_bucket", le="+Inf", **ok) == count
+    assert series(after, "http_response_size_bytes_sum", **ok) > 0
+    assert series(after, "http_request_duration_seconds_count", method="GET", route=route, status="404") >= 1
+    # concrete ids never become labels
+    assert not any(session["id"] in str(key) for key in after)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("sizes", "Sizes.", ("route",), (10.0, 100.0))
+    for value in (5, 50, 500):
+        histogram.observe(("/x",), value)
+    lines = list(histogram.render())
+    assert 'sizes_bucket{route="/x",le="10.0"} 1' in lines
+    assert 'sizes_bucket{route="/x",le="100.0"} 2' in lines
+    assert 'sizes_bucket{route="/x",le="+Inf"} 3' in lines
+    assert 'sizes_sum{route="/x"} 555.0' in lines
+
+
+def test_compressed_request_is_measured_as_received(client, new_session):
+    session = new_session()
+    body = gzip.compress(json.dumps({"living_document": "x" * 10_000}).encode())
+    client.put(
+        f"/api/sessions/{session['id']}",
+        content=body,
+        headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+    )
+    samples = scrape(client)
+    labels = dict(method="PUT", route="/api/sessions/{session_id}", status="200")
+    assert series(samples, "http_request_size_bytes_count", **labels) >= 1
+    assert series(samples, "http_request_size_bytes_bucket", le="1024.0", **labels) >= 1
+
+
+def test_unmatched_paths_share_a_label(client):
+    client.get("/api/no-such-endpoint")
+    samples = scrape(client)
+    assert series(samples, "http_request_duration_seconds_count", method="GET", route="unmatched", status="404") >= 1
+
+
+def test_pool_cache_and_concurrency(client, new_session):
+    session = new_session()
+    client.get(f"/api/sessions/{session['id']}")
+    client.get(f"/api/sessions/{session['id']}")
+    samples = scrape(client)
+    assert series(samples, "db_pool_checkouts_total") >= 1
+    assert series(samples, "db_pool_checked_out") == 0
+    assert series(samples, "session_cache_hits_total") >= 1
+    # the scrape itself is in flight
+    assert series(samples, "http_requests_in_flight") == 1
+    assert series(samples, "http_requests_in_flight_max") >= 1
@@ -0,0 +1,53 @@
+"""Keyset pagination of GET /api/sessions, including pages that split equal timestamps."""
+
+from datetime import datetime
+
+from sqlalchemy import update
+
+import server
+
+
+def set_last_modified(client, session_ids, timestamp):
+    async def write():
+        async with server.async_session() as db:
+            await db.execute(
+                update(server.NoteSessionDB).where(server.NoteSessionDB.id.in_(session_ids)).values(last_modified=timestamp)
+            )
+            await db.commit()
+
+    client.loop.run_until_complete(write())
+
+
+def all_pages(client, limit):
+    listed, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/sessions", params=params).json()
+        assert len(page["sessions"]) <= limit
+        listed.extend(s["id"] for s in page["sessions"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return listed, pages
+
+
+def test_equal_timestamps_across_page_boundaries(client, new_session):
+    ids = [new_session()["id"] for _ in range(5)]
+    # Oldest of all, so they fill the last pages; ties are broken by id
+    set_last_modified(client, ids, datetime(1970, 1, 2))
+
+    for limit in (1, 2, 3):
+        listed, _ = all_pages(client, limit)
+        assert len(listed) == len(set(listed))
+        assert listed[-5:] == sorted(ids, reverse=True)
+
+
+def test_last_page_has_no_cursor(client):
+    total = len(all_pages(client, 200)[0])
+    listed, pages = all_pages(client, total)
+    assert (len(listed), pages) == (total, 1)
+
+
+def test_invalid_cursor(client):
+    assert client.get("/api/sessions", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/api/sessions", params={"limit": 0}).status_code == 422
@@ -0,0 +1,48 @@
+"""Rendered system prompts are reused; providers get prompt-caching hints and report cached tokens."""
+
+import prompts
+
+
+def context(title="t", model="model-a"):
+    return {"title": title, "goal": "g", "keywords": "k", "selectedModel": model}
+
+
+def test_system_prompt_is_rendered_once_per_context():
+    first = prompts.system_messages(context("cached"))
+    hits = prompts.system_prompt_stats["hits"]
+    assert prompts.system_messages(context("cached")) is first
+    assert prompts.system_prompt_stats["hits"] == hits + 1
+    assert prompts.system_messages(context("other")) is not first
+    assert prompts.context_key(context("cached")) != prompts.context_key(context("other"))
+    # Every session shares the static prefix
+    assert first[0] == prompts.system_messages(context("other"))[0]
+
+
+def test_cache_hints_for_providers_that_need_them(client, new_session, upstream):
+    session = new_session(chat_history=[{"id": "a", "role": "user", "text": "earlier"}])
+    client.post(f"/api/sessions/{session['id']}/chat", json={"text": "next", "model": "anthropic/claude-3.5-haiku"})
+    messages = upstream.requests[-1]["body"]["messages"]
+    marked = [i for i, m in enumerate(messages) if isinstance(m["content"], list) and m["content"][-1].get("cache_control")]
+    assert marked == [0, 2]
+    assert messages[0]["content"][0]["text"] == prompts.SYSTEM_PROMPT
+    assert messages[2]["content"][0]["text"] == "earlier"
+
+    client.post(f"/api/sessions/{session['id']}/chat", json={"text": "next", "model": "openai/gpt-4o"})
+    assert all(isinstance(m["content"], str) for m in upstream.requests[-1]["body"]["messages"])
+
+
+def test_cached_prompt_tokens_are_recorded(client, new_session, upstream):
+    session = new_session()
+    upstream.usage = {
+        "prompt_tokens": 2500, "completion_tokens": 40, "cost": 0.002,
+        "prompt_tokens_details": {"cached_tokens": 2048},
+    }
+    done = client.post(f"/api/sessions/{session['id']}/chat", json={"text": "hi", "model": "cache-test"}).text
+    assert '"usage":{"promptTokens":2500,"cachedPromptTokens":2048,"completionTokens":40,"cost":0.002}' in done
+
+    body = client.get("/api/metrics").text
+    assert 'llm_prompt_tokens_total{model="cache-test",kind="chat",cache="hit"} 2048' in body
+    assert 'llm_prompt_tokens_total{model="cache-test",kind="chat",cache="miss"} 452' in body
+    assert 'llm_completion_tokens_total{model="cache-test",kind="chat"} 40' in body
+    assert 'llm_time_to_first_token_seconds_count{model="cache-test",prompt_cache="hit"} 1' in body
+    assert "system_prompt_cache_hits_total" in body
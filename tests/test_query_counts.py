@@ -0,0 +1,230 @@
+"""Statements issued per mutation endpoint, on each backend.
+
+Every round trip to NeonDB costs 20-60 ms, so the statements are pinned: a
+change that adds a query to one of these paths has to update the lists here on
+purpose. On Postgres each mutation is a single statement, its child-row writes
+folded into the UPDATE as data-modifying CTEs (see ``server.session_write``);
+only restore and non-blind patches also read first, what the Python side needs
+before it can write at all (the version chain, the patched values).
+
+SQLite is local, so it keeps one statement per table: the writes to
+``chat_entries`` and ``document_revisions`` follow the UPDATE, the stored
+entries a rewrite is diffed against are read under the write lock it took, and
+the previous document is read wherever it changes, since SQLite cannot return
+pre-update values.
+"""
+
+import re
+
+
+def entry(entry_id, text="hello", role="user"):
+    return {"id": entry_id, "role": role, "text": text}
+
+
+def kinds(statements):
+    """Each statement as its verb and the table it starts with, e.g. 'UPDATE note_sessions'.
+
+    A statement with data-modifying CTEs lists every write it makes, e.g.
+    'UPDATE note_sessions + INSERT chat_entries'.
+    """
+    described = []
+    for statement in statements:
+        writes = re.findall(r"(?<!DO )\b(INSERT INTO|UPDATE|DELETE FROM) (\w+)", statement)
+        if statement.startswith("WITH") and writes:
+            described.append(" + ".join(f"{verb.split()[0]} {table}" for verb, table in writes))
+            continue
+        verb, table = re.match(r"(INSERT INTO|UPDATE|DELETE FROM|SELECT) (\w+)", statement).groups()
+        described.append(f"{verb.split()[0]} {table}")
+    return described
+
+
+def test_create_session(client, backend, count_queries):
+    with count_queries() as statements:
+        response = client.post("/api/sessions", json={
+            "context": {"title": "t", "goal": "g", "keywords": "k", "selectedModel": "model-a"},
+            "chatHistory": [entry("a"), entry("b", role="model")],
+            "livingDocument": "# Notes\n",
+        })
+    assert response.status_code == 200
+    # the session row, then its child rows; on Postgres as CTEs of its INSERT
+    assert kinds(statements) == {
+        "sqlite": ["INSERT note_sessions", "INSERT document_revisions", "INSERT chat_entries"],
+        "postgresql": ["INSERT document_revisions + INSERT chat_entries + INSERT note_sessions"],
+    }[backend]
+
+
+def test_update_session_document(client, backend, count_queries, new_session):
+    session = new_session()
+    with count_queries() as statements:
+        response = client.put(f"/api/sessions/{session['id']}", json={"living_document": "# Notes\nmore\n"})
+    assert response.status_code == 200
+    assert response.json()["livingDocument"] == "# Notes\nmore\n"
+    # previous document (SQLite only); UPDATE ... RETURNING, with the history for the
+    # response aggregated in a subquery; the revision's edit script
+    assert kinds(statements) == {
+        "sqlite": ["SELECT note_sessions", "UPDATE note_sessions", "INSERT document_revisions"],
+        "postgresql": ["UPDATE note_sessions + INSERT document_revisions"],
+    }[backend]
+
+
+def test_update_session_context(client, backend, count_queries, new_session):
+    session = new_session()
+    context = {**session["context"], "title": "renamed"}
+    with count_queries() as statements:
+        response = client.put(f"/api/sessions/{session['id']}", json={"context": context})
+    assert response.status_code == 200
+    assert response.json()["context"]["title"] == "renamed"
+    # UPDATE ... RETURNING, with the history for the response aggregated in a subquery
+    assert kinds(statements) == ["UPDATE note_sessions"]
+
+
+def test_update_session_chat_history(client, backend, count_queries, new_session):
+    session = new_session(chat_history=[entry("a")])
+    with count_queries() as statements:
+        response = client.put(f"/api/sessions/{session['id']}", json={
+            "chat_history": [entry("a"), entry("b", role="model")],
+        })
+    assert response.status_code == 200
+    assert [e["id"] for e in response.json()["chatHistory"]] == ["a", "b"]
+    # UPDATE ... RETURNING, then the stored entries the new history is diffed against
+    # (read under the write lock that UPDATE took) and the appended tail; Postgres
+    # finds the kept prefix in SQL and upserts the entries after it
+    assert kinds(statements) == {
+        "sqlite": ["UPDATE note_sessions", "SELECT chat_entries", "INSERT chat_entries"],
+        "postgresql": ["UPDATE note_sessions + DELETE chat_entries + INSERT chat_entries"],
+    }[backend]
+
+
+def test_update_session_rewrites_history(client, backend, count_queries, new_session):
+    session = new_session(chat_history=[entry("a"), entry("b")])
+    with count_queries() as statements:
+        response = client.put(f"/api/sessions/{session['id']}", json={"chat_history": [entry("a"), entry("c")]})
+    assert response.status_code == 200
+    # as above, plus the stale tail and, on SQLite, a second UPDATE capping
+    # versioned_chat_length at the kept prefix once the stored entries have been read
+    assert kinds(statements) == {
+        "sqlite": [
+            "UPDATE note_sessions", "SELECT chat_entries", "DELETE chat_entries", "UPDATE note_sessions",
+            "INSERT chat_entries",
+        ],
+        "postgresql": ["UPDATE note_sessions + DELETE chat_entries + INSERT chat_entries"],
+    }[backend]
+
+
+def test_update_session_if_match_conflict(client, backend, count_queries, new_session):
+    session = new_session()
+    with count_queries() as statements:
+        response = client.put(
+            f"/api/sessions/{session['id']}",
+            json={"context": session["context"]},
+            headers={"If-Match": '"41"'},
+        )
+    assert response.status_code == 412
+    # the conditional UPDATE, then an existence check on the failure path only
+    assert kinds(statements) == ["UPDATE note_sessions", "SELECT note_sessions"]
+
+
+def test_patch_turn(client, backend, count_queries, new_session):
+    session = new_session(chat_history=[entry("a")])
+    with count_queries() as statements:
+        response = client.patch(f"/api/sessions/{session['id']}", json=[
+            {"op": "add", "path": "/chatHistory/-", "value": entry("b")},
+            {"op": "add", "path": "/chatHistory/-", "value": entry("c", role="model")},
+            {"op": "replace", "path": "/livingDocument", "value": "# Notes\nanswer\n"},
+        ])
+    assert response.status_code == 200
+    # previous document (SQLite only), UPDATE ... RETURNING, both entries in one INSERT,
+    # the revision's edit script
+    assert kinds(statements) == {
+        "sqlite": ["SELECT note_sessions", "UPDATE note_sessions", "INSERT chat_entries", "INSERT document_revisions"],
+        "postgresql": ["UPDATE note_sessions + INSERT chat_entries + INSERT document_revisions"],
+    }[backend]
+
+    stored = client.get(f"/api/sessions/{session['id']}").json()
+    assert [e["id"] for e in stored["chatHistory"]] == ["a", "b", "c"]
+    assert stored["livingDocument"] == "# Notes\nanswer\n"
+
+
+def test_patch_context(client, backend, count_queries, new_session):
+    session = new_session()
+    with count_queries() as statements:
+        response = client.patch(f"/api/sessions/{session['id']}", json=[
+            {"op": "replace", "path": "/context/title", "value": "renamed"},
+        ])
+    assert response.status_code == 200
+    # the values the patch applies to, then the UPDATE conditional on that read
+    assert kinds(statements) == ["SELECT note_sessions", "UPDATE note_sessions"]
+
+
+def test_append_message(client, backend, count_queries, new_session):
+    session = new_session()
+    with count_queries() as statements:
+        response = client.post(f"/api/sessions/{session['id']}/messages", json=entry("a"))
+    assert response.status_code == 200
+    # UPDATE ... RETURNING, INSERT with the sequence number computed in SQL
+    assert kinds(statements) == {
+        "sqlite": ["UPDATE note_sessions", "INSERT chat_entries"],
+        "postgresql": ["UPDATE note_sessions + INSERT chat_entries"],
+    }[backend]
+
+
+def test_delete_session(client, backend, count_queries, new_session):
+    session = new_session(chat_history=[entry("a")])
+    with count_queries() as statements:
+        response = client.delete(f"/api/sessions/{session['id']}")
+    assert response.status_code == 200
+    # child rows go through ON DELETE CASCADE, foreign keys are on for SQLite too
+    assert kinds(statements) == ["DELETE note_sessions"]
+
+
+def test_create_version(client, backend, count_queries, new_session):
+    session = new_session(chat_history=[entry("a")])
+    with count_queries() as statements:
+        response = client.post(f"/api/sessions/{session['id']}/versions", json={
+            "session_id": session["id"], "checkpoint_name": "cp",
+        })
+    assert response.status_code == 200
+    # UPDATE ... RETURNING that appends the version in SQL
+    assert kinds(statements) == ["UPDATE note_sessions"]
+
+
+def test_switch_model(client, backend, count_queries, new_session):
+    session = new_session(chat_history=[entry("a")])
+    with count_queries() as statements:
+        response = client.post(f"/api/sessions/{session['id']}/switch-model", json={
+            "session_id": session["id"], "new_model": "model-b",
+        })
+    assert response.status_code == 200
+    # one UPDATE edits the context and appends the checkpoint
+    assert kinds(statements) == ["UPDATE note_sessions"]
+
+
+def test_restore_version(client, backend, count_queries, new_session):
+    session = new_session(chat_history=[entry("a")])
+    initial = session["versions"][0]["id"]
+    client.patch(f"/api/sessions/{session['id']}", json=[
+        {"op": "add", "path": "/chatHistory/-", "value": entry("b")},
+        {"op": "replace", "path": "/livingDocument", "value": "# Notes\nchanged\n"},
+    ])
+    with count_queries() as statements:
+        response = client.post(f"/api/sessions/{session['id']}/restore", json={
+            "session_id": session["id"], "version_id": initial,
+        })
+    assert response.status_code == 200
+    # the version chain to restore from and (SQLite only) the stored entries to diff
+    # against; the UPDATE conditional on that read, with the backup appended in SQL;
+    # the stale tail of the history; the revision's edit script
+    assert kinds(statements) == {
+        "sqlite": [
+            "SELECT note_sessions", "SELECT chat_entries", "UPDATE note_sessions",
+            "DELETE chat_entries", "INSERT document_revisions",
+        ],
+        "postgresql": [
+            "SELECT note_sessions",
+            "UPDATE note_sessions + DELETE chat_entries + INSERT chat_entries + INSERT document_revisions",
+        ],
+    }[backend]
+
+    restored = client.get(f"/api/sessions/{session['id']}").json()
+    assert [e["id"] for e in restored["chatHistory"]] == ["a"]
+    assert restored["livingDocument"] == "# Notes\n"
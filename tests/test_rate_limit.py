@@ -0,0 +1,95 @@
+"""Who may make the chat endpoint spend the server's LLM key, and how often."""
+
+import pytest
+
+import rate_limit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_sliding_window():
+    clock = Clock()
+    limiter = rate_limit.RateLimiter(2, window=60, clock=clock)
+    assert limiter.hit("a") is None
+    clock.now += 30
+    assert limiter.hit("a") is None
+    assert limiter.hit("a") == pytest.approx(30)
+    assert limiter.hit("b") is None
+    clock.now += 30
+    assert limiter.hit("a") is None
+    assert limiter.hit("a") == pytest.approx(30)
+
+
+def test_refused_hits_are_not_recorded_on_any_key():
+    clock = Clock()
+    limiter = rate_limit.RateLimiter(1, window=60, clock=clock)
+    assert limiter.hit("client", "session-1") is None
+    assert limiter.hit("client", "session-2") is not None
+    # session-2 was not charged for the refused request
+    assert limiter.hit("other-client", "session-2") is None
+
+
+def test_unlimited_and_bounded():
+    assert all(rate_limit.RateLimiter(0).hit("a") is None for _ in range(100))
+    limiter = rate_limit.RateLimiter(1, max_keys=2)
+    for key in ("a", "b", "c"):
+        limiter.hit(key)
+    # the least recently seen key was forgotten
+    assert limiter.hit("a") is None
+    assert limiter.hit("c") is not None
+
+
+def chat(client, session, **headers):
+    return client.post(f"/api/sessions/{session['id']}/chat", json={"text": "hi"}, headers=headers)
+
+
+def test_chat_can_be_disabled(client, new_session, upstream, monkeypatch):
+    monkeypatch.setattr(rate_limit, "CHAT_ENABLED", False)
+    assert chat(client, new_session()).status_code == 403
+    assert upstream.requests == []
+
+
+def test_server_key_can_be_withheld(client, new_session, upstream, monkeypatch):
+    monkeypatch.setattr(rate_limit, "CHAT_SERVER_KEY", False)
+    session = new_session()
+    assert chat(client, session).status_code == 401
+    assert chat(client, session, **{"X-LLM-Api-Key": "own-key"}).status_code == 200
+    assert upstream.requests[-1]["headers"]["authorization"] == "Bearer own-key"
+
+
+def test_server_key_requests_are_rate_limited(client, new_session, upstream, monkeypatch):
+    monkeypatch.setattr(rate_limit, "chat_limiter", rate_limit.RateLimiter(2))
+    session = new_session()
+    assert [chat(client, session).status_code for _ in range(2)] == [200, 200]
+    limited = chat(client, session)
+    assert limited.status_code == 429
+    assert 0 < int(limited.headers["Retry-After"]) <= 60
+    # the limit is per client address too, not only per session
+    assert chat(client, new_session()).status_code == 429
+    assert chat(client, session, **{"X-LLM-Api-Key": "own-key"}).status_code == 200
+
+
+def test_client_address_behind_proxies(monkeypatch):
+    assert rate_limit.client_address("10.0.0.1", "1.1.1.1") == "10.0.0.1"
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXY_HOPS", 1)
+    assert rate_limit.client_address("10.0.0.1", None) == "10.0.0.1"
+    # Entries before the ones the proxies appended are the client's own
+    assert rate_limit.client_address("10.0.0.1", "forged, 2.2.2.2") == "2.2.2.2"
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXY_HOPS", 2)
+    assert rate_limit.client_address("10.0.0.1", "forged, 2.2.2.2, 10.0.0.9") == "2.2.2.2"
+    assert rate_limit.client_address("10.0.0.1", "2.2.2.2") == "2.2.2.2"
+
+
+def test_forwarded_clients_are_limited_apart(client, new_session, upstream, monkeypatch):
+    monkeypatch.setattr(rate_limit, "chat_limiter", rate_limit.RateLimiter(1))
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXY_HOPS", 1)
+    assert chat(client, new_session(), **{"X-Forwarded-For": "2.2.2.2"}).status_code == 200
+    assert chat(client, new_session(), **{"X-Forwarded-For": "3.3.3.3"}).status_code == 200
+    # A forged first hop does not make a new client
+    assert chat(client, new_session(), **{"X-Forwarded-For": "9.9.9.9, 2.2.2.2"}).status_code == 429
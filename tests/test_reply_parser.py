@@ -0,0 +1,69 @@
+"""Incremental parsing of the model's ``{"reply", "document"}`` answer."""
+
+import json
+
+import pytest
+
+from reply_parser import ReplyParser
+
+
+def parse(text, size):
+    """Feed ``text`` in ``size``-character chunks; returns (streamed fields, finished answer)."""
+    parser = ReplyParser()
+    streamed = {}
+    for i in range(0, len(text), size):
+        for field, delta in parser.feed(text[i:i + size]):
+            streamed[field] = streamed.get(field, "") + delta
+    return streamed, parser.finish()
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_chunk_boundaries(size):
+    answer = {"reply": 'Quote " slash \\ tab\t é 😀', "document": "# Notes\n- a\n- b\n"}
+    streamed, parsed = parse(json.dumps(answer), size)
+    assert streamed == answer
+    assert (parsed.reply, parsed.document, parsed.repaired) == (answer["reply"], answer["document"], False)
+
+    streamed, parsed = parse(json.dumps(answer, ensure_ascii=False), size)
+    assert streamed == answer
+
+
+def test_deltas_are_coalesced_per_field():
+    parser = ReplyParser()
+    assert parser.feed('{"reply": "ab", "document": "cd"}') == [("reply", "ab"), ("document", "cd")]
+
+
+def test_fences_and_other_keys():
+    text = '```json\n{"thoughts": {"a": [1, "}"]}, "n": 2, "reply": "ok", "document": "# D"}\n```'
+    streamed, parsed = parse(text, 3)
+    assert streamed == {"reply": "ok", "document": "# D"}
+    assert (parsed.reply, parsed.document) == ("ok", "# D")
+
+
+def test_raw_newline_and_unknown_escape():
+    streamed, parsed = parse('{"reply": "line\none \\q", "document": "# D"}', 2)
+    assert parsed.reply == "line\none q"
+    assert parsed.repaired
+
+
+def test_truncated_reply_is_closed():
+    streamed, parsed = parse('{"reply": "Half a sent', 4)
+    assert streamed == {"reply": "Half a sent"}
+    assert (parsed.reply, parsed.document, parsed.repaired) == ("Half a sent", None, True)
+
+
+def test_truncated_document_is_dropped():
+    streamed, parsed = parse('{"reply": "ok", "document": "# Notes\\n- a', 5)
+    assert streamed["document"] == "# Notes\n- a"
+    assert (parsed.reply, parsed.document, parsed.repaired) == ("ok", None, True)
+
+
+def test_plain_text_is_the_reply():
+    streamed, parsed = parse("Just some text.", 4)
+    assert streamed == {"reply": "Just some text."}
+    assert (parsed.reply, parsed.document, parsed.repaired) == ("Just some text.", None, False)
+
+
+def test_prose_before_the_object_falls_back_to_json():
+    streamed, parsed = parse('Sure! {"reply": "ok", "document": "# D"}', 6)
+    assert (parsed.reply, parsed.document, parsed.repaired) == ("ok", "# D", True)
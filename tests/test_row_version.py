@@ -0,0 +1,59 @@
+"""Optimistic concurrency: row_version exposed as an ETag and checked against If-Match."""
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def entry(entry_id):
+    return {"id": entry_id, "role": "user", "text": f"text {entry_id}"}
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("*", None),
+    ('"7"', 7),
+    ('W/"7"', 7),
+    ('"7", "8"', 7),
+])
+def test_parse_if_match(header, expected):
+    assert server.parse_if_match(header) == expected
+
+
+def test_unparseable_if_match_fails_the_precondition():
+    with pytest.raises(HTTPException) as raised:
+        server.parse_if_match('"not-a-version"')
+    assert raised.value.status_code == 412
+
+
+def test_every_write_bumps_the_etag(client, new_session):
+    session = new_session(chat_history=[entry("a")])
+    url = f"/api/sessions/{session['id']}"
+    tags = [client.get(url).headers["ETag"]]
+    tags.append(client.put(url, json={"living_document": "one"}).headers["ETag"])
+    tags.append(client.patch(url, json=[{"op": "replace", "path": "/livingDocument", "value": "two"}]).headers["ETag"])
+    tags.append(client.post(f"{url}/messages", json=entry("b")).headers["ETag"])
+    assert len(set(tags)) == len(tags)
+    assert tags[-1] == client.get(url).headers["ETag"] == server.etag(int(tags[0].strip('"')) + 3)
+
+
+def test_stale_if_match_is_rejected_without_writing(client, new_session):
+    session = new_session(living_document="kept")
+    url = f"/api/sessions/{session['id']}"
+    stale = client.get(url).headers["ETag"]
+    current = client.put(url, json={"living_document": "newer"}, headers={"If-Match": stale}).headers["ETag"]
+
+    patch = [{"op": "replace", "path": "/livingDocument", "value": "lost"}]
+    assert client.put(url, json={"living_document": "lost"}, headers={"If-Match": stale}).status_code == 412
+    assert client.patch(url, json=patch, headers={"If-Match": stale}).status_code == 412
+    assert client.delete(url, headers={"If-Match": stale}).status_code == 412
+    assert client.get(url).json()["livingDocument"] == "newer"
+
+    assert client.patch(url, json=patch, headers={"If-Match": "*"}).status_code == 200
+    assert client.patch(url, json=patch, headers={"If-Match": current}).status_code == 412
+
+
+def test_if_match_on_a_missing_session(client):
+    response = client.put("/api/sessions/missing", json={"living_document": "x"}, headers={"If-Match": '"1"'})
+    assert response.status_code == 404
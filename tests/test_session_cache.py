@@ -0,0 +1,72 @@
+"""Session read cache: bodies are only served at the row version they were built from."""
+
+import server
+import session_cache
+
+
+def entry(entry_id, role="user"):
+    return {"id": entry_id, "role": role, "text": f"text {entry_id}"}
+
+
+def test_hit_costs_one_lookup(client, count_queries, new_session):
+    session = new_session(chat_history=[entry("a")])
+    first = client.get(f"/api/sessions/{session['id']}")
+    hits = server.read_cache.hits
+    with count_queries() as statements:
+        second = client.get(f"/api/sessions/{session['id']}")
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert server.read_cache.hits == hits + 1
+    # row_version only
+    assert len(statements) == 1
+
+
+def test_writes_are_never_served_stale(client, new_session):
+    session = new_session(chat_history=[entry("a")])
+    session_id = session["id"]
+    client.get(f"/api/sessions/{session_id}")
+    client.get(f"/api/sessions/{session_id}/versions")
+
+    client.post(f"/api/sessions/{session_id}/messages", json=entry("b"))
+    assert [e["id"] for e in client.get(f"/api/sessions/{session_id}").json()["chatHistory"]] == ["a", "b"]
+    client.post(f"/api/sessions/{session_id}/versions", json={"session_id": session_id, "checkpoint_name": "cp"})
+    assert len(client.get(f"/api/sessions/{session_id}/versions").json()) == 2
+
+    client.delete(f"/api/sessions/{session_id}")
+    assert client.get(f"/api/sessions/{session_id}").status_code == 404
+    assert not server.read_cache.holds(session_id, "session")
+
+
+def test_stats_endpoint(client):
+    stats = client.get("/api/cache/stats").json()
+    assert {"hits", "misses", "entries", "bytes", "listening"} <= stats.keys()
+
+
+def test_lru_is_bounded_by_size():
+    cache = session_cache.SessionCache(max_bytes=10)
+    cache.put("a", "session", 1, b"12345")
+    cache.put("b", "session", 1, b"12345")
+    assert cache.get("a", "session", 1) == b"12345"
+    cache.put("c", "session", 1, b"12345")
+    # b was least recently used
+    assert not cache.holds("b", "session")
+    assert cache.holds("a", "session") and cache.holds("c", "session")
+    assert cache.size == 10 and cache.evictions == 1
+
+
+def test_ttl_and_versions():
+    now = [0.0]
+    cache = session_cache.SessionCache(max_bytes=100, ttl=5, clock=lambda: now[0])
+    cache.put("a", "session", 3, b"body")
+    assert cache.get("a", "session", 4) is None
+    assert not cache.holds("a", "session")
+
+    cache.put("a", "session", 3, b"body")
+    cache.put("a", "versions", 4, b"body")
+    # a notification for version 4 only drops bodies built before it
+    assert cache.invalidate(*session_cache.parse_notification("a 4")) == 1
+    assert cache.holds("a", "versions")
+    now[0] = 5
+    assert cache.get("a", "versions", 4) is None
+    assert cache.size == 0
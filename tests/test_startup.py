@@ -0,0 +1,89 @@
+"""Schema migrations run outside serving; startup timings are reported."""
+
+import base64
+import json
+import subprocess
+import sys
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, inspect, text
+
+import server
+
+
+def alembic_config(connection=None):
+    config = Config(str(server.ROOT_DIR / "alembic.ini"))
+    config.attributes["connection"] = connection
+    return config
+
+
+def migrate(url, revision="head", downgrade=False):
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        (command.downgrade if downgrade else command.upgrade)(alembic_config(connection), revision)
+    return engine
+
+
+def test_migrations_build_the_models_schema(tmp_path):
+    url = f"sqlite:///{tmp_path / 'fresh.db'}"
+    engine = migrate(url)
+    with engine.connect() as connection:
+        assert compare_metadata(MigrationContext.configure(connection), server.Base.metadata) == []
+
+    migrate(url, "base", downgrade=True)
+    assert inspect(engine).get_table_names() == ["alembic_version"]
+
+
+def test_baseline_adopts_a_legacy_database(tmp_path):
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    image = {"name": "i.png", "type": "image/png", "size": 3, "base64": base64.b64encode(b"abc").decode()}
+    history = [{"id": "a", "role": "user", "text": "hi", "image": image}, {"id": "b", "role": "model", "text": "yo"}]
+    legacy = create_engine(url)
+    with legacy.begin() as connection:
+        # The table as the original startup hook created it
+        connection.execute(text(
+            "CREATE TABLE note_sessions (id VARCHAR PRIMARY KEY, last_modified DATETIME, context JSON,"
+            " chat_history JSON, living_document TEXT, current_version INTEGER, versions JSON)"
+        ))
+        connection.execute(
+            text("INSERT INTO note_sessions VALUES ('s', '2025-01-01 00:00:00', '{}', :history, 'doc', 1, '[]')"),
+            {"history": json.dumps(history)},
+        )
+
+    migrate(url)
+    with legacy.connect() as connection:
+        session = connection.execute(text("SELECT chat_history, row_version, document_versioned FROM note_sessions")).one()
+        assert (session.chat_history, session.row_version, session.document_versioned) == ("[]", 1, 0)
+        entries = connection.execute(text("SELECT seq, entry_id, image FROM chat_entries ORDER BY seq")).all()
+        assert [(seq, entry_id) for seq, entry_id, _ in entries] == [(1, "a"), (2, "b")]
+        digest = json.loads(entries[0].image)["hash"]
+        assert connection.execute(text("SELECT data FROM attachments WHERE hash = :h"), {"h": digest}).scalar() == b"abc"
+
+
+def test_bootstrapped_database_is_stamped_at_head(client):
+    # The test database was bootstrapped by init_db, so there is nothing left to migrate
+    command.upgrade(alembic_config(), "head")
+
+    async def revision():
+        async with server.async_session() as db:
+            return await db.scalar(text("SELECT version_num FROM alembic_version"))
+
+    assert client.loop.run_until_complete(revision()) == "0004_versioned_document"
+    assert client.get("/api/sessions").status_code == 200
+
+
+def test_startup_profile(client):
+    client.get("/api/health")
+    profile = client.get("/api/startup-profile").json()
+    assert profile["imported_ms"] > 0
+    assert profile["first_request_ms"] >= profile["imported_ms"]
+
+
+def test_optional_libraries_load_on_first_use():
+    # A fresh interpreter: the test session has long since imported them
+    code = "import sys, server; print(sorted({'httpx', 'tiktoken', 'brotli', 'zstandard'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=server.ROOT_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.splitlines()[-1] == "[]"
@@ -0,0 +1,93 @@
+"""Delta-encoded version chains: line diffs, chat diffs and keyframes."""
+
+import pytest
+
+import version_store
+
+
+def entry(entry_id):
+    return {"id": entry_id, "role": "user", "text": f"text {entry_id}", "image": None}
+
+
+def version(number, entries, document):
+    return {
+        "id": f"v{number}", "version_number": number, "timestamp": "2026-01-01T00:00:00",
+        "modelUsed": "m", "chatHistory": [entry(e) for e in entries], "livingDocument": document,
+    }
+
+
+@pytest.mark.parametrize("old, new", [
+    ("", ""),
+    ("", "# A\n"),
+    ("# A\n", ""),
+    ("a\nb\nc\n", "a\nx\nc\n"),
+    ("a\nb\nc\n", "c\nb\na\n"),
+    ("a\nb", "a\nb\n"),
+    ("a\r\nb\r\n", "a\r\nb\r\nc"),
+    ("same\n" * 50, "same\n" * 25 + "new\n" + "same\n" * 25),
+])
+def test_line_diff_round_trip(old, new):
+    ops = version_store.diff_lines(old, new)
+    assert version_store.apply_line_diff(old, ops) == new
+
+
+def test_line_diff_copies_unchanged_lines():
+    assert version_store.diff_lines("a\nb\nc\n", "a\nB\nc\n") == [1, -1, ["B\n"], 1]
+
+
+def test_chat_diff():
+    old = [entry("a"), entry("b")]
+    assert version_store.diff_chat(old, old + [entry("c")]) == {"base": 2, "append": [entry("c")]}
+    rewritten = [entry("a"), {**entry("b"), "text": "edited"}]
+    delta = version_store.diff_chat(old, rewritten)
+    assert delta["base"] == 1
+    assert version_store.apply_chat_diff(old, delta) == rewritten
+
+
+def build_chain(count):
+    records, versions = [], []
+    for number in range(1, count + 1):
+        v = version(number, [str(i) for i in range(number)], "".join(f"line {i}\n" for i in range(number)))
+        versions.append(v)
+        records = version_store.append_version(records, v)
+    return records, versions
+
+
+def test_restore_across_keyframe_boundaries(monkeypatch):
+    monkeypatch.setattr(version_store, "KEYFRAME_INTERVAL", 3)
+    records, versions = build_chain(8)
+    assert [(r["kind"], r["depth"]) for r in records] == [
+        ("keyframe", 0), ("delta", 1), ("delta", 2),
+        ("keyframe", 0), ("delta", 1), ("delta", 2),
+        ("keyframe", 0), ("delta", 1),
+    ]
+    for v in versions:
+        state = version_store.materialize(records, v["id"])
+        assert (state["chatHistory"], state["livingDocument"]) == (v["chatHistory"], v["livingDocument"])
+    assert version_store.materialize_all(records)[-1]["version_number"] == 8
+    assert version_store.materialize(records, "missing") is None
+
+
+def test_remove_version_keeps_children_decodable(monkeypatch):
+    monkeypatch.setattr(version_store, "KEYFRAME_INTERVAL", 3)
+    records, versions = build_chain(6)
+    # v4 is a keyframe that v5 and v6 depend on
+    rebuilt = version_store.remove_version(records, "v4")
+    states = version_store.materialize_all(rebuilt)
+    assert [s["id"] for s in states] == ["v1", "v2", "v3", "v5", "v6"]
+    assert states[-1]["livingDocument"] == versions[-1]["livingDocument"]
+    assert [e["id"] for e in states[3]["chatHistory"]] == [e["id"] for e in versions[4]["chatHistory"]]
+
+
+def test_rewritten_history_is_a_keyframe():
+    records = version_store.append_version([], version(1, ["a", "b"], "doc\n"))
+    records = version_store.append_version(records, version(2, ["x"], "doc\n"))
+    assert records[1]["kind"] == "keyframe"
+
+
+def test_legacy_records_read_as_keyframes():
+    legacy = version(1, ["a"], "old\n")
+    records = version_store.append_version([legacy], version(2, ["a", "b"], "old\nnew\n"))
+    assert records[1]["kind"] == "delta"
+    assert version_store.materialize(records, "v2")["livingDocument"] == "old\nnew\n"
+    assert [e["id"] for e in version_store.iter_stored_entries(records)] == ["a", "b"]
@@ -3,6 +3,9 @@ export interface ImageFile {
   type: string;
   size: number;
   base64: string;
+  // Set on entries loaded from the backend, which stores image bytes once under
+  // this hash and serves them from /api/attachments/{hash}
+  hash?: string;
 }
 
 export interface ModelOption {